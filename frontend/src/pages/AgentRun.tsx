@@ -8,7 +8,7 @@ import { Icon } from '@iconify/react';
 
 import { useApp } from '@/context/AppContext';
 import { api } from '@/utils/api';
-import type { ChatMessage, ExecutionMetrics } from '@/types/common';
+import type { AgentRunDelta, AgentRunState, ChatMessage, ExecutionMetrics } from '@/types/common';
 
 const { TextArea } = Input;
 
@@ -88,62 +88,116 @@ export function AgentRun() {
   const [browserScreenshot, setBrowserScreenshot] = useState<string | null>(null);
   const [taskId, setTaskId] = useState<string | null>(null);
   const pollingRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  const eventSourceRef = useRef<EventSource | null>(null);
+  const runStateRef = useRef<Partial<AgentRunState>>({});
   const chatEndRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
     chatEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [chatHistory]);
 
-  useEffect(() => {
-    return () => {
-      if (pollingRef.current) clearInterval(pollingRef.current);
-    };
+  const stopUpdates = useCallback(() => {
+    if (pollingRef.current) {
+      clearInterval(pollingRef.current);
+      pollingRef.current = null;
+    }
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
   }, []);
 
+  useEffect(() => stopUpdates, [stopUpdates]);
+
+  // 合并状态字段并刷新指标，返回任务是否已结束
+  const applyFields = useCallback((fields: Partial<AgentRunState>) => {
+    const d = { ...runStateRef.current, ...fields };
+    runStateRef.current = d;
+    const status = d.status ?? 'running';
+    setMetrics({
+      status,
+      currentStep: d.currentStep ?? 0,
+      maxSteps: d.maxSteps ?? 0,
+      totalDuration: d.totalDuration ?? 0,
+      avgStepDuration: d.avgStepDuration ?? 0,
+      promptTokens: d.promptTokens ?? 0,
+      completionTokens: d.completionTokens ?? 0,
+      totalTokens: d.totalTokens ?? 0,
+      systemRetries: d.systemRetries ?? 0,
+      businessRetries: d.businessRetries ?? 0,
+      totalRetries: d.totalRetries ?? 0,
+    });
+    setRunStatus(status as RunStatus);
+
+    const globalStatus = status === 'stopped' ? 'idle' : status as 'idle' | 'running' | 'paused' | 'completed' | 'error';
+    setGlobalTaskStatus(globalStatus);
+    return ['completed', 'stopped', 'error'].includes(status);
+  }, [setGlobalTaskStatus]);
+
+  const finishRun = useCallback(() => {
+    stopUpdates();
+    setCurrentTaskId(null);
+    refreshTaskList();
+  }, [stopUpdates, setCurrentTaskId, refreshTaskList]);
+
+  // 轮询兜底（浏览器不支持 EventSource 或推送连接失败时使用）
   const startPolling = useCallback((id: string) => {
-    if (pollingRef.current) clearInterval(pollingRef.current);
+    stopUpdates();
 
     const poll = async () => {
       try {
         const res = await api.getAgentRunStatus(id);
         if (res.code === 0 && res.data) {
-          const d = res.data;
-          setMetrics({
-            status: d.status,
-            currentStep: d.currentStep ?? 0,
-            maxSteps: d.maxSteps ?? 0,
-            totalDuration: d.totalDuration ?? 0,
-            avgStepDuration: d.avgStepDuration ?? 0,
-            promptTokens: d.promptTokens ?? 0,
-            completionTokens: d.completionTokens ?? 0,
-            totalTokens: d.totalTokens ?? 0,
-            systemRetries: d.systemRetries ?? 0,
-            businessRetries: d.businessRetries ?? 0,
-            totalRetries: d.totalRetries ?? 0,
-          });
-          setRunStatus(d.status as RunStatus);
-          
-          const globalStatus = d.status === 'stopped' ? 'idle' : d.status as 'idle' | 'running' | 'paused' | 'completed' | 'error';
-          setGlobalTaskStatus(globalStatus);
-
-          if (d.chatHistory) setChatHistory(d.chatHistory);
-          if (d.screenshot) setBrowserScreenshot(d.screenshot);
-
-          if (['completed', 'stopped', 'error'].includes(d.status)) {
-            if (pollingRef.current) {
-              clearInterval(pollingRef.current);
-              pollingRef.current = null;
-            }
-            setCurrentTaskId(null);
-            refreshTaskList();
-          }
+          const { chatHistory: history, screenshot, ...fields } = res.data;
+          const done = applyFields(fields);
+          if (history) setChatHistory(history);
+          if (screenshot) setBrowserScreenshot(screenshot);
+          if (done) finishRun();
         }
       } catch {}
     };
 
     poll();
     pollingRef.current = setInterval(poll, 1000);
-  }, [setCurrentTaskId, setGlobalTaskStatus, refreshTaskList]);
+  }, [stopUpdates, applyFields, finishRun]);
+
+  // 通过 SSE 接收首帧快照和后续增量
+  const startStreaming = useCallback((id: string) => {
+    stopUpdates();
+    if (typeof EventSource === 'undefined') {
+      startPolling(id);
+      return;
+    }
+
+    runStateRef.current = {};
+    let received = false;
+    const source = new EventSource(api.getAgentRunEventsUrl(id));
+    eventSourceRef.current = source;
+
+    source.addEventListener('snapshot', (e) => {
+      received = true;
+      const { chatHistory: history, screenshot, ...fields } = JSON.parse((e as MessageEvent).data) as AgentRunState;
+      applyFields(fields);
+      setChatHistory(history ?? []);
+      setBrowserScreenshot(screenshot ?? null);
+    });
+
+    source.addEventListener('delta', (e) => {
+      const delta = JSON.parse((e as MessageEvent).data) as AgentRunDelta;
+      if (delta.fields) applyFields(delta.fields);
+      if (delta.messages?.length) setChatHistory((prev) => [...prev, ...delta.messages!]);
+      if (delta.screenshot !== undefined) setBrowserScreenshot(delta.screenshot);
+    });
+
+    source.addEventListener('end', () => {
+      finishRun();
+    });
+
+    source.onerror = () => {
+      // 连接从未建立时回退到轮询；已建立的连接由 EventSource 自动重连
+      if (!received) startPolling(id);
+    };
+  }, [stopUpdates, startPolling, applyFields, finishRun]);
 
   const handleSubmit = async () => {
     const task = taskInput.trim();
@@ -165,7 +219,7 @@ export function AgentRun() {
         setCurrentTaskId(res.data.taskId);
         setTaskInput('');
         message.success('任务已提交');
-        startPolling(res.data.taskId);
+        startStreaming(res.data.taskId);
       } else {
         message.error(res.message || '任务提交失败');
         setRunStatus('error');
@@ -209,10 +263,7 @@ export function AgentRun() {
   };
 
   const handleClear = () => {
-    if (pollingRef.current) {
-      clearInterval(pollingRef.current);
-      pollingRef.current = null;
-    }
+    stopUpdates();
     setTaskInput('');
     setRunStatus('idle');
     setGlobalTaskStatus('idle');
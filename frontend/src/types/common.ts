@@ -144,10 +144,30 @@ export interface AgentRunState {
   systemRetries: number;
   businessRetries: number;
   totalRetries: number;
+  // 各阶段耗时统计（秒），键如 dom / screenshot / prompt / llm / llm_ttft / parse / action:click_element
+  phases?: Record<string, PhaseStats>;
+  // 按类别合计的阶段耗时（秒）
+  phaseBreakdown?: { browser: number; llm: number; agent: number };
   screenshot?: string;
   chatHistory: ChatMessage[];
 }
 
+export interface PhaseStats {
+  count: number;
+  total: number;
+  avg: number;
+  p50: number;
+  p95: number;
+  max: number;
+}
+
+// SSE 增量事件：只包含变化的字段、新增消息和变化后的截图
+export interface AgentRunDelta {
+  fields?: Partial<AgentRunState>;
+  messages?: ChatMessage[];
+  screenshot?: string | null;
+}
+
 // =============================================================================
 // API Response Types
 // =============================================================================
@@ -163,6 +183,8 @@ export interface PaginatedData<T> {
   total: number;
   page: number;
   pageSize: number;
+  // keyset分页游标，没有下一页时为 null
+  nextCursor?: string | null;
 }
 
 // =============================================================================
@@ -57,8 +57,11 @@ export const api = {
   // =============================================================================
 
   // 获取任务列表
-  getTasks(params: { page: number; pageSize: number }): Promise<ApiResponse<PaginatedData<Task>>> {
-    return request(`/tasks?page=${params.page}&pageSize=${params.pageSize}`);
+  getTasks(params: { page: number; pageSize: number; cursor?: string; status?: string }): Promise<ApiResponse<PaginatedData<Task>>> {
+    const query = new URLSearchParams({ page: String(params.page), pageSize: String(params.pageSize) });
+    if (params.cursor) query.set('cursor', params.cursor);
+    if (params.status) query.set('status', params.status);
+    return request(`/tasks?${query.toString()}`);
   },
 
   // 获取任务详情
@@ -88,6 +91,11 @@ export const api = {
     return request(`/agent/run/${taskId}/status`);
   },
 
+  // Agent运行状态推送地址（SSE）
+  getAgentRunEventsUrl(taskId: string): string {
+    return `${BASE_URL}/agent/run/${taskId}/events`;
+  },
+
   // 停止Agent运行
   stopAgentRun(taskId: string): Promise<ApiResponse<void>> {
     return request(`/agent/run/${taskId}/stop`, { method: 'POST' });
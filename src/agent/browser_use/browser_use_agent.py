@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
+from contextlib import ExitStack
 
 # from lmnr.sdk.decorators import observe
 from browser_use.agent.gif import create_history_gif
@@ -11,28 +12,79 @@ from browser_use.agent.views import (
     ActionResult,
     AgentHistory,
     AgentHistoryList,
+    AgentOutput,
     AgentStepInfo,
     ToolCallingMethod,
 )
 from browser_use.browser.views import BrowserStateHistory
 from browser_use.utils import time_execution_async
 from dotenv import load_dotenv
+from langchain_core.messages import BaseMessage
 from browser_use.agent.message_manager.utils import is_model_without_tool_support
-from src.utils.execution_monitor import ExecutionMonitor, ExecutionStatus
+from src.agent.browser_use.dom_diff import DomDiffMessageManager
+from src.agent.browser_use.message_compactor import MessageCompactor
+from src.agent.browser_use.run_control import RunControl
+from src.utils import telemetry
+from src.utils.budget import (
+    ACTION_COMPACT,
+    ACTION_DISABLE_VISION,
+    ACTION_DOWNGRADE,
+    BUDGET_HARD,
+    BudgetGovernor,
+    get_current_budget,
+    reset_current_budget,
+    set_current_budget,
+)
+from src.utils.execution_monitor import (
+    ExecutionMonitor,
+    ExecutionStatus,
+    get_current_token_usage,
+    reset_current_monitor,
+    set_current_monitor,
+)
+from src.utils.run_events import (
+    EVENT_PAUSED,
+    EVENT_RESUMED,
+    EVENT_STOPPED,
+    RunEvents,
+    get_current_run_events,
+)
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+SCREENSHOT_UNCHANGED_NOTE = "[Screenshot omitted: the page looks the same as in the previous screenshot]"
+
 SKIP_LLM_API_KEY_VERIFICATION = (
         os.environ.get("SKIP_LLM_API_KEY_VERIFICATION", "false").lower()[0] in "ty1"
 )
 
 
+def _has_image(message: BaseMessage) -> bool:
+    content = message.content
+    return isinstance(content, list) and any(
+        isinstance(part, dict) and part.get("type") == "image_url" for part in content
+    )
+
+
 class BrowserUseAgent(Agent):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # 初始化执行监控器
         self.execution_monitor: ExecutionMonitor | None = None
+        # 预算控制器（run 时取当前上下文的控制器，没有则按环境变量创建）
+        self.budget: BudgetGovernor | None = None
+        # 运行事件队列（run 时取当前上下文的队列）：暂停、恢复、停止时通知界面
+        self.run_events: RunEvents | None = None
+        # 暂停/恢复/停止信号：等待时挂起而不是轮询，停止时取消进行中的步骤
+        self.control = RunControl.from_env()
+        # 消息历史压缩（提示词超过Token目标时折叠较早的步骤）
+        self.message_compactor = MessageCompactor.from_env()
+        # 增量DOM提示词：同一页面上只发送相对基线的元素变化
+        if os.getenv("AGENT_DOM_DIFF", "false").lower() in ("true", "1", "yes"):
+            self._message_manager = DomDiffMessageManager.from_manager(self._message_manager)
+            if getattr(self, "memory", None) is not None:
+                self.memory.message_manager = self._message_manager
     
     def _set_tool_calling_method(self) -> ToolCallingMethod | None:
         tool_calling_method = self.settings.tool_calling_method
@@ -91,6 +143,174 @@ class BrowserUseAgent(Agent):
         else:
             return tool_calling_method
 
+    async def get_next_action(self, input_messages: list[BaseMessage]) -> AgentOutput:
+        """获取下一步动作；之前的间隔计为 prompt 阶段，除LLM调用外的耗时计为 parse 阶段"""
+        input_messages = self._prepare_screenshot(input_messages)
+        input_messages = self._compact_messages(input_messages)
+        if not self.execution_monitor:
+            return await super().get_next_action(input_messages)
+        self.execution_monitor.mark_prompt_start()
+        with self.execution_monitor.phase("parse"):
+            return await super().get_next_action(input_messages)
+
+    def _prepare_screenshot(self, input_messages: list[BaseMessage]) -> list[BaseMessage]:
+        """
+        当前状态的截图：外观与上次发给模型的相同、且那张截图仍在提示词中时不再发送，否则按实际编码修正 data URL 的类型
+
+        browser_use 每步结束后移除状态消息（连同截图），通常历史中没有之前的截图，此时总是发送
+        """
+        service = getattr(self.browser_context, "screenshot_service", None)
+        history = self._message_manager.state.history
+        if service is None or not input_messages or not history.messages:
+            return input_messages
+        entry = history.messages[-1]
+        if entry.message is not input_messages[-1] or not isinstance(entry.message.content, list):
+            return input_messages
+
+        previous_available = any(_has_image(managed.message) for managed in history.messages[:-1])
+        parts = []
+        for part in entry.message.content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                data = part["image_url"]["url"].split(",", 1)[-1]
+                if not service.should_send(data, previous_available=previous_available):
+                    logger.debug("Screenshot unchanged since the last one sent, omitting it")
+                    parts.append({"type": "text", "text": SCREENSHOT_UNCHANGED_NOTE})
+                    continue
+                url = f"data:{service.mime_type_of(data)};base64,{data}"
+                part = {**part, "image_url": {**part["image_url"], "url": url}}
+            parts.append(part)
+        message = entry.message.model_copy(update={"content": parts})
+        tokens = self._message_manager._count_tokens(message)
+        history.current_tokens += tokens - entry.metadata.tokens
+        entry.message = message
+        entry.metadata.tokens = tokens
+        return input_messages[:-1] + [message]
+
+    def _compact_messages(self, input_messages: list[BaseMessage]) -> list[BaseMessage]:
+        """提示词超过Token目标时压缩消息历史，并把压缩结果写回 MessageManager"""
+        if not self.message_compactor.enabled:
+            return input_messages
+        history = self._message_manager.state.history
+        # 规划器等插入了额外消息时输入与历史不一致，跳过本次压缩
+        if len(input_messages) != len(history.messages) or any(
+            a is not b.message for a, b in zip(input_messages, history.messages)
+        ):
+            return input_messages
+        target = min(self.message_compactor.target_tokens, self.settings.max_input_tokens)
+        result = self.message_compactor.compact(
+            input_messages, count_tokens=self._message_manager._count_tokens, target_tokens=target
+        )
+        if result is None:
+            return input_messages
+
+        from browser_use.agent.message_manager.views import ManagedMessage, MessageMetadata
+
+        # 未变化的消息沿用原条目
+        entries = {id(m.message): m for m in history.messages}
+        history.messages = [
+            entries.get(id(message))
+            or ManagedMessage(
+                message=message,
+                metadata=MessageMetadata(tokens=self._message_manager._count_tokens(message), message_type='compacted'),
+            )
+            for message in result.messages
+        ]
+        history.current_tokens = sum(m.metadata.tokens for m in history.messages)
+        if self.execution_monitor:
+            self.execution_monitor.record_compaction(result.before_tokens, result.after_tokens)
+        return result.messages
+
+    def _append_error_history(self, error_message: str):
+        """在历史中追加一条没有模型输出的错误记录（运行被熔断时使用）"""
+        self.state.history.history.append(
+            AgentHistory(
+                model_output=None,
+                result=[ActionResult(error=error_message, include_in_memory=True)],
+                state=BrowserStateHistory(
+                    url='',
+                    title='',
+                    tabs=[],
+                    interacted_element=[],
+                    screenshot=None,
+                ),
+                metadata=None,
+            )
+        )
+
+    def _check_budget(self) -> bool:
+        """
+        步骤开始前检查预算：越过软限制时执行一次降级动作
+
+        Returns:
+            False 表示已越过硬限制，运行应停止
+        """
+        budget = self.budget
+        if budget is None:
+            return True
+        if budget.check() == BUDGET_HARD:
+            error_message = (
+                f'Budget exceeded ({budget.reason}): tokens={budget.spend.tokens}, cost={budget.spend.cost:.4f}'
+            )
+            self._append_error_history(error_message)
+            logger.error(f'❌ {error_message}')
+            self.execution_monitor.finish(ExecutionStatus.BUDGET_EXCEEDED)
+            return False
+        for action in budget.take_soft_actions():
+            try:
+                self._apply_budget_action(action)
+            except Exception as e:
+                logger.error(f"Failed to apply budget action '{action}': {e}")
+        return True
+
+    def _apply_budget_action(self, action: str):
+        """执行预算软限制的降级动作"""
+        if action == ACTION_DISABLE_VISION:
+            self.settings.use_vision = False
+        elif action == ACTION_COMPACT:
+            # 降低消息历史的Token目标；未开启消息历史压缩时以该目标开启
+            target = int(os.getenv("BUDGET_COMPACT_MAX_INPUT_TOKENS", "32000"))
+            self.settings.max_input_tokens = min(self.settings.max_input_tokens, target)
+            self._message_manager.settings.max_input_tokens = self.settings.max_input_tokens
+            if not self.message_compactor.enabled:
+                self.message_compactor.target_tokens = target
+        elif action == ACTION_DOWNGRADE:
+            from src.utils.llm_provider import get_llm_model
+
+            provider, _, model_name = self.budget.downgrade_model.partition(":")
+            current = getattr(self.llm, 'wrapped_llm', None) or self.llm
+            kwargs = {"temperature": getattr(current, 'temperature', None) or 0.0}
+            if model_name:
+                kwargs["model_name"] = model_name
+            cheaper = get_llm_model(provider=provider, **kwargs)
+            if getattr(self.llm, 'wrapped_llm', None) is not None:
+                # 保留TokenTrackingLLM包装（已绑定的工具、Token记账、限流都继续生效）
+                self.llm.wrapped_llm = cheaper
+                self.llm.provider = provider
+            else:
+                self.llm = cheaper
+        logger.warning(f"💰 Budget soft limit reached ({self.budget.reason}), applied '{action}'")
+
+    def pause(self) -> None:
+        super().pause()
+        self.control.pause()
+        self._publish(EVENT_PAUSED)
+
+    def resume(self) -> None:
+        super().resume()
+        self.control.resume()
+        self._publish(EVENT_RESUMED)
+
+    def stop(self) -> None:
+        super().stop()
+        # 取消进行中的LLM请求与浏览器动作
+        self.control.stop()
+        self._publish(EVENT_STOPPED)
+
+    def _publish(self, kind: str):
+        # 暂停/停止通常由界面的事件处理函数调用，不在运行上下文中，直接使用 run 时取得的队列
+        if self.run_events is not None:
+            self.run_events.publish(kind)
+
     @time_execution_async("--run (agent)")
     async def run(
             self, max_steps: int = 100, on_step_start: AgentHookFunc | None = None,
@@ -99,9 +319,29 @@ class BrowserUseAgent(Agent):
         """Execute the task with maximum number of steps"""
 
         # 初始化执行监控器
+        labels = telemetry.run_labels(agent=type(self).__name__, llm=self.llm)
+        self.run_events = get_current_run_events()
         self.execution_monitor = ExecutionMonitor(
             max_steps=max_steps,
-            task_id=getattr(self.state, 'agent_id', None)
+            task_id=getattr(self.state, 'agent_id', None),
+            labels=labels,
+            # 共享运行级Token账户：包含Agent初始化（LLM连通性检查）时的Token
+            token_usage=get_current_token_usage(),
+            events=self.run_events,
+        )
+
+        # 让浏览器上下文、LLM包装器和控制器在本协程上下文中记录阶段耗时
+        monitor_token = set_current_monitor(self.execution_monitor)
+        # 预算控制器：调用方（API任务/WebUI运行上下文）可以预先设置带租户的控制器
+        self.budget = get_current_budget()
+        budget_token = None
+        if self.budget is None:
+            self.budget = BudgetGovernor.from_env()
+            budget_token = set_current_budget(self.budget)
+        # 根span：步骤、LLM调用、动作的span都挂在它下面
+        span_stack = ExitStack()
+        span_stack.enter_context(
+            telemetry.span("agent.run", {**labels, "task_id": self.execution_monitor.task_id, "max_steps": max_steps})
         )
 
         loop = asyncio.get_event_loop()
@@ -117,6 +357,8 @@ class BrowserUseAgent(Agent):
             exit_on_second_int=True,
         )
         signal_handler.register()
+        # 沿用调用方在运行前设置的状态（如复用 Agent 执行新任务前已清除的停止标记）
+        self.control.reset(paused=self.state.paused, stopped=self.state.stopped)
 
         try:
             self._log_agent_run()
@@ -127,23 +369,14 @@ class BrowserUseAgent(Agent):
                 self.state.last_result = result
 
             for step in range(max_steps):
+                # 检查预算熔断
+                if not self._check_budget():
+                    break
+
                 # 检查步数熔断
                 if not self.execution_monitor.start_step(f"step_{step}"):
                     error_message = f'Step limit exceeded: {step}/{max_steps}'
-                    self.state.history.history.append(
-                        AgentHistory(
-                            model_output=None,
-                            result=[ActionResult(error=error_message, include_in_memory=True)],
-                            state=BrowserStateHistory(
-                                url='',
-                                title='',
-                                tabs=[],
-                                interacted_element=[],
-                                screenshot=None,
-                            ),
-                            metadata=None,
-                        )
-                    )
+                    self._append_error_history(error_message)
                     logger.error(f'❌ {error_message}')
                     self.execution_monitor.finish(ExecutionStatus.STEP_LIMIT_EXCEEDED)
                     break
@@ -167,10 +400,13 @@ class BrowserUseAgent(Agent):
                     self.execution_monitor.finish(ExecutionStatus.CANCELLED)
                     break
 
-                while self.state.paused:
-                    await asyncio.sleep(0.2)  # Small delay to prevent CPU spinning
-                    if self.state.stopped:  # Allow stopping while paused
-                        break
+                # 暂停时挂起，恢复或停止时唤醒
+                await self.control.wait_if_paused()
+                if self.state.stopped:
+                    logger.info('Agent stopped while paused')
+                    self.execution_monitor.finish_step(success=False, error='Agent stopped')
+                    self.execution_monitor.finish(ExecutionStatus.CANCELLED)
+                    break
 
                 if on_step_start is not None:
                     await on_step_start(self)
@@ -181,10 +417,17 @@ class BrowserUseAgent(Agent):
                 failures_before = self.state.consecutive_failures
                 
                 try:
-                    await self.step(step_info)
+                    with telemetry.span("agent.step", {"step": step + 1}):
+                        # 停止时步骤被取消，不等本次LLM调用或浏览器动作完成
+                        await self.control.run(self.step(step_info))
                     # Token使用情况现在由TokenTrackingLLM自动记录
                     self.execution_monitor.finish_step(success=True)
                 except Exception as e:
+                    if self.control.stopped:
+                        logger.info('Agent stopped mid-step')
+                        self.execution_monitor.finish_step(success=False, error='Agent stopped')
+                        self.execution_monitor.finish(ExecutionStatus.CANCELLED)
+                        break
                     logger.error(f"Step {step} failed: {e}")
                     self.execution_monitor.finish_step(success=False, error=str(e))
                     # 记录系统级重试（步骤失败但会继续）
@@ -214,21 +457,7 @@ class BrowserUseAgent(Agent):
                     break
             else:
                 error_message = 'Failed to complete task in maximum steps'
-
-                self.state.history.history.append(
-                    AgentHistory(
-                        model_output=None,
-                        result=[ActionResult(error=error_message, include_in_memory=True)],
-                        state=BrowserStateHistory(
-                            url='',
-                            title='',
-                            tabs=[],
-                            interacted_element=[],
-                            screenshot=None,
-                        ),
-                        metadata=None,
-                    )
-                )
+                self._append_error_history(error_message)
 
                 logger.info(f'❌ {error_message}')
                 self.execution_monitor.finish(ExecutionStatus.FAILED)
@@ -243,6 +472,10 @@ class BrowserUseAgent(Agent):
         finally:
             # Unregister signal handlers before cleanup
             signal_handler.unregister()
+            span_stack.close()
+            reset_current_monitor(monitor_token)
+            if budget_token is not None:
+                reset_current_budget(budget_token)
 
             if self.settings.save_playwright_script_path:
                 logger.info(
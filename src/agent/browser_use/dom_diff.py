@@ -0,0 +1,233 @@
+"""
+增量DOM提示词 - DOM Diff
+browser_use 每一步都把当前页面的全部可交互元素写进提示词，哪怕上一步只是展开了一个下拉框。
+开启后同一页面上的后续步骤只发送相对基线的变化：新增、删除、内容变化的元素，以及未变化元素的索引重映射。
+
+- 基线：一次完整快照的元素列表。完整快照的状态消息在步骤结束后不删除，而是改写为只含元素列表的基线消息留在历史中
+- 元素身份：按 xpath 匹配（browser_use 的高亮索引每步重新编号，不能作为身份）
+- 回退完整快照：第一步、URL变化（导航）、基线消息已被历史压缩移除、增量文本超过完整列表的一定比例
+"""
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from browser_use.agent.message_manager.service import MessageManager
+from langchain_core.messages import BaseMessage, HumanMessage
+
+if TYPE_CHECKING:
+    from browser_use.agent.message_manager.views import ManagedMessage
+    from browser_use.agent.views import ActionResult, AgentStepInfo
+    from browser_use.browser.views import BrowserState
+
+logger = logging.getLogger(__name__)
+
+BASELINE_HEADER = "[Interactive elements baseline for {url} - later steps on this page list only the changes against it]"
+DIFF_HEADER = "[Changes against the interactive elements baseline above - elements not listed are unchanged]"
+
+# clickable_elements_to_string 的元素行："\t*[12]*<button ..." 或 "\t[12]<button ..."
+_ELEMENT_LINE = re.compile(r"^\t*\*?\[(\d+)\]\*?(?=<)")
+
+
+@dataclass
+class ElementSnapshot:
+    """一次状态的元素列表：身份 -> (高亮索引, 去掉索引的内容)"""
+    url: str
+    text: str
+    elements: Dict[str, Tuple[int, str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_state(cls, state: "BrowserState", include_attributes: Optional[List[str]] = None) -> "ElementSnapshot":
+        """
+        解析 browser_use 的元素列表文本；元素行后面的非交互文本行归入该元素
+        """
+        text = state.element_tree.clickable_elements_to_string(include_attributes=include_attributes)
+        snapshot = cls(url=state.url, text=text)
+        index_to_key: Dict[int, str] = {}
+        seen: Dict[str, int] = {}
+        for index, node in state.selector_map.items():
+            key = f"{node.tag_name}:{node.xpath}"
+            # 同一 xpath 出现多次（iframe / shadow root）时按出现顺序区分
+            seen[key] = seen.get(key, 0) + 1
+            index_to_key[index] = key if seen[key] == 1 else f"{key}#{seen[key]}"
+
+        blocks: Dict[str, Tuple[int, List[str]]] = {}
+        current: Optional[str] = None
+        for line in text.split("\n"):
+            match = _ELEMENT_LINE.match(line)
+            if match:
+                index = int(match.group(1))
+                current = index_to_key.get(index, f"index:{index}")
+                blocks[current] = (index, [line[match.end():].strip()])
+            elif current is not None:
+                blocks[current][1].append(line.strip())
+        snapshot.elements = {key: (index, "\n".join(block)) for key, (index, block) in blocks.items()}
+        return snapshot
+
+
+def _format_remap(pairs: List[Tuple[int, int]]) -> str:
+    """索引重映射，连续且偏移相同的合并为区间：3->5, 10..40->12..42"""
+    parts: List[str] = []
+    i = 0
+    while i < len(pairs):
+        j = i
+        while (
+            j + 1 < len(pairs)
+            and pairs[j + 1][0] == pairs[j][0] + 1
+            and pairs[j + 1][1] - pairs[j + 1][0] == pairs[i][1] - pairs[i][0]
+        ):
+            j += 1
+        if j == i:
+            parts.append(f"{pairs[i][0]}->{pairs[i][1]}")
+        else:
+            parts.append(f"{pairs[i][0]}..{pairs[j][0]}->{pairs[i][1]}..{pairs[j][1]}")
+        i = j + 1
+    return ", ".join(parts)
+
+
+def render_diff(baseline: ElementSnapshot, current: ElementSnapshot) -> str:
+    """生成相对基线的变化文本（索引均为当前步骤可用的索引）"""
+    remap: List[Tuple[int, int]] = []
+    changed: List[Tuple[int, str]] = []
+    for key, (index, content) in current.elements.items():
+        previous = baseline.elements.get(key)
+        if previous is None or previous[1] != content:
+            changed.append((index, content))
+        elif previous[0] != index:
+            remap.append((previous[0], index))
+    removed = sorted(index for key, (index, _) in baseline.elements.items() if key not in current.elements)
+
+    lines = [DIFF_HEADER]
+    if remap:
+        lines.append(f"Index remap (baseline -> current): {_format_remap(sorted(remap))}")
+    if removed:
+        lines.append(f"Removed (baseline index): {', '.join(str(i) for i in removed)}")
+    if changed:
+        lines.append("Added or changed:")
+        for index, content in sorted(changed):
+            lines.append(f"[{index}]{content}")
+    if len(lines) == 1:
+        lines.append("No element changes.")
+    return "\n".join(lines)
+
+
+class DomDiffMessageManager(MessageManager):
+    """
+    发送增量元素列表的 MessageManager
+    """
+
+    def __init__(self, *args, max_ratio: float = 0.6, **kwargs):
+        """
+        Args:
+            max_ratio: 增量文本超过完整元素列表的该比例时改为发送完整快照
+        """
+        super().__init__(*args, **kwargs)
+        self.max_ratio = max_ratio
+        self.full_snapshots = 0
+        self.diff_snapshots = 0
+        self._baseline: Optional[ElementSnapshot] = None
+        self._baseline_message: Optional[BaseMessage] = None
+        # 本步的完整快照，状态消息被移除时改写为新的基线
+        self._pending_baseline: Optional[ElementSnapshot] = None
+        # 本步状态消息在历史中的条目（消息本身可能被截图处理等替换）
+        self._state_entry: Optional["ManagedMessage"] = None
+
+    @classmethod
+    def from_manager(cls, manager: MessageManager, max_ratio: Optional[float] = None) -> "DomDiffMessageManager":
+        """接管已初始化的 MessageManager（沿用其设置与消息历史）"""
+        if max_ratio is None:
+            max_ratio = float(os.getenv("AGENT_DOM_DIFF_MAX_RATIO", "0.6"))
+        return cls(
+            task=manager.task,
+            system_message=manager.system_prompt,
+            settings=manager.settings,
+            state=manager.state,
+            max_ratio=max_ratio,
+        )
+
+    def add_state_message(
+        self,
+        state: "BrowserState",
+        result: Optional[List["ActionResult"]] = None,
+        step_info: Optional["AgentStepInfo"] = None,
+        use_vision=True,
+    ) -> None:
+        """添加状态消息；基线有效时把其中的完整元素列表替换为增量"""
+        super().add_state_message(state, result, step_info, use_vision)
+        self._state_entry = self.state.history.messages[-1]
+        self._pending_baseline = None
+        snapshot = ElementSnapshot.from_state(state, self.settings.include_attributes)
+        if not snapshot.text:
+            return
+
+        diff = self._diff(snapshot)
+        if diff is None:
+            self._pending_baseline = snapshot
+            self.full_snapshots += 1
+            return
+        replaced = self._replace_text(self._state_entry.message, snapshot.text, diff)
+        if replaced is None:
+            self._pending_baseline = snapshot
+            self.full_snapshots += 1
+            return
+        self._replace_last(replaced)
+        self.diff_snapshots += 1
+        logger.debug(f"DOM diff: {len(snapshot.text)} -> {len(diff)} chars ({len(snapshot.elements)} elements)")
+
+    def _diff(self, snapshot: ElementSnapshot) -> Optional[str]:
+        """需要完整快照时返回 None"""
+        baseline = self._baseline
+        if baseline is None or baseline.url != snapshot.url:
+            return None
+        # 基线消息被历史压缩移除后模型已看不到基线
+        if not any(m.message is self._baseline_message for m in self.state.history.messages):
+            return None
+        diff = render_diff(baseline, snapshot)
+        if len(diff) > len(snapshot.text) * self.max_ratio:
+            return None
+        return diff
+
+    def _remove_last_state_message(self) -> None:
+        """移除状态消息；本步是完整快照时改写为基线消息留在历史中"""
+        history = self.state.history
+        snapshot = self._pending_baseline
+        self._pending_baseline = None
+        if snapshot is None or not history.messages or history.messages[-1] is not self._state_entry:
+            super()._remove_last_state_message()
+            return
+        message = HumanMessage(content=f"{BASELINE_HEADER.format(url=snapshot.url)}\n{snapshot.text}")
+        if self.settings.sensitive_data:
+            message = self._filter_sensitive_data(message)
+        self._replace_last(message)
+        # 旧基线不再需要
+        for i, managed in enumerate(history.messages):
+            if managed.message is self._baseline_message:
+                history.current_tokens -= managed.metadata.tokens
+                history.messages.pop(i)
+                break
+        self._baseline = snapshot
+        self._baseline_message = message
+
+    def _replace_last(self, message: BaseMessage):
+        """替换历史中的最后一条消息并重新计算Token"""
+        managed = self.state.history.messages[-1]
+        tokens = self._count_tokens(message)
+        self.state.history.current_tokens += tokens - managed.metadata.tokens
+        managed.message = message
+        managed.metadata.tokens = tokens
+
+    @staticmethod
+    def _replace_text(message: BaseMessage, old: str, new: str) -> Optional[BaseMessage]:
+        """替换消息文本中的元素列表（带截图的消息只替换文本部分）；找不到时返回 None"""
+        content = message.content
+        if isinstance(content, str):
+            return message.model_copy(update={"content": content.replace(old, new, 1)}) if old in content else None
+        parts = []
+        found = False
+        for part in content:
+            if not found and isinstance(part, dict) and part.get("type") == "text" and old in part.get("text", ""):
+                part = {**part, "text": part["text"].replace(old, new, 1)}
+                found = True
+            parts.append(part)
+        return message.model_copy(update={"content": parts}) if found else None
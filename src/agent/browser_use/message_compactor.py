@@ -0,0 +1,265 @@
+"""
+消息历史压缩 - Message Compactor
+长任务中 browser_use 的消息历史随步数线性增长（每步的模型输出、动作结果、提取的页面内容），
+每次调用LLM都要重新发送全部历史。提示词超过Token目标时按以下顺序压缩，直到回到目标以内：
+
+1. 去掉历史中（当前状态之前）的截图
+2. 重复的页面内容只保留最近一次
+3. 除最近K步外的步骤折叠为滚动摘要（从模型输出和动作结果中抽取，不额外调用LLM）
+
+压缩以步骤为单位（模型输出的 tool_call 与其 ToolMessage 一起移除），不会拆开工具调用对
+"""
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+logger = logging.getLogger(__name__)
+
+# browser_use 初始化消息的最后一条，之后是任务历史
+HISTORY_START_MARKER = "[Your task history memory starts here]"
+SUMMARY_HEADER = "[Summary of earlier steps, compacted to save context]"
+DUPLICATE_PLACEHOLDER = "[Repeated page content omitted - same as a later message]"
+# 参与去重的最短内容长度（短的动作结果重复是正常的）
+DEDUPE_MIN_CHARS = 200
+
+
+def estimate_message_tokens(message: BaseMessage) -> int:
+    """与 browser_use MessageManager 相同口径的粗略估算：每3个字符1个Token，每张图片800个Token"""
+    content = message.content
+    if isinstance(content, list):
+        tokens = 0
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                tokens += 800
+            elif isinstance(part, dict):
+                tokens += len(str(part.get("text", ""))) // 3
+            else:
+                tokens += len(str(part)) // 3
+        return tokens
+    text = content + (str(message.tool_calls) if getattr(message, "tool_calls", None) else "")
+    return len(text) // 3
+
+
+@dataclass
+class CompactionResult:
+    """一次压缩的结果"""
+    messages: List[BaseMessage]
+    before_tokens: int
+    after_tokens: int
+    images_removed: int = 0
+    duplicates_removed: int = 0
+    steps_summarized: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.before_tokens - self.after_tokens)
+
+
+def _truncate(text: str, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _strip_images(message: BaseMessage) -> Optional[BaseMessage]:
+    """去掉消息中的图片，没有图片时返回 None"""
+    if not isinstance(message.content, list):
+        return None
+    parts = [p for p in message.content if not (isinstance(p, dict) and p.get("type") == "image_url")]
+    if len(parts) == len(message.content):
+        return None
+    text = "\n".join(str(p.get("text", "")) if isinstance(p, dict) else str(p) for p in parts)
+    return message.model_copy(update={"content": text or "[screenshot omitted]"})
+
+
+class MessageCompactor:
+    """
+    一个Agent运行的消息历史压缩器（保存滚动摘要的状态）
+    """
+
+    def __init__(self, target_tokens: int = 32000, keep_last_steps: int = 4, max_summary_tokens: int = 2000):
+        """
+        Args:
+            target_tokens: 提示词Token目标，超过时才压缩；0 表示不压缩
+            keep_last_steps: 保持原样的最近步数（压缩仍超目标时逐步减少，最少保留1步）
+            max_summary_tokens: 滚动摘要的Token上限，超过时丢弃最早的摘要行
+        """
+        self.target_tokens = target_tokens
+        self.keep_last_steps = max(1, keep_last_steps)
+        self.max_summary_tokens = max_summary_tokens
+        self.summary_lines: List[str] = []
+        self.summarized_steps = 0
+        self._summary_message: Optional[HumanMessage] = None
+
+    @classmethod
+    def from_env(cls) -> "MessageCompactor":
+        """
+        从环境变量读取配置
+
+        AGENT_COMPACT_TARGET_TOKENS / AGENT_COMPACT_KEEP_STEPS / AGENT_COMPACT_SUMMARY_TOKENS；
+        压缩会丢弃历史信息，目标默认为0（关闭），需要时显式设置
+        """
+        return cls(
+            target_tokens=int(os.getenv("AGENT_COMPACT_TARGET_TOKENS", "0")),
+            keep_last_steps=int(os.getenv("AGENT_COMPACT_KEEP_STEPS", "4")),
+            max_summary_tokens=int(os.getenv("AGENT_COMPACT_SUMMARY_TOKENS", "2000")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_tokens > 0
+
+    def compact(
+        self,
+        messages: List[BaseMessage],
+        count_tokens: Callable[[BaseMessage], int] = estimate_message_tokens,
+        target_tokens: Optional[int] = None,
+    ) -> Optional[CompactionResult]:
+        """
+        压缩消息列表
+
+        Args:
+            messages: 完整的消息列表（最后一条为当前浏览器状态）
+            count_tokens: 单条消息的Token计数函数
+            target_tokens: 本次使用的Token目标，默认 self.target_tokens
+
+        Returns:
+            未超过目标（或无可压缩内容）时返回 None
+        """
+        target = self.target_tokens if target_tokens is None else target_tokens
+        if target <= 0:
+            return None
+        tokens: Dict[int, int] = {}
+
+        def size(items: List[BaseMessage]) -> int:
+            total = 0
+            for m in items:
+                if id(m) not in tokens:
+                    tokens[id(m)] = count_tokens(m)
+                total += tokens[id(m)]
+            return total
+
+        before = size(messages)
+        if before <= target:
+            return None
+
+        prefix_end = self._history_start(messages)
+        tail = [messages[-1]] if len(messages) > prefix_end and isinstance(messages[-1], HumanMessage) else []
+        prefix = messages[:prefix_end]
+        body = [m for m in messages[prefix_end:len(messages) - len(tail)] if m is not self._summary_message]
+        result = CompactionResult(messages=messages, before_tokens=before, after_tokens=before)
+
+        def assemble() -> List[BaseMessage]:
+            summary = [self._summary_message] if self._summary_message is not None else []
+            return prefix + summary + body + tail
+
+        # 1. 历史中的截图
+        for i, message in enumerate(body):
+            stripped = _strip_images(message)
+            if stripped is not None:
+                body[i] = stripped
+                result.images_removed += 1
+        # 2. 重复的页面内容：保留最后一次出现
+        seen = set()
+        for i in range(len(body) - 1, -1, -1):
+            message = body[i]
+            if not isinstance(message, HumanMessage) or not isinstance(message.content, str):
+                continue
+            if len(message.content) < DEDUPE_MIN_CHARS:
+                continue
+            digest = hashlib.sha256(message.content.encode("utf-8")).hexdigest()
+            if digest in seen:
+                body[i] = message.model_copy(update={"content": DUPLICATE_PLACEHOLDER})
+                result.duplicates_removed += 1
+            else:
+                seen.add(digest)
+
+        # 3. 折叠较早的步骤
+        blocks = self._split_steps(body)
+        keep = self.keep_last_steps
+        while size(assemble()) > target and len(blocks) > 1 and keep >= 1:
+            fold = len(blocks) - keep
+            if fold > 0:
+                self._fold(blocks[:fold])
+                result.steps_summarized += fold
+                blocks = blocks[fold:]
+                body = [m for block in blocks for m in block]
+            keep -= 1
+
+        result.messages = assemble()
+        result.after_tokens = size(result.messages)
+        if result.after_tokens >= before:
+            return None
+        logger.info(
+            f"Compacted message history: {before} -> {result.after_tokens} tokens "
+            f"(images={result.images_removed}, duplicates={result.duplicates_removed}, "
+            f"steps summarized={result.steps_summarized}, keep={keep + 1})"
+        )
+        return result
+
+    @staticmethod
+    def _history_start(messages: List[BaseMessage]) -> int:
+        """任务历史开始的位置：browser_use 的标记消息之后；找不到标记时跳过开头的系统消息"""
+        for i, message in enumerate(messages):
+            if isinstance(message, HumanMessage) and message.content == HISTORY_START_MARKER:
+                return i + 1
+        return 1 if messages and isinstance(messages[0], SystemMessage) else 0
+
+    @staticmethod
+    def _split_steps(body: List[BaseMessage]) -> List[List[BaseMessage]]:
+        """按步骤切分：每步以模型输出后的 ToolMessage 结束，末尾未结束的部分单独成块"""
+        blocks: List[List[BaseMessage]] = []
+        current: List[BaseMessage] = []
+        for message in body:
+            current.append(message)
+            if isinstance(message, ToolMessage):
+                blocks.append(current)
+                current = []
+        if current:
+            blocks.append(current)
+        return blocks
+
+    def _fold(self, blocks: List[List[BaseMessage]]):
+        """把若干步骤抽取为摘要行并更新摘要消息"""
+        for block in blocks:
+            self.summarized_steps += 1
+            self.summary_lines.append(f"Step {self.summarized_steps}: {self._describe(block)}")
+        text = self._render()
+        while len(self.summary_lines) > 1 and estimate_message_tokens(HumanMessage(content=text)) > self.max_summary_tokens:
+            self.summary_lines.pop(0)
+            text = self._render()
+        self._summary_message = HumanMessage(content=text)
+
+    def _render(self) -> str:
+        omitted = self.summarized_steps - len(self.summary_lines)
+        lines = [SUMMARY_HEADER]
+        if omitted > 0:
+            lines.append(f"(steps 1-{omitted} omitted)")
+        return "\n".join(lines + self.summary_lines)
+
+    @staticmethod
+    def _describe(block: List[BaseMessage]) -> str:
+        """一步的摘要：目标、动作、结果"""
+        parts: List[str] = []
+        for message in block:
+            if isinstance(message, AIMessage) and message.tool_calls:
+                args: Dict[str, Any] = message.tool_calls[0].get("args") or {}
+                state = args.get("current_state") or {}
+                if state.get("next_goal"):
+                    parts.append(f"goal: {_truncate(state['next_goal'], 150)}")
+                actions = []
+                for action in args.get("action") or []:
+                    for name, params in (action or {}).items():
+                        actions.append(f"{name}({_truncate(json.dumps(params, ensure_ascii=False), 80)})")
+                if actions:
+                    parts.append("actions: " + ", ".join(actions))
+            elif isinstance(message, AIMessage) and message.content:
+                parts.append(f"plan: {_truncate(message.content, 150)}")
+            elif isinstance(message, HumanMessage) and isinstance(message.content, str):
+                if message.content != DUPLICATE_PLACEHOLDER:
+                    parts.append(_truncate(message.content, 200))
+        return " | ".join(parts) or "(no output)"
@@ -0,0 +1,116 @@
+"""
+运行控制 - Run Control
+BrowserUseAgent 的暂停、恢复与停止，基于 asyncio.Event，等待方挂起而不是每200ms轮询一次：
+
+- 暂停：下一步开始前挂起，直到恢复或停止
+- 停止：立即取消进行中的步骤（LLM请求、Playwright动作随之取消），不必等到本次LLM调用返回；
+  步骤在 stop_grace 秒内没有结束时不再等待，停止耗时有上界
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RunStoppedError(InterruptedError):
+    """进行中的操作因停止请求被取消"""
+
+
+class RunControl:
+    """
+    一个 Agent 的暂停/恢复/停止信号
+    """
+
+    def __init__(self, stop_grace: float = 2.0):
+        """
+        Args:
+            stop_grace: 停止时等待被取消的步骤完成清理的最长时间（秒）
+        """
+        self.stop_grace = stop_grace
+        # set 表示可以继续执行，clear 表示已暂停
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self._stop = asyncio.Event()
+        self.stop_requested_at: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "RunControl":
+        """从环境变量 AGENT_STOP_GRACE_SECONDS 读取停止等待时间"""
+        return cls(stop_grace=float(os.getenv("AGENT_STOP_GRACE_SECONDS", "2")))
+
+    @property
+    def paused(self) -> bool:
+        return not self._resume.is_set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def pause(self):
+        if not self.stopped:
+            self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    def stop(self):
+        """请求停止（同时解除暂停，避免停在等待中）"""
+        if not self.stopped:
+            self.stop_requested_at = time.monotonic()
+        self._stop.set()
+        self._resume.set()
+
+    def reset(self, paused: bool = False, stopped: bool = False):
+        """新一次运行开始前同步状态（Agent 可以在上次运行结束后继续执行新任务）"""
+        self._stop.clear()
+        self.stop_requested_at = None
+        self._resume.set()
+        if stopped:
+            self.stop()
+        elif paused:
+            self.pause()
+
+    async def wait_if_paused(self):
+        """暂停时挂起，直到恢复或停止"""
+        await self._resume.wait()
+
+    async def run(self, aw: Awaitable[T]) -> T:
+        """
+        执行一个可被停止取消的操作（如一个步骤）
+
+        Raises:
+            RunStoppedError: 执行期间收到停止请求
+        """
+        task = asyncio.ensure_future(aw)
+        if self.stopped:
+            task.cancel()
+        stop_wait = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait({task, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            stop_wait.cancel()
+
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task}, timeout=self.stop_grace)
+            if not task.done():
+                logger.warning(f"Step did not finish within {self.stop_grace}s after stop, no longer waiting for it")
+                task.add_done_callback(_discard_result)
+                raise RunStoppedError("Stopped while the step was still running")
+        if task.cancelled():
+            raise RunStoppedError("Step cancelled by stop request")
+        return task.result()
+
+
+def _discard_result(task: asyncio.Future):
+    # 被放弃的步骤结束时取走异常，避免 "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
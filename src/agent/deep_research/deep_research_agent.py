@@ -32,6 +32,7 @@ from pydantic import BaseModel, Field
 from browser_use.browser.context import BrowserContextConfig
 
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+from src.browser.browser_pool import BrowserLease, get_browser_pool
 from src.browser.custom_browser import CustomBrowser
 from src.controller.custom_controller import CustomController
 from src.utils.mcp_client import setup_mcp_client_and_tools
@@ -79,6 +80,9 @@ async def run_single_browser_task(
 
     bu_browser = None
     bu_browser_context = None
+    bu_browser_lease: Optional[BrowserLease] = None
+    bu_browser_pool = None
+    task_key = None
     try:
         logger.info(f"Starting browser task for query: {task_query}")
         extra_args = []
@@ -92,27 +96,43 @@ async def run_single_browser_task(
         else:
             browser_binary_path = None
 
-        bu_browser = CustomBrowser(
-            config=BrowserConfig(
-                headless=headless,
-                browser_binary_path=browser_binary_path,
-                extra_browser_args=extra_args,
-                wss_url=wss_url,
-                cdp_url=cdp_url,
-                new_context_config=BrowserContextConfig(
-                    window_width=window_w,
-                    window_height=window_h,
-                )
-            )
-        )
-
         context_config = BrowserContextConfig(
             save_downloads_path="./tmp/downloads",
             window_height=window_h,
             window_width=window_w,
             force_new_context=True,
         )
-        bu_browser_context = await bu_browser.new_context(config=context_config)
+
+        if not use_own_browser and not cdp_url and not wss_url:
+            # 内置Chromium：从共享浏览器池租用，多个并行查询复用预热的浏览器
+            bu_browser_pool = await get_browser_pool(
+                BrowserConfig(
+                    headless=headless,
+                    disable_security=disable_security,
+                    new_context_config=BrowserContextConfig(
+                        window_width=window_w,
+                        window_height=window_h,
+                    ),
+                )
+            )
+            bu_browser_lease = await bu_browser_pool.acquire(context_config)
+            bu_browser = bu_browser_lease.browser
+            bu_browser_context = bu_browser_lease.context
+        else:
+            bu_browser = CustomBrowser(
+                config=BrowserConfig(
+                    headless=headless,
+                    browser_binary_path=browser_binary_path,
+                    extra_browser_args=extra_args,
+                    wss_url=wss_url,
+                    cdp_url=cdp_url,
+                    new_context_config=BrowserContextConfig(
+                        window_width=window_w,
+                        window_height=window_h,
+                    )
+                )
+            )
+            bu_browser_context = await bu_browser.new_context(config=context_config)
 
         # Simple controller example, replace with your actual implementation if needed
         bu_controller = CustomController()
@@ -172,16 +192,24 @@ async def run_single_browser_task(
         logger.error(
             f"Error during browser task for query '{task_query}': {e}", exc_info=True
         )
+        if bu_browser_lease:
+            bu_browser_lease.mark_unhealthy()
         return {"query": task_query, "error": str(e), "status": "failed"}
     finally:
-        if bu_browser_context:
+        if bu_browser_lease:
+            try:
+                await bu_browser_pool.release(bu_browser_lease)
+                logger.info("Returned browser to pool.")
+            except Exception as e:
+                logger.error(f"Error returning browser to pool: {e}")
+        elif bu_browser_context:
             try:
                 await bu_browser_context.close()
                 bu_browser_context = None
                 logger.info("Closed browser context.")
             except Exception as e:
                 logger.error(f"Error closing browser context: {e}")
-        if bu_browser:
+        if bu_browser and not bu_browser_lease:
             try:
                 await bu_browser.close()
                 bu_browser = None
@@ -189,7 +217,7 @@ async def run_single_browser_task(
             except Exception as e:
                 logger.error(f"Error closing browser: {e}")
 
-        if task_key in _BROWSER_AGENT_INSTANCES:
+        if task_key and task_key in _BROWSER_AGENT_INSTANCES:
             del _BROWSER_AGENT_INSTANCES[task_key]
 
 
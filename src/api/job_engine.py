@@ -0,0 +1,330 @@
+"""
+Agent任务执行引擎 - Job Engine
+在uvicorn事件循环上调度Agent任务：有界worker池、租户级并发限制、饱和时背压
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EngineSaturatedError(Exception):
+    """引擎饱和：全局队列已满或租户并发已达上限"""
+
+    def __init__(self, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AgentJob:
+    """单个Agent任务"""
+    job_id: str
+    tenant_id: str
+    task: str
+    state: Dict[str, Any]
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stop_requested: bool = False
+    # set 表示可以继续执行，clear 表示已暂停
+    resume_event: asyncio.Event = field(default_factory=asyncio.Event)
+    # 收到停止请求时 set，用于让等待中的任务立即醒来
+    stop_event: asyncio.Event = field(default_factory=asyncio.Event)
+    control_hooks: List[Callable[[str], None]] = field(default_factory=list)
+    handle: Optional[asyncio.Task] = None
+    # 结束时的执行摘要（ExecutionMonitor.get_summary() 格式），由 runner 填写
+    summary: Optional[Dict[str, Any]] = None
+    # 状态版本号，每次 notify() 递增，供推送端判断是否有新变化
+    version: int = 0
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def __post_init__(self):
+        self.resume_event.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self.resume_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def notify(self):
+        """标记状态已变化，唤醒所有等待中的订阅者"""
+        self.version += 1
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, since_version: int, timeout: Optional[float] = None) -> bool:
+        """
+        等待状态版本超过 since_version
+
+        Args:
+            since_version: 订阅者已处理的版本号
+            timeout: 超时时间（秒），None 表示一直等待
+
+        Returns:
+            是否有新变化（超时返回 False）
+        """
+        if self.version != since_version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def add_control_hook(self, hook: Callable[[str], None]):
+        """
+        注册控制回调（pause/resume/stop），用于把控制信号转发给真实Agent
+
+        Args:
+            hook: 回调函数，参数为动作名 "pause" / "resume" / "stop"
+        """
+        self.control_hooks.append(hook)
+
+    def _fire(self, action: str):
+        for hook in self.control_hooks:
+            try:
+                hook(action)
+            except Exception as e:
+                logger.error(f"Job {self.job_id} control hook failed on {action}: {e}", exc_info=True)
+
+    def pause(self):
+        """暂停任务"""
+        self.resume_event.clear()
+        self._fire("pause")
+        self.notify()
+
+    def resume(self):
+        """恢复任务"""
+        self.resume_event.set()
+        self._fire("resume")
+        self.notify()
+
+    def stop(self):
+        """请求停止任务（同时解除暂停，避免停在等待中）"""
+        self.stop_requested = True
+        self.stop_event.set()
+        self.resume_event.set()
+        self._fire("stop")
+        self.notify()
+
+    async def wait_if_paused(self):
+        """暂停时挂起，直到恢复或停止，不占用CPU"""
+        await self.resume_event.wait()
+
+    async def sleep(self, seconds: float) -> bool:
+        """
+        等待指定时间，收到停止请求时立即返回
+
+        Returns:
+            是否因停止请求提前返回
+        """
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+JobRunner = Callable[[AgentJob], Awaitable[None]]
+JobCallback = Callable[[AgentJob], None]
+
+
+class AgentJobEngine:
+    """
+    Agent任务执行引擎
+
+    - 固定数量的worker协程从有界队列取任务，全部运行在当前事件循环上
+    - 每个租户的在途任务（排队+运行）数量受限
+    - 队列满或租户超限时 submit 抛出 EngineSaturatedError，由API转换为429
+    - 已结束的任务保留 finished_ttl 秒供查询状态，最多保留 max_finished 个，历史记录由任务存储持久化
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        max_workers: int = 64,
+        max_queue: int = 256,
+        max_per_tenant: int = 16,
+        on_finished: Optional[JobCallback] = None,
+        finished_ttl: float = 600.0,
+        max_finished: int = 1000,
+    ):
+        """
+        初始化执行引擎
+
+        Args:
+            runner: 执行单个任务的协程函数
+            max_workers: worker协程数量（同时运行的任务上限）
+            max_queue: 等待队列容量
+            max_per_tenant: 单租户在途任务上限
+            on_finished: 任务结束（完成/失败/取消）后的回调，例如写入任务历史
+            finished_ttl: 已结束任务在内存中保留的秒数
+            max_finished: 内存中最多保留的已结束任务数，超出时先移除最早结束的
+        """
+        self.runner = runner
+        self.on_finished = on_finished
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_per_tenant = max_per_tenant
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+
+        self.jobs: Dict[str, AgentJob] = {}
+        self._tenant_inflight: Dict[str, int] = {}
+        # 已结束任务按结束顺序排列：job_id -> finished_at
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running_count = 0
+
+    @classmethod
+    def from_env(cls, runner: JobRunner, on_finished: Optional[JobCallback] = None) -> "AgentJobEngine":
+        """从环境变量读取容量配置"""
+        return cls(
+            runner=runner,
+            on_finished=on_finished,
+            max_workers=int(os.getenv("AGENT_ENGINE_MAX_WORKERS", "64")),
+            max_queue=int(os.getenv("AGENT_ENGINE_MAX_QUEUE", "256")),
+            max_per_tenant=int(os.getenv("AGENT_ENGINE_MAX_PER_TENANT", "16")),
+            finished_ttl=float(os.getenv("AGENT_ENGINE_FINISHED_TTL_SECONDS", "600")),
+            max_finished=int(os.getenv("AGENT_ENGINE_MAX_FINISHED", "1000")),
+        )
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """启动worker协程（幂等）"""
+        if self.started:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"agent-job-worker-{i}")
+            for i in range(self.max_workers)
+        ]
+        logger.info(
+            f"AgentJobEngine started: workers={self.max_workers}, "
+            f"queue={self.max_queue}, per_tenant={self.max_per_tenant}"
+        )
+
+    async def shutdown(self):
+        """停止所有任务并关闭worker"""
+        for job in self.jobs.values():
+            if job.finished_at is None:
+                job.stop()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        logger.info("AgentJobEngine shut down")
+
+    def submit(self, job: AgentJob) -> AgentJob:
+        """
+        提交任务
+
+        Raises:
+            EngineSaturatedError: 租户超限或队列已满
+        """
+        if not self.started:
+            raise RuntimeError("AgentJobEngine is not started")
+        self._evict_finished()
+
+        inflight = self._tenant_inflight.get(job.tenant_id, 0)
+        if inflight >= self.max_per_tenant:
+            raise EngineSaturatedError(
+                f"Tenant '{job.tenant_id}' has {inflight} runs in flight (limit {self.max_per_tenant})"
+            )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise EngineSaturatedError(
+                f"Engine saturated: {self._running_count} running, {self._queue.qsize()} queued"
+            )
+
+        self._tenant_inflight[job.tenant_id] = inflight + 1
+        self.jobs[job.job_id] = job
+        logger.debug(f"Job {job.job_id} queued for tenant {job.tenant_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[AgentJob]:
+        self._evict_finished()
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """引擎负载统计"""
+        return {
+            "maxWorkers": self.max_workers,
+            "maxQueue": self.max_queue,
+            "maxPerTenant": self.max_per_tenant,
+            "running": self._running_count,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "tenants": dict(self._tenant_inflight),
+            "finished": len(self._finished),
+        }
+
+    def _evict_finished(self):
+        """移除超过保留时间或超出保留数量的已结束任务"""
+        deadline = time.time() - self.finished_ttl
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > deadline and len(self._finished) <= self.max_finished:
+                break
+            self._finished.popitem(last=False)
+            self.jobs.pop(job_id, None)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: AgentJob):
+        self._running_count += 1
+        job.started_at = time.time()
+        try:
+            if job.stop_requested:
+                return
+            job.handle = asyncio.create_task(self.runner(job), name=f"agent-job-{job.job_id}")
+            try:
+                await job.handle
+            except asyncio.CancelledError:
+                # worker自身被取消（shutdown）时继续向上抛出
+                if asyncio.current_task().cancelling():
+                    job.handle.cancel()
+                    raise
+                logger.info(f"Job {job.job_id} cancelled")
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+                job.state["status"] = "error"
+                job.state["error"] = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.handle = None
+            job.notify()
+            self._running_count -= 1
+            remaining = self._tenant_inflight[job.tenant_id] - 1
+            if remaining > 0:
+                self._tenant_inflight[job.tenant_id] = remaining
+            else:
+                del self._tenant_inflight[job.tenant_id]
+            self._finished[job.job_id] = job.finished_at
+            self._evict_finished()
+            if self.on_finished:
+                try:
+                    self.on_finished(job)
+                except Exception as e:
+                    logger.error(f"Job {job.job_id} on_finished callback failed: {e}", exc_info=True)
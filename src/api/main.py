@@ -1,22 +1,53 @@
 """
 FastAPI Backend API for Web UI
 """
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
+import logging
 import random
 import os
 import uuid
-import asyncio
-import threading
 import time
 import base64
 
-app = FastAPI(title="AI Browser Automation API", version="1.0.0")
+from src.api.job_engine import AgentJob, AgentJobEngine, EngineSaturatedError
+from src.api.run_stream import stream_run_events
+from src.api.task_store import SQLiteTaskStore, TaskStore
+from src.browser.live_view import (
+    MJPEG_MEDIA_TYPE,
+    get_live_view,
+    mjpeg_stream,
+    register_live_view,
+    unregister_live_view,
+)
+from src.utils import telemetry
+from src.utils.http_client_pool import close_all_http_clients, get_http_pool_stats
+from src.utils.metrics_rollup import MetricsRollup
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """应用生命周期：打开存储，启动/关闭Agent执行引擎"""
+    _init_storage()
+    await _job_engine.start()
+    yield
+    await _job_engine.shutdown()
+    if AGENT_RUN_MODE == "agent":
+        from src.browser.browser_pool import close_all_browser_pools
+        await close_all_browser_pools()
+    await close_all_http_clients()
+
+
+app = FastAPI(title="AI Browser Automation API", version="1.0.0", lifespan=_lifespan)
 
 # CORS配置
 app.add_middleware(
@@ -102,8 +133,9 @@ _agent_config = AgentConfig()
 _browser_config = BrowserConfig()
 _llm_config = LLMConfig()
 
-# 任务存储
-_tasks: List[Task] = []
+# 任务历史存储与运行指标汇总（分钟/小时/天桶），在应用启动时打开
+_task_store: Optional[TaskStore] = None
+_metrics_rollup: Optional[MetricsRollup] = None
 
 def _generate_mock_tasks():
     """生成模拟任务数据"""
@@ -133,7 +165,93 @@ def _generate_mock_tasks():
         tasks.append(task)
     return tasks
 
-_tasks = _generate_mock_tasks()
+def _init_storage():
+    """打开存储（幂等）；首次启动（空库）时写入演示数据，已结束的演示任务同时计入指标汇总"""
+    global _task_store, _metrics_rollup
+    if _task_store is not None:
+        return
+    _task_store = SQLiteTaskStore.from_env()
+    _metrics_rollup = MetricsRollup.from_env()
+    if _task_store.count() > 0:
+        return
+    for task in _generate_mock_tasks():
+        _task_store.upsert(task.model_dump())
+        if task.duration is not None:
+            _metrics_rollup.record_run(
+                {
+                    "status": "SUCCESS" if task.status == "completed" else "FAILED",
+                    "execution": {"total_duration": task.duration},
+                    "tokens": {"completion_tokens": task.tokenUsed or 0},
+                },
+                finished_at=datetime.strptime(task.startTime, "%Y-%m-%d %H:%M:%S").timestamp() + task.duration,
+            )
+
+# Agent运行状态 -> 任务历史状态
+_RUN_STATUS_TO_TASK_STATUS = {
+    "running": "running",
+    "paused": "running",
+    "completed": "completed",
+    "stopped": "cancelled",
+    "error": "failed",
+}
+
+# Agent运行状态 -> ExecutionStatus 值
+_RUN_STATUS_TO_EXECUTION_STATUS = {
+    "completed": "SUCCESS",
+    "stopped": "CANCELLED",
+    "error": "FAILED",
+}
+
+def _run_summary(job: AgentJob) -> Dict[str, Any]:
+    """运行摘要：优先使用 runner 提供的 ExecutionMonitor 摘要，否则由运行状态构造同格式摘要"""
+    if job.summary:
+        return job.summary
+    state = job.state
+    return {
+        "task_id": job.job_id,
+        "status": _RUN_STATUS_TO_EXECUTION_STATUS.get(state.get("status"), "FAILED"),
+        "execution": {
+            "current_step": state.get("currentStep", 0),
+            "max_steps": state.get("maxSteps", 0),
+            "total_duration": round(job.finished_at - (job.started_at or job.created_at), 2),
+            "start_time": datetime.fromtimestamp(job.started_at or job.created_at).isoformat(),
+            "end_time": datetime.fromtimestamp(job.finished_at).isoformat(),
+        },
+        "tokens": {
+            "prompt_tokens": state.get("promptTokens", 0),
+            "completion_tokens": state.get("completionTokens", 0),
+            "total_tokens": state.get("totalTokens", 0),
+        },
+        "retries": {
+            "system_retry_count": state.get("systemRetries", 0),
+            "business_retry_count": state.get("businessRetries", 0),
+            "total_retry_count": state.get("totalRetries", 0),
+        },
+    }
+
+def _record_agent_run(job: AgentJob):
+    """把Agent运行写入任务历史（提交时和结束时各调用一次），结束时计入指标汇总"""
+    state = job.state
+    status = _RUN_STATUS_TO_TASK_STATUS.get(state.get("status"), "failed")
+    if job.finished and status == "running":
+        status = "completed"
+    task = Task(
+        id=job.job_id,
+        name=job.task[:100],
+        status=status,
+        startTime=datetime.fromtimestamp(job.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+        endTime=datetime.fromtimestamp(job.finished_at).strftime("%Y-%m-%d %H:%M:%S") if job.finished else None,
+        duration=int(job.finished_at - (job.started_at or job.created_at)) if job.finished else None,
+        tokenUsed=state.get("totalTokens") or None,
+        error=state.get("error") if status == "failed" else None,
+    )
+    _task_store.upsert(task.model_dump())
+    if job.finished:
+        summary = _run_summary(job)
+        _metrics_rollup.record_run(summary, finished_at=job.finished_at)
+        if not job.summary:
+            # 真实Agent运行由 ExecutionMonitor 导出指标，这里只补上模拟运行
+            telemetry.observe_run({"agent": "mock"}, summary["status"], summary["execution"]["total_duration"])
 
 # =============================================================================
 # API路由
@@ -141,84 +259,110 @@ _tasks = _generate_mock_tasks()
 
 @app.get("/api/statistics", response_model=ApiResponse)
 async def get_statistics():
-    """获取统计数据"""
-    completed = len([t for t in _tasks if t.status == "completed"])
-    failed = len([t for t in _tasks if t.status == "failed"])
-    running = len([t for t in _tasks if t.status == "running"])
-    total_tokens = sum(t.tokenUsed or 0 for t in _tasks)
+    """获取统计数据（读取增量维护的计数，不扫描任务表）"""
+    counters = _task_store.counters()
+    total = counters.get("total", 0)
+    completed = counters.get("status:completed", 0)
     
     stats = Statistics(
-        totalTasks=len(_tasks),
+        totalTasks=total,
         completedTasks=completed,
-        failedTasks=failed,
-        runningTasks=running,
-        totalTokens=total_tokens,
-        successRate=round(completed / len(_tasks) * 100, 1) if _tasks else 0,
+        failedTasks=counters.get("status:failed", 0),
+        runningTasks=counters.get("status:running", 0),
+        totalTokens=counters.get("totalTokens", 0),
+        successRate=round(completed / total * 100, 1) if total else 0,
     )
     return ApiResponse(data=stats.model_dump())
 
 @app.get("/api/statistics/token-trend", response_model=ApiResponse)
 async def get_token_trend(days: int = 7):
-    """获取Token消耗趋势"""
-    trends = []
-    for i in range(days):
-        date = datetime.now() - timedelta(days=days - i - 1)
-        trends.append(TokenTrend(
-            date=date.strftime("%m-%d"),
-            tokens=random.randint(30000, 80000),
-        ))
+    """获取Token消耗趋势（读取天级汇总桶）"""
+    trends = [
+        TokenTrend(date=d["date"].strftime("%m-%d"), tokens=d["tokens"])
+        for d in _metrics_rollup.daily_tokens(days)
+    ]
     return ApiResponse(data={"trends": [t.model_dump() for t in trends]})
 
+# 耗时分布区间（秒）
+_DURATION_RANGES = [
+    ("0-30s", 0, 30),
+    ("30-60s", 30, 60),
+    ("1-5min", 60, 300),
+    ("5-10min", 300, 600),
+    (">10min", 600, None),
+]
+
 @app.get("/api/statistics/task-analysis", response_model=ApiResponse)
-async def get_task_analysis():
-    """获取任务分析数据"""
-    completed = len([t for t in _tasks if t.status == "completed"])
-    failed = len([t for t in _tasks if t.status == "failed"])
+async def get_task_analysis(days: int = 30):
+    """获取任务分析数据（耗时分布来自最近 days 天的汇总直方图）"""
+    completed = _task_store.count("completed")
+    failed = _task_store.count("failed")
+    durations = _metrics_rollup.aggregate(days).durations
     
     analysis = TaskAnalysis(
         successCount=completed,
         failedCount=failed,
         durationDistribution=[
-            DurationDistribution(range="0-30s", count=random.randint(50, 150)),
-            DurationDistribution(range="30-60s", count=random.randint(100, 200)),
-            DurationDistribution(range="1-5min", count=random.randint(80, 150)),
-            DurationDistribution(range="5-10min", count=random.randint(30, 80)),
-            DurationDistribution(range=">10min", count=random.randint(5, 30)),
+            DurationDistribution(range=label, count=durations.count_between(lower, upper))
+            for label, lower, upper in _DURATION_RANGES
         ],
     )
     return ApiResponse(data=analysis.model_dump())
 
 @app.get("/api/tasks", response_model=ApiResponse)
-async def get_tasks(page: int = 1, pageSize: int = 10):
-    """获取任务列表"""
-    start = (page - 1) * pageSize
-    end = start + pageSize
-    paginated_tasks = _tasks[start:end]
+async def get_tasks(
+    page: int = 1,
+    pageSize: int = 10,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """
+    获取任务列表（按开始时间倒序）
+
+    传入上一页返回的 nextCursor 使用keyset分页，深翻页代价不随页码增长；
+    不传时按 page 偏移分页
+    """
+    try:
+        tasks, next_cursor = _task_store.list_page(
+            limit=pageSize,
+            cursor=cursor,
+            offset=(page - 1) * pageSize,
+            status=status,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return ApiResponse(data={
-        "list": [t.model_dump() for t in paginated_tasks],
-        "total": len(_tasks),
+        "list": tasks,
+        "total": _task_store.count(status),
         "page": page,
         "pageSize": pageSize,
+        "nextCursor": next_cursor,
     })
 
 @app.get("/api/tasks/{task_id}", response_model=ApiResponse)
 async def get_task(task_id: str):
     """获取单个任务详情"""
-    task = next((t for t in _tasks if t.id == task_id), None)
+    task = _task_store.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return ApiResponse(data=task.model_dump())
+    return ApiResponse(data=task)
 
 @app.post("/api/tasks/{task_id}/stop", response_model=ApiResponse)
 async def stop_task(task_id: str):
     """停止任务"""
-    task = next((t for t in _tasks if t.id == task_id), None)
+    task = _task_store.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    if task.status != "running":
+    if task["status"] != "running":
         raise HTTPException(status_code=400, detail="Task is not running")
-    task.status = "cancelled"
+    job = _job_engine.get(task_id)
+    if job and not job.finished:
+        job.state["status"] = "stopped"
+        job.stop()
+    else:
+        task["status"] = "cancelled"
+        _task_store.upsert(task)
     return ApiResponse(message="Task stopped successfully")
 
 # =============================================================================
@@ -265,9 +409,6 @@ async def update_llm_config(config: LLMConfig):
 # Agent Run - 任务执行API
 # =============================================================================
 
-# Agent运行时状态存储
-_agent_runs: Dict[str, Dict[str, Any]] = {}
-
 def _generate_mock_screenshot(step: int, task: str) -> str:
     """生成模拟浏览器截图（SVG格式转Base64）"""
     try:
@@ -323,11 +464,10 @@ def _generate_mock_screenshot(step: int, task: str) -> str:
         print(f"Error generating screenshot: {e}")
         return ""
 
-def _simulate_agent_execution(task_id: str, task: str):
-    """模拟Agent执行过程（后台线程）"""
-    run_state = _agent_runs.get(task_id)
-    if not run_state:
-        return
+async def _simulate_agent_execution(job: AgentJob):
+    """模拟Agent执行过程（在事件循环上运行）"""
+    run_state = job.state
+    task = job.task
 
     max_steps = random.randint(5, 15)
     run_state["maxSteps"] = max_steps
@@ -352,21 +492,20 @@ def _simulate_agent_execution(task_id: str, task: str):
     ]
 
     for step in range(1, max_steps + 1):
-        # 检查停止/暂停信号
-        if run_state["status"] == "stopped":
+        # 暂停等待（事件驱动，不轮询）
+        await job.wait_if_paused()
+
+        # 检查停止信号
+        if job.stop_requested:
+            run_state["status"] = "stopped"
             run_state["chatHistory"].append({
                 "role": "system",
                 "content": "任务已被用户停止",
                 "timestamp": datetime.now().strftime("%H:%M:%S"),
             })
+            job.notify()
             return
 
-        # 暂停等待
-        while run_state["status"] == "paused":
-            time.sleep(0.5)
-            if run_state["status"] == "stopped":
-                return
-
         run_state["currentStep"] = step
         elapsed = time.time() - start_time
         run_state["totalDuration"] = round(elapsed, 2)
@@ -402,8 +541,10 @@ def _simulate_agent_execution(task_id: str, task: str):
         screenshot = _generate_mock_screenshot(step, run_state.get("task", ""))
         if screenshot:
             run_state["screenshot"] = screenshot
+        job.notify()
 
-        time.sleep(random.uniform(1.5, 3.0))
+        # 停止请求立即打断等待
+        await job.sleep(random.uniform(1.5, 3.0))
 
     # 执行完成
     elapsed = time.time() - start_time
@@ -414,10 +555,151 @@ def _simulate_agent_execution(task_id: str, task: str):
         "content": f"**任务完成**\n\n- 总步数: {max_steps}\n- 总耗时: {run_state['totalDuration']}秒\n- 总Token: {run_state['totalTokens']}\n- 任务: {task}",
         "timestamp": datetime.now().strftime("%H:%M:%S"),
     })
+    job.notify()
+
+
+async def _run_browser_use_agent(job: AgentJob):
+    """使用真实的BrowserUseAgent执行任务（与uvicorn共享事件循环）"""
+    # 延迟导入：mock模式下不需要浏览器与LLM依赖
+    from browser_use.browser.browser import BrowserConfig as BUBrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+    from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+    from src.browser.browser_pool import get_browser_pool
+    from src.controller.custom_controller import CustomController
+    from src.utils import llm_provider
+    from src.utils.budget import BudgetGovernor, set_current_budget
+    from src.utils.execution_monitor import ExecutionStatus, TokenUsage, set_current_token_usage
+    from src.utils.token_tracking_llm import TokenTrackingLLM
+
+    run_state = job.state
+    # 运行级Token账户：每个任务在自己的asyncio任务中执行，上下文互不影响；ExecutionMonitor 与之共享
+    set_current_token_usage(TokenUsage())
+    # 按租户计入每日预算
+    budget = BudgetGovernor.from_env(tenant_id=job.tenant_id)
+    set_current_budget(budget)
+    agent_config, browser_config, llm_config = _agent_config, _browser_config, _llm_config
+    run_state["maxSteps"] = agent_config.maxSteps
+
+    def token_usage_callback(prompt_tokens: int, completion_tokens: int):
+        run_state["promptTokens"] += prompt_tokens
+        run_state["completionTokens"] += completion_tokens
+        run_state["totalTokens"] = run_state["promptTokens"] + run_state["completionTokens"]
+        job.notify()
+
+    base_llm = llm_provider.get_llm_model(
+        provider=llm_config.provider,
+        model_name=llm_config.modelName,
+        temperature=llm_config.temperature,
+        base_url=llm_config.baseUrl,
+        api_key=llm_config.apiKey,
+    )
+    llm = TokenTrackingLLM(llm=base_llm, token_callback=token_usage_callback, provider=llm_config.provider)
+
+    pool = await get_browser_pool(
+        BUBrowserConfig(
+            headless=browser_config.headless,
+            disable_security=browser_config.disableSecurity,
+            new_context_config=BrowserContextConfig(
+                window_width=browser_config.windowWidth,
+                window_height=browser_config.windowHeight,
+            ),
+        )
+    )
+    async with pool.lease(
+        BrowserContextConfig(
+            window_width=browser_config.windowWidth,
+            window_height=browser_config.windowHeight,
+            save_recording_path=browser_config.saveRecordingPath,
+            trace_path=browser_config.saveTracePath,
+        )
+    ) as lease:
+        async def on_new_step(state, output, step_num: int):
+            monitor = agent.execution_monitor
+            run_state["currentStep"] = step_num - 1
+            if monitor:
+                snapshot = monitor.get_snapshot()
+                run_state["totalDuration"] = round(snapshot.total_duration, 2)
+                run_state["avgStepDuration"] = round(snapshot.average_step_duration, 2)
+                run_state["systemRetries"] = snapshot.system_retry_count
+                run_state["businessRetries"] = snapshot.business_retry_count
+                run_state["totalRetries"] = snapshot.total_retry_count
+                # 各阶段耗时（dom/screenshot/prompt/llm/parse/action:*）及 browser/llm/agent 分类合计
+                run_state["phases"] = monitor.get_phase_stats()
+                run_state["phaseBreakdown"] = monitor.get_phase_breakdown()
+            goal = output.current_state.next_goal if output and output.current_state else ""
+            run_state["chatHistory"].append({
+                "role": "assistant",
+                "content": f"**Step {step_num - 1}** - {goal}",
+                "timestamp": datetime.now().strftime("%H:%M:%S"),
+            })
+            if getattr(state, "screenshot", None):
+                run_state["screenshot"] = state.screenshot
+            job.notify()
+
+        agent = BrowserUseAgent(
+            task=job.task,
+            llm=llm,
+            browser=lease.browser,
+            browser_context=lease.context,
+            controller=CustomController(),
+            register_new_step_callback=on_new_step,
+            use_vision=agent_config.useVision,
+            max_actions_per_step=agent_config.maxActionsPerStep,
+            source="api",
+        )
+        job.add_control_hook(lambda action: getattr(agent, action)())
+
+        register_live_view(job.job_id, lease.context)
+        try:
+            history = await agent.run(max_steps=agent_config.maxSteps)
+        finally:
+            await unregister_live_view(job.job_id)
+        if agent.execution_monitor:
+            job.summary = {**agent.execution_monitor.get_summary(), "budget": budget.to_dict()}
+        budget_exceeded = agent.execution_monitor and agent.execution_monitor.status == ExecutionStatus.BUDGET_EXCEEDED
+
+        if job.stop_requested:
+            run_state["status"] = "stopped"
+        elif budget_exceeded:
+            run_state["status"] = "error"
+            run_state["error"] = f"Budget exceeded ({budget.reason})"
+        elif history.is_done():
+            run_state["status"] = "completed"
+        else:
+            run_state["status"] = "error"
+        final_result = history.final_result()
+        run_state["chatHistory"].append({
+            "role": "assistant",
+            "content": f"**任务结束**\n\n- 总步数: {run_state['currentStep']}\n- 总Token: {run_state['totalTokens']}\n- 结果: {final_result}",
+            "timestamp": datetime.now().strftime("%H:%M:%S"),
+        })
+        job.notify()
+
+
+# 执行模式: mock（模拟执行，默认）或 agent（真实BrowserUseAgent）
+AGENT_RUN_MODE = os.getenv("AGENT_RUN_MODE", "mock").lower()
+
+_job_engine = AgentJobEngine.from_env(
+    runner=_run_browser_use_agent if AGENT_RUN_MODE == "agent" else _simulate_agent_execution,
+    on_finished=_record_agent_run,
+)
+if AGENT_RUN_MODE == "agent":
+    # 每个运行独占一个池中浏览器：worker数不超过浏览器池上限，多出的任务留在引擎队列（queued）而不是卡在等浏览器
+    _job_engine.max_workers = min(_job_engine.max_workers, int(os.getenv("BROWSER_POOL_MAX_SIZE", "4")))
+
+
+def _get_job(task_id: str) -> AgentJob:
+    job = _job_engine.get(task_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Agent run not found")
+    return job
 
 
 @app.post("/api/agent/run", response_model=ApiResponse)
-async def start_agent_run(req: AgentRunRequest):
+async def start_agent_run(
+    req: AgentRunRequest,
+    tenant_id: str = Header(default="default", alias="X-Tenant-Id"),
+):
     """提交Agent执行任务"""
     task_id = str(uuid.uuid4())[:8]
 
@@ -449,13 +731,18 @@ async def start_agent_run(req: AgentRunRequest):
             },
         ],
     }
-    _agent_runs[task_id] = run_state
 
-    # 启动后台模拟线程
-    thread = threading.Thread(
-        target=_simulate_agent_execution, args=(task_id, req.task), daemon=True
-    )
-    thread.start()
+    await _job_engine.start()
+    try:
+        job = _job_engine.submit(AgentJob(job_id=task_id, tenant_id=tenant_id, task=req.task, state=run_state))
+    except EngineSaturatedError as e:
+        logger.warning(f"Rejecting agent run for tenant {tenant_id}: {e.reason}")
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    _record_agent_run(job)
 
     return ApiResponse(data={"taskId": task_id})
 
@@ -463,42 +750,79 @@ async def start_agent_run(req: AgentRunRequest):
 @app.get("/api/agent/run/{task_id}/status", response_model=ApiResponse)
 async def get_agent_run_status(task_id: str):
     """获取Agent执行状态"""
-    run_state = _agent_runs.get(task_id)
-    if not run_state:
-        raise HTTPException(status_code=404, detail="Agent run not found")
-    return ApiResponse(data=run_state)
+    return ApiResponse(data=_get_job(task_id).state)
+
+
+@app.get("/api/agent/run/{task_id}/events")
+async def stream_agent_run_events(task_id: str):
+    """以SSE推送Agent执行状态（首帧快照 + 增量）"""
+    job = _get_job(task_id)
+    return StreamingResponse(
+        stream_run_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/agent/run/{task_id}/live.mjpeg")
+async def stream_agent_run_live_view(task_id: str):
+    """以MJPEG推送运行中浏览器的实时画面（可直接作为 <img> 的 src）"""
+    _get_job(task_id)
+    view = get_live_view(task_id)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Live view not available")
+    return StreamingResponse(
+        mjpeg_stream(view),
+        media_type=MJPEG_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/api/agent/run/{task_id}/stop", response_model=ApiResponse)
 async def stop_agent_run(task_id: str):
     """停止Agent执行"""
-    run_state = _agent_runs.get(task_id)
-    if not run_state:
-        raise HTTPException(status_code=404, detail="Agent run not found")
-    run_state["status"] = "stopped"
+    job = _get_job(task_id)
+    job.state["status"] = "stopped"
+    job.stop()
     return ApiResponse(message="Stop signal sent")
 
 
 @app.post("/api/agent/run/{task_id}/pause", response_model=ApiResponse)
 async def pause_agent_run(task_id: str):
     """暂停Agent执行"""
-    run_state = _agent_runs.get(task_id)
-    if not run_state:
-        raise HTTPException(status_code=404, detail="Agent run not found")
-    run_state["status"] = "paused"
+    job = _get_job(task_id)
+    job.state["status"] = "paused"
+    job.pause()
     return ApiResponse(message="Pause signal sent")
 
 
 @app.post("/api/agent/run/{task_id}/resume", response_model=ApiResponse)
 async def resume_agent_run(task_id: str):
     """恢复Agent执行"""
-    run_state = _agent_runs.get(task_id)
-    if not run_state:
-        raise HTTPException(status_code=404, detail="Agent run not found")
-    run_state["status"] = "running"
+    job = _get_job(task_id)
+    job.state["status"] = "running"
+    job.resume()
     return ApiResponse(message="Resume signal sent")
 
 
+@app.get("/api/agent/engine/stats", response_model=ApiResponse)
+async def get_agent_engine_stats():
+    """获取执行引擎负载（含共享LLM连接池）"""
+    return ApiResponse(data={**_job_engine.stats(), "httpPools": get_http_pool_stats()})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus 指标（运行/步骤/阶段耗时直方图、Token消耗、引擎负载）"""
+    if not telemetry.metrics_enabled():
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    stats = _job_engine.stats()
+    telemetry.set_job_counts(stats["running"], stats["queued"])
+    telemetry.set_http_pool_stats(get_http_pool_stats())
+    content, content_type = telemetry.render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 # =============================================================================
 # 静态文件服务 (生产环境)
 # =============================================================================
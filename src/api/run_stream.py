@@ -0,0 +1,109 @@
+"""
+Agent运行状态推送 - Server-Sent Events
+首帧发送完整快照，之后只发送增量：新增聊天消息、变化的计数器、变化的截图
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+from src.api.job_engine import AgentJob
+
+logger = logging.getLogger(__name__)
+
+# 推送时不作为计数器比较的字段
+_NON_COUNTER_KEYS = {"chatHistory", "screenshot"}
+_MISSING = object()
+
+
+class RunStateDiffer:
+    """
+    为单个订阅者维护已发送的状态，计算增量
+
+    截图是较大的base64字符串，只比较其哈希（Python会缓存str的哈希值）
+    """
+
+    def __init__(self):
+        self._sent_fields: Dict[str, Any] = {}
+        self._sent_messages = 0
+        self._screenshot_hash: Optional[int] = None
+
+    def snapshot(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """生成完整快照，并以此作为后续增量的基线"""
+        self._sent_fields = {k: v for k, v in state.items() if k not in _NON_COUNTER_KEYS}
+        chat = state.get("chatHistory") or []
+        self._sent_messages = len(chat)
+        screenshot = state.get("screenshot")
+        self._screenshot_hash = hash(screenshot) if screenshot else None
+        return dict(state, chatHistory=list(chat))
+
+    def diff(self, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        计算相对上次发送的增量
+
+        Returns:
+            增量字典（无变化返回 None），可包含 fields / messages / screenshot
+        """
+        delta: Dict[str, Any] = {}
+
+        fields = {
+            k: v for k, v in state.items()
+            if k not in _NON_COUNTER_KEYS and self._sent_fields.get(k, _MISSING) != v
+        }
+        if fields:
+            delta["fields"] = fields
+            self._sent_fields.update(fields)
+
+        chat = state.get("chatHistory") or []
+        if len(chat) > self._sent_messages:
+            delta["messages"] = chat[self._sent_messages:]
+            self._sent_messages = len(chat)
+
+        screenshot = state.get("screenshot")
+        screenshot_hash = hash(screenshot) if screenshot else None
+        if screenshot_hash != self._screenshot_hash:
+            delta["screenshot"] = screenshot
+            self._screenshot_hash = screenshot_hash
+
+        return delta or None
+
+
+def _format_sse(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_run_events(job: AgentJob, heartbeat_interval: float = 15.0) -> AsyncIterator[str]:
+    """
+    生成某个任务的SSE事件流
+
+    事件类型:
+        snapshot: 首帧完整状态
+        delta: 增量更新
+        end: 任务结束（随后关闭连接）
+
+    Args:
+        job: 任务
+        heartbeat_interval: 无变化时发送心跳注释的间隔（秒）
+    """
+    differ = RunStateDiffer()
+    version = job.version
+    yield _format_sse("snapshot", differ.snapshot(job.state), version)
+
+    while not job.finished:
+        changed = await job.wait_for_change(version, timeout=heartbeat_interval)
+        if not changed:
+            yield ": keep-alive\n\n"
+            continue
+        version = job.version
+        delta = differ.diff(job.state)
+        if delta:
+            yield _format_sse("delta", delta, version)
+
+    delta = differ.diff(job.state)
+    if delta:
+        yield _format_sse("delta", delta, job.version)
+    yield _format_sse("end", {"status": job.state.get("status")}, job.version)
@@ -0,0 +1,221 @@
+"""
+任务历史存储 - Task Store
+持久化任务记录，提供按ID/状态/开始时间的索引查询、keyset分页和增量维护的聚合计数
+"""
+import base64
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TASK_FIELDS = ("id", "name", "status", "startTime", "endTime", "duration", "tokenUsed", "result", "error")
+
+# 聚合计数键：total、totalTokens，以及每个状态一个 "status:<status>"
+_TOTAL_KEY = "total"
+_TOKENS_KEY = "totalTokens"
+
+
+def encode_cursor(start_time: str, task_id: str) -> str:
+    """把分页位置 (startTime, id) 编码为不透明游标"""
+    raw = f"{start_time}\x00{task_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    解码分页游标
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        start_time, task_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("\x00", 1)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return start_time, task_id
+
+
+class TaskStore(ABC):
+    """
+    任务存储接口
+
+    任务记录为字典，字段见 TASK_FIELDS；列表按 startTime、id 倒序
+    """
+
+    @abstractmethod
+    def upsert(self, task: Dict[str, Any]):
+        """插入或更新任务，同时增量更新聚合计数"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """按ID获取任务"""
+
+    @abstractmethod
+    def list_page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        status: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        分页查询
+
+        Args:
+            limit: 每页数量
+            cursor: 上一页返回的游标（keyset分页，优先于 offset）
+            offset: 偏移量（仅在没有游标时使用）
+            status: 按状态过滤
+
+        Returns:
+            (任务列表, 下一页游标；没有下一页时为 None)
+        """
+
+    @abstractmethod
+    def counters(self) -> Dict[str, int]:
+        """聚合计数：total、totalTokens、status:<status>"""
+
+    def count(self, status: Optional[str] = None) -> int:
+        """任务总数（或某状态的任务数）"""
+        key = f"status:{status}" if status else _TOTAL_KEY
+        return self.counters().get(key, 0)
+
+    def close(self):
+        """释放资源"""
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    基于SQLite的任务存储
+
+    - WAL模式，读写互不阻塞
+    - 主键索引 id，复合索引 (startTime, id) 和 (status, startTime, id)
+    - 计数表在同一事务内随 upsert 增量更新，统计查询不扫描任务表
+    """
+
+    def __init__(self, db_path: str = "./tmp/tasks.db"):
+        """
+        初始化存储
+
+        Args:
+            db_path: 数据库文件路径，":memory:" 表示内存库
+        """
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    @classmethod
+    def from_env(cls) -> "SQLiteTaskStore":
+        """从环境变量 TASK_STORE_PATH 读取数据库路径"""
+        return cls(db_path=os.getenv("TASK_STORE_PATH", "./tmp/tasks.db"))
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    startTime TEXT NOT NULL,
+                    endTime TEXT,
+                    duration INTEGER,
+                    tokenUsed INTEGER,
+                    result TEXT,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_start ON tasks (startTime, id);
+                CREATE INDEX IF NOT EXISTS idx_tasks_status_start ON tasks (status, startTime, id);
+                CREATE TABLE IF NOT EXISTS task_counters (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                """
+            )
+
+    def _bump(self, key: str, delta: int):
+        if delta:
+            self._conn.execute(
+                "INSERT INTO task_counters (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, delta),
+            )
+
+    def upsert(self, task: Dict[str, Any]):
+        row = {k: task.get(k) for k in TASK_FIELDS}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute(
+                    "SELECT status, tokenUsed FROM tasks WHERE id = ?", (row["id"],)
+                ).fetchone()
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO tasks ({', '.join(TASK_FIELDS)}) "
+                    f"VALUES ({', '.join('?' * len(TASK_FIELDS))})",
+                    tuple(row[k] for k in TASK_FIELDS),
+                )
+                if old is None:
+                    self._bump(_TOTAL_KEY, 1)
+                else:
+                    self._bump(f"status:{old['status']}", -1)
+                self._bump(f"status:{row['status']}", 1)
+                self._bump(_TOKENS_KEY, (row["tokenUsed"] or 0) - ((old["tokenUsed"] or 0) if old else 0))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        status: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if cursor:
+            start_time, task_id = decode_cursor(cursor)
+            where.append("(startTime, id) < (?, ?)")
+            params.extend([start_time, task_id])
+            offset = 0
+
+        sql = "SELECT * FROM tasks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # 多取一条判断是否还有下一页
+        sql += " ORDER BY startTime DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([limit + 1, offset])
+
+        with self._lock:
+            rows = [dict(r) for r in self._conn.execute(sql, params).fetchall()]
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1]["startTime"], rows[-1]["id"])
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM task_counters").fetchall()
+        return {r["key"]: r["value"] for r in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,67 @@
+"""
+批量执行入口
+
+用法:
+    python -m src.batch tasks.jsonl --concurrency 8 --output results.jsonl
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+from browser_use.browser.browser import BrowserConfig
+from browser_use.browser.context import BrowserContextConfig
+
+from src.batch.runner import BatchRunner
+from src.utils import llm_provider
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run BrowserUseAgent tasks from a JSONL file concurrently")
+    parser.add_argument("tasks", type=str, help="JSONL file, one {\"id\": ..., \"task\": ...} per line")
+    parser.add_argument("--output", type=str, default=None, help="Result JSONL file (default: <tasks>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of tasks to run at once")
+    parser.add_argument("--max-steps", type=int, default=100, help="Default max steps per task")
+    parser.add_argument("--llm-provider", type=str, default=os.getenv("DEFAULT_LLM", "zkh"), help="LLM provider")
+    parser.add_argument("--llm-model", type=str, default=None, help="LLM model name")
+    parser.add_argument("--temperature", type=float, default=0.6, help="LLM temperature")
+    parser.add_argument("--base-url", type=str, default=None, help="LLM base URL")
+    parser.add_argument("--api-key", type=str, default=None, help="LLM API key")
+    parser.add_argument("--no-vision", action="store_true", help="Disable vision")
+    parser.add_argument("--headful", action="store_true", help="Show browser windows")
+    parser.add_argument("--window-w", type=int, default=1280, help="Browser window width")
+    parser.add_argument("--window-h", type=int, default=1100, help="Browser window height")
+    parser.add_argument("--no-resume", action="store_true", help="Re-run tasks already present in the output file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    llm_kwargs = {"temperature": args.temperature, "base_url": args.base_url, "api_key": args.api_key}
+    if args.llm_model:
+        llm_kwargs["model_name"] = args.llm_model
+    llm = llm_provider.get_llm_model(provider=args.llm_provider, **llm_kwargs)
+    browser_config = BrowserConfig(
+        headless=not args.headful,
+        new_context_config=BrowserContextConfig(
+            window_width=args.window_w,
+            window_height=args.window_h,
+        ),
+    )
+    runner = BatchRunner(
+        llm=llm,
+        browser_config=browser_config,
+        output_path=args.output or f"{os.path.splitext(args.tasks)[0]}.results.jsonl",
+        concurrency=args.concurrency,
+        max_steps=args.max_steps,
+        use_vision=not args.no_vision,
+        resume=not args.no_resume,
+    )
+    report = asyncio.run(runner.run(args.tasks))
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+批量任务执行器 - Batch Runner
+并发执行 JSONL 中的任务：共享浏览器池与LLM客户端，每完成一个任务立即追加写入结果，支持中断后续跑
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Set
+
+from src.browser.browser_pool import BrowserPool
+from src.utils.execution_monitor import TokenUsage, set_current_token_usage
+
+if TYPE_CHECKING:
+    from browser_use.browser.browser import BrowserConfig
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchTask:
+    """批量任务中的一项"""
+    task_id: str
+    task: str
+    max_steps: Optional[int] = None
+
+
+@dataclass
+class BatchReport:
+    """批量执行汇总"""
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    write_errors: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def tasks_per_min(self) -> float:
+        """吞吐量（本次实际执行的任务数/分钟，不含续跑跳过的任务）"""
+        done = self.completed + self.failed
+        return done / self.elapsed * 60 if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "write_errors": self.write_errors,
+            "elapsed": round(self.elapsed, 2),
+            "tasks_per_min": round(self.tasks_per_min, 2),
+        }
+
+
+def iter_tasks(tasks_path: str) -> Iterator[BatchTask]:
+    """
+    逐行读取任务文件（不一次性载入内存）
+
+    每行一个JSON对象: {"id": "...", "task": "...", "max_steps": 50}，id 缺省时使用行号
+    """
+    with open(tasks_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping invalid JSON at {tasks_path}:{line_no}: {e}")
+                continue
+            if not data.get("task"):
+                logger.error(f"Skipping line {line_no} without 'task' field")
+                continue
+            yield BatchTask(
+                task_id=str(data.get("id") or f"line-{line_no}"),
+                task=data["task"],
+                max_steps=data.get("max_steps"),
+            )
+
+
+def load_finished_ids(output_path: str) -> Set[str]:
+    """
+    读取已有结果文件中的任务ID，用于续跑
+
+    进程崩溃时最后一行可能只写了一半，解析失败的行直接忽略（该任务会重跑）
+    """
+    finished: Set[str] = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                finished.add(str(json.loads(line)["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return finished
+
+
+class BatchRunner:
+    """
+    批量执行器
+
+    - concurrency 个worker从有界队列取任务，队列边读文件边填充
+    - 所有任务共享一个浏览器池（每个任务独立上下文）和同一个LLM客户端
+    - 每个任务结束即追加一行结果并 fsync，崩溃后以同一输出文件重新运行即可续跑
+    """
+
+    def __init__(
+        self,
+        llm: "BaseChatModel",
+        browser_config: "BrowserConfig",
+        output_path: str,
+        concurrency: int = 4,
+        max_steps: int = 100,
+        use_vision: bool = True,
+        max_actions_per_step: int = 10,
+        resume: bool = True,
+        browser_factory: Optional[Callable[["BrowserConfig"], Any]] = None,
+    ):
+        """
+        初始化批量执行器
+
+        Args:
+            llm: 共享的LLM实例（各任务分别包装Token统计）
+            browser_config: 浏览器配置
+            output_path: 结果JSONL文件路径
+            concurrency: 同时执行的任务数（同时也是浏览器池上限）
+            max_steps: 任务未指定时的最大步数
+            use_vision: 是否使用视觉
+            max_actions_per_step: 每步最大动作数
+            resume: 是否跳过结果文件中已有的任务
+            browser_factory: 浏览器构造函数，默认创建 CustomBrowser
+        """
+        self.llm = llm
+        self.browser_config = browser_config
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.max_steps = max_steps
+        self.use_vision = use_vision
+        self.max_actions_per_step = max_actions_per_step
+        self.resume = resume
+        self.browser_factory = browser_factory
+
+        self.report = BatchReport()
+        self._write_lock = asyncio.Lock()
+
+    async def run(self, tasks_path: str) -> BatchReport:
+        """执行任务文件中的全部任务，返回汇总"""
+        finished_ids = load_finished_ids(self.output_path) if self.resume else set()
+        if finished_ids:
+            logger.info(f"Resuming: {len(finished_ids)} tasks already in {self.output_path}")
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        self._terminate_partial_line()
+        pool = BrowserPool(
+            browser_config=self.browser_config,
+            max_size=self.concurrency,
+            min_idle=self.concurrency,
+            browser_factory=self.browser_factory,
+        )
+        await pool.start()
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, pool), name=f"batch-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        self.report = BatchReport()
+        try:
+            for task in iter_tasks(tasks_path):
+                self.report.total += 1
+                if task.task_id in finished_ids:
+                    self.report.skipped += 1
+                    continue
+                await self._put(queue, task, workers)
+            for _ in workers:
+                await self._put(queue, None, workers)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await pool.close()
+            self.report.finished_at = time.time()
+
+        logger.info(f"Batch finished: {json.dumps(self.report.to_dict())}")
+        return self.report
+
+    async def _put(self, queue: asyncio.Queue, item: Optional[BatchTask], workers: List[asyncio.Task]):
+        """放入队列；所有worker都已退出时报错，而不是永远等待队列空位"""
+        put = asyncio.ensure_future(queue.put(item))
+        try:
+            while not put.done():
+                if all(worker.done() for worker in workers):
+                    raise RuntimeError("All batch workers exited, aborting batch")
+                await asyncio.wait({put, *workers}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            put.cancel()
+
+    async def _worker(self, queue: asyncio.Queue, pool: BrowserPool):
+        while True:
+            task = await queue.get()
+            if task is None:
+                return
+            try:
+                await self._process(task, pool)
+            except Exception as e:
+                # 单个任务的任何异常都不能让worker退出，否则队列再无消费者
+                logger.error(f"Batch task {task.task_id} could not be processed: {e}", exc_info=True)
+                self.report.failed += 1
+
+    async def _process(self, task: BatchTask, pool: BrowserPool):
+        # 每个任务在自己的上下文中执行：Token记到该任务的运行级账户，ExecutionMonitor 与之共享
+        run_context = contextvars.copy_context()
+        run_context.run(set_current_token_usage, TokenUsage())
+        result = await asyncio.create_task(self._run_task(task, pool), context=run_context)
+        try:
+            await self._write_result(result)
+        except Exception as e:
+            # 结果未落盘的任务计为失败，续跑时会重新执行
+            logger.error(f"Failed to write result of task {task.task_id}: {e}")
+            self.report.write_errors += 1
+            self.report.failed += 1
+            return
+
+        if result["status"] == "completed":
+            self.report.completed += 1
+        else:
+            self.report.failed += 1
+        done = self.report.completed + self.report.failed
+        logger.info(
+            f"Task {task.task_id} {result['status']} in {result['duration']}s "
+            f"({done} done, {self.report.tasks_per_min:.1f} tasks/min)"
+        )
+
+    async def _run_task(self, task: BatchTask, pool: BrowserPool) -> Dict[str, Any]:
+        from browser_use.browser.context import BrowserContextConfig
+        from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+        from src.controller.custom_controller import CustomController
+        from src.utils.token_tracking_llm import TokenTrackingLLM
+
+        started_at = time.time()
+        result: Dict[str, Any] = {"id": task.task_id, "task": task.task}
+        agent: Optional["BrowserUseAgent"] = None
+
+        context_config = BrowserContextConfig(
+            window_width=self.browser_config.new_context_config.window_width,
+            window_height=self.browser_config.new_context_config.window_height,
+        )
+        try:
+            async with pool.lease(context_config) as lease:
+                agent = BrowserUseAgent(
+                    task=task.task,
+                    llm=TokenTrackingLLM(llm=self.llm),
+                    browser=lease.browser,
+                    browser_context=lease.context,
+                    controller=CustomController(),
+                    use_vision=self.use_vision,
+                    max_actions_per_step=self.max_actions_per_step,
+                    source="batch",
+                )
+                history = await agent.run(max_steps=task.max_steps or self.max_steps)
+            succeeded = history.is_done() and history.is_successful() is not False
+            result["status"] = "completed" if succeeded else "failed"
+            result["final_result"] = history.final_result()
+            result["errors"] = [e for e in history.errors() if e]
+        except Exception as e:
+            logger.error(f"Batch task {task.task_id} failed: {e}", exc_info=True)
+            result["status"] = "error"
+            result["errors"] = [str(e)]
+
+        finished_at = time.time()
+        result["started_at"] = datetime.fromtimestamp(started_at).isoformat()
+        result["finished_at"] = datetime.fromtimestamp(finished_at).isoformat()
+        result["duration"] = round(finished_at - started_at, 2)
+        result["summary"] = agent.execution_monitor.get_summary() if agent and agent.execution_monitor else None
+        return result
+
+    def _terminate_partial_line(self):
+        """崩溃时写了一半的最后一行补上换行，避免与新追加的结果粘连"""
+        if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0:
+            return
+        with open(self.output_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    async def _write_result(self, result: Dict[str, Any]):
+        line = json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        async with self._write_lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
@@ -0,0 +1,371 @@
+"""
+浏览器池 - Browser Pool
+复用预热的 CustomBrowser 实例，每次租用创建独立的 BrowserContext，避免每个任务冷启动 Chromium
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from .custom_browser import CustomBrowser
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolTimeoutError(asyncio.TimeoutError):
+    """等待超过 acquire_timeout 仍没有可用浏览器"""
+
+
+def _default_browser_factory(config: "BrowserConfig") -> "CustomBrowser":
+    from .custom_browser import CustomBrowser
+    return CustomBrowser(config=config)
+
+
+@dataclass
+class PooledBrowser:
+    """池中的浏览器实例及其使用统计"""
+    browser: Any
+    created_at: float = field(default_factory=time.time)
+    last_used_at: float = field(default_factory=time.time)
+    uses: int = 0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+@dataclass
+class BrowserLease:
+    """一次浏览器租用：独占浏览器实例 + 本次新建的上下文"""
+    pooled: PooledBrowser
+    context: Any
+    leased_at: float = field(default_factory=time.time)
+    healthy: bool = True
+    # 租出该浏览器的池，归还时直接交回（池注册表可能已被清空或重建）
+    pool: Optional["BrowserPool"] = None
+
+    @property
+    def browser(self) -> Any:
+        return self.pooled.browser
+
+    def mark_unhealthy(self):
+        """标记浏览器异常，归还时直接回收"""
+        self.healthy = False
+
+
+class BrowserPoolGroup:
+    """
+    共享同一节点容量的浏览器池（不同启动参数各有一个池）
+
+    租用名额与浏览器总数在组内共享，总数不超过 max_size；名额被其他池的空闲浏览器占用时回收该浏览器
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.pools: List["BrowserPool"] = []
+        self.capacity = asyncio.Semaphore(max_size)
+        # 空闲浏览器入池或浏览器被回收时通知等待者
+        self.changed = asyncio.Condition()
+
+    @property
+    def size(self) -> int:
+        """组内所有池的浏览器数量（含预热中）"""
+        return sum(pool._size for pool in self.pools)
+
+    async def retire_idle(self, exclude: "BrowserPool") -> bool:
+        """回收其他池中的一个空闲浏览器，为 exclude 腾出名额"""
+        for pool in self.pools:
+            if pool is not exclude and pool._idle:
+                await pool._retire(pool._idle.pop(0))
+                return True
+        return False
+
+
+class BrowserPool:
+    """
+    浏览器池
+
+    - 预热: start() 时启动 min_idle 个浏览器
+    - 租用: acquire()/lease() 独占一个浏览器，并为本次租用新建上下文（cookie/存储互相隔离）
+    - 健康检查: 租出前和归还时检查 Playwright 连接
+    - 回收: 超过 max_uses 次使用或存活超过 max_age 秒的浏览器被关闭并补充
+    - 容量: 同时存在的浏览器数量不超过 max_size；传入 group 时与组内其他池合计
+    """
+
+    def __init__(
+        self,
+        browser_config: "BrowserConfig",
+        max_size: int = 4,
+        min_idle: int = 1,
+        max_uses: int = 50,
+        max_age: float = 1800.0,
+        acquire_timeout: Optional[float] = None,
+        browser_factory: Optional[Callable[["BrowserConfig"], Any]] = None,
+        group: Optional[BrowserPoolGroup] = None,
+    ):
+        """
+        初始化浏览器池
+
+        Args:
+            browser_config: 浏览器配置
+            max_size: 本节点最多同时存在的浏览器数量
+            min_idle: 预热并保持的空闲浏览器数量
+            max_uses: 单个浏览器最多租用次数
+            max_age: 单个浏览器最长存活时间（秒）
+            acquire_timeout: 租用等待超时（秒），None 表示一直等待
+            browser_factory: 浏览器构造函数，默认创建 CustomBrowser
+            group: 共享节点容量的池组，传入时 max_size 以组为准
+        """
+        self.group = group or BrowserPoolGroup(max_size)
+        self.group.pools.append(self)
+        max_size = self.group.max_size
+        self.browser_config = browser_config
+        self.max_size = max_size
+        self.min_idle = min(min_idle, max_size)
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.acquire_timeout = acquire_timeout
+        self._browser_factory = browser_factory or _default_browser_factory
+
+        self._idle: List[PooledBrowser] = []
+        self._leased: List[BrowserLease] = []
+        self._capacity = self.group.capacity
+        self._changed = self.group.changed
+        self._size = 0
+        self._warming = 0
+        self._closed = False
+        self._launch_count = 0
+        self._recycle_count = 0
+
+    @classmethod
+    def from_env(cls, browser_config: "BrowserConfig", group: Optional[BrowserPoolGroup] = None) -> "BrowserPool":
+        """从环境变量读取池参数"""
+        return cls(
+            group=group,
+            browser_config=browser_config,
+            max_size=int(os.getenv("BROWSER_POOL_MAX_SIZE", "4")),
+            min_idle=int(os.getenv("BROWSER_POOL_MIN_IDLE", "1")),
+            max_uses=int(os.getenv("BROWSER_POOL_MAX_USES", "50")),
+            max_age=float(os.getenv("BROWSER_POOL_MAX_AGE", "1800")),
+            acquire_timeout=float(os.getenv("BROWSER_POOL_ACQUIRE_TIMEOUT", "300")) or None,
+        )
+
+    async def start(self):
+        """预热 min_idle 个浏览器"""
+        await self._replenish()
+        logger.info(f"BrowserPool started: idle={len(self._idle)}, max_size={self.max_size}")
+
+    async def acquire(self, context_config: Optional["BrowserContextConfig"] = None) -> BrowserLease:
+        """
+        租用一个浏览器并新建上下文
+
+        Args:
+            context_config: 本次租用的上下文配置（录屏、trace、下载路径、窗口大小等）
+
+        Raises:
+            BrowserPoolTimeoutError: 超过 acquire_timeout 仍无可用浏览器
+        """
+        if self._closed:
+            raise RuntimeError("BrowserPool is closed")
+
+        try:
+            await asyncio.wait_for(self._capacity.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise BrowserPoolTimeoutError(
+                f"No browser available within {self.acquire_timeout}s (all {self.max_size} browsers in use)"
+            ) from None
+        try:
+            pooled = await self._take_idle()
+            while pooled is None and self.group.size >= self.max_size:
+                # 名额被其他池的空闲浏览器占用时回收它；否则剩余名额被正在预热的浏览器占用，等它入池
+                if not await self.group.retire_idle(exclude=self):
+                    async with self._changed:
+                        await self._changed.wait()
+                pooled = await self._take_idle()
+            if pooled is None:
+                pooled = await self._launch()
+            pooled.uses += 1
+            pooled.last_used_at = time.time()
+            context = await pooled.browser.new_context(config=context_config)
+        except BaseException:
+            self._capacity.release()
+            raise
+
+        lease = BrowserLease(pooled=pooled, context=context, pool=self)
+        self._leased.append(lease)
+        logger.debug(f"Browser leased: uses={pooled.uses}, age={pooled.age:.0f}s")
+        return lease
+
+    async def release(self, lease: BrowserLease):
+        """归还浏览器：关闭本次上下文，按健康状况和寿命决定放回或回收"""
+        if lease not in self._leased:
+            return
+        self._leased.remove(lease)
+        try:
+            try:
+                await lease.context.close()
+            except Exception as e:
+                logger.warning(f"Error closing leased browser context: {e}")
+                lease.mark_unhealthy()
+
+            pooled = lease.pooled
+            if self._closed or not lease.healthy or not self._is_healthy(pooled) or self._is_expired(pooled):
+                await self._retire(pooled)
+            else:
+                pooled.last_used_at = time.time()
+                await self._put_idle(pooled)
+        finally:
+            self._capacity.release()
+
+        if self._closed:
+            self._leave_group()
+        else:
+            await self._replenish()
+
+    @asynccontextmanager
+    async def lease(self, context_config: Optional["BrowserContextConfig"] = None) -> AsyncIterator[BrowserLease]:
+        """以上下文管理器方式租用浏览器，异常退出时回收该浏览器"""
+        lease = await self.acquire(context_config)
+        try:
+            yield lease
+        except Exception:
+            lease.mark_unhealthy()
+            raise
+        finally:
+            await self.release(lease)
+
+    async def close(self):
+        """关闭池中所有浏览器"""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await self._retire(pooled)
+        self._leave_group()
+        for lease in list(self._leased):
+            lease.mark_unhealthy()
+        logger.info("BrowserPool closed")
+
+    def stats(self) -> Dict[str, Any]:
+        """池状态统计"""
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "leased": len(self._leased),
+            "max_size": self.max_size,
+            "launched": self._launch_count,
+            "recycled": self._recycle_count,
+        }
+
+    def _leave_group(self):
+        """已关闭且浏览器全部回收后退出池组"""
+        if not self._size and self in self.group.pools:
+            self.group.pools.remove(self)
+
+    def _is_healthy(self, pooled: PooledBrowser) -> bool:
+        playwright_browser = getattr(pooled.browser, "playwright_browser", None)
+        if playwright_browser is None:
+            return False
+        try:
+            return playwright_browser.is_connected()
+        except Exception:
+            return False
+
+    def _is_expired(self, pooled: PooledBrowser) -> bool:
+        return pooled.uses >= self.max_uses or pooled.age >= self.max_age
+
+    async def _take_idle(self) -> Optional[PooledBrowser]:
+        while self._idle:
+            pooled = self._idle.pop()
+            if self._is_healthy(pooled) and not self._is_expired(pooled):
+                return pooled
+            await self._retire(pooled)
+        return None
+
+    async def _put_idle(self, pooled: PooledBrowser):
+        self._idle.append(pooled)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _launch(self) -> PooledBrowser:
+        browser = self._browser_factory(self.browser_config)
+        self._size += 1
+        try:
+            # 主动启动 Playwright 浏览器，而不是等到第一次创建页面时
+            await browser.get_playwright_browser()
+        except BaseException:
+            self._size -= 1
+            raise
+        self._launch_count += 1
+        logger.info(f"BrowserPool launched browser ({self._size}/{self.max_size})")
+        return PooledBrowser(browser=browser)
+
+    async def _retire(self, pooled: PooledBrowser):
+        self._size -= 1
+        self._recycle_count += 1
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled browser: {e}")
+        logger.debug(f"BrowserPool retired browser: uses={pooled.uses}, age={pooled.age:.0f}s")
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _replenish(self):
+        """补充空闲浏览器到 min_idle（不超过 max_size）"""
+        while (
+            not self._closed
+            and len(self._idle) + self._warming < self.min_idle
+            and self.group.size < self.max_size
+        ):
+            self._warming += 1
+            try:
+                pooled = await self._launch()
+            except Exception as e:
+                logger.error(f"BrowserPool failed to pre-warm browser: {e}", exc_info=True)
+                break
+            finally:
+                self._warming -= 1
+            if self._closed:
+                await self._retire(pooled)
+            else:
+                await self._put_idle(pooled)
+
+
+# 进程级浏览器池注册表，按启动参数区分；所有池共享一个节点容量
+_pools: Dict[str, BrowserPool] = {}
+_group: Optional[BrowserPoolGroup] = None
+
+
+def _pool_key(browser_config: "BrowserConfig") -> str:
+    """只取影响浏览器启动的参数，窗口大小等上下文配置由每次租用的 BrowserContextConfig 决定"""
+    return browser_config.model_dump_json(exclude={"new_context_config"})
+
+
+async def get_browser_pool(browser_config: "BrowserConfig") -> BrowserPool:
+    """获取（必要时创建并预热）与该浏览器启动参数对应的共享浏览器池"""
+    global _group
+    key = _pool_key(browser_config)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = BrowserPool.from_env(browser_config, group=_group)
+        _group = pool.group
+        _pools[key] = pool
+        await pool.start()
+    return pool
+
+
+async def close_all_browser_pools():
+    """关闭所有共享浏览器池"""
+    global _group
+    pools = list(_pools.values())
+    _pools.clear()
+    _group = None
+    for pool in pools:
+        await pool.close()
@@ -8,6 +8,11 @@ from playwright.async_api import Browser as PlaywrightBrowser
 from playwright.async_api import BrowserContext as PlaywrightBrowserContext
 from typing import Optional
 from browser_use.browser.context import BrowserContextState
+from browser_use.browser.views import BrowserState
+
+from src.utils.execution_monitor import monitor_phase
+
+from .screenshot_service import ScreenshotService
 
 logger = logging.getLogger(__name__)
 
@@ -20,3 +25,32 @@ class CustomBrowserContext(BrowserContext):
             state: Optional[BrowserContextState] = None,
     ):
         super(CustomBrowserContext, self).__init__(browser=browser, config=config, state=state)
+        # Agent 与 WebUI 共用的截图服务（缩放、压缩、帧缓存）
+        self.screenshot_service = ScreenshotService()
+
+    async def get_state(self, cache_clickable_elements_hashes: bool) -> BrowserState:
+        """获取浏览器状态（DOM提取），计入 dom 阶段；其中的截图单独计入 screenshot 阶段"""
+        with monitor_phase("dom"):
+            # 提取DOM时会重绘高亮标签，之前缓存的帧不能给模型用
+            self.screenshot_service.invalidate()
+            return await super().get_state(cache_clickable_elements_hashes)
+
+    async def take_screenshot(self, full_page: bool = False) -> str:
+        """截图（经截图服务缩放、压缩并按帧缓存），实际截图计入 screenshot 阶段"""
+        if full_page:
+            with monitor_phase("screenshot"):
+                return await super().take_screenshot(full_page)
+        shot = await self.screenshot_service.capture(self._grab_screenshot)
+        return shot.data
+
+    async def _grab_screenshot(self) -> bytes:
+        """截取当前页面；JPEG 由浏览器直接编码，其他格式截 PNG 后再转换"""
+        settings = self.screenshot_service.settings
+        with monitor_phase("screenshot"):
+            page = await self.get_agent_current_page()
+            await page.wait_for_load_state()
+            if settings.format == "jpeg":
+                return await page.screenshot(
+                    type="jpeg", quality=settings.quality, scale="css", animations="disabled", caret="initial"
+                )
+            return await page.screenshot(scale="css", animations="disabled", caret="initial")
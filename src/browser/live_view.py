@@ -0,0 +1,251 @@
+"""
+实时画面 - Live View
+基于 CDP Page.startScreencast 的浏览器实时画面，替代 WebUI 每100ms调用一次 take_screenshot 的轮询：
+
+- 浏览器只在画面变化时推送帧（JPEG），不再反复整页截图
+- 限制帧率：间隔内的多帧只保留最新一帧，间隔结束时补发，页面停止变化时仍能看到最终画面
+- 丢弃与上一帧内容相同的帧
+- 同一浏览器上下文只开一个 screencast，所有观看者共享；最后一个观看者离开后停止
+- 以 MJPEG（multipart/x-mixed-replace）二进制推送，<img> 直接显示，无需 base64 HTML
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MJPEG_BOUNDARY = "frame"
+MJPEG_MEDIA_TYPE = f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}"
+# 检查 Agent 是否切换了标签页的间隔（秒）
+PAGE_CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class LiveViewSettings:
+    """实时画面配置"""
+    max_fps: float = 5.0
+    quality: int = 60
+    max_width: int = 1280
+    max_height: int = 800
+
+    @classmethod
+    def from_env(cls) -> "LiveViewSettings":
+        """从环境变量读取配置：LIVE_VIEW_MAX_FPS / LIVE_VIEW_QUALITY / LIVE_VIEW_MAX_WIDTH / LIVE_VIEW_MAX_HEIGHT"""
+        return cls(
+            max_fps=float(os.getenv("LIVE_VIEW_MAX_FPS", "5")),
+            quality=int(os.getenv("LIVE_VIEW_QUALITY", "60")),
+            max_width=int(os.getenv("LIVE_VIEW_MAX_WIDTH", "1280")),
+            max_height=int(os.getenv("LIVE_VIEW_MAX_HEIGHT", "800")),
+        )
+
+
+@dataclass
+class Frame:
+    """一帧 JPEG 画面"""
+    data: bytes
+    seq: int
+    timestamp: float = field(default_factory=time.time)
+
+
+class LiveView:
+    """
+    一个浏览器上下文的实时画面（多个观看者共享一个 screencast）
+    """
+
+    def __init__(self, context: Any, settings: Optional[LiveViewSettings] = None):
+        """
+        Args:
+            context: 浏览器上下文，需提供 get_agent_current_page()（跟随 Agent 当前标签页）
+            settings: 实时画面配置，默认从环境变量读取
+        """
+        self.context = context
+        self.settings = settings or LiveViewSettings.from_env()
+        self.viewers = 0
+        self.latest: Optional[Frame] = None
+        self.frames_received = 0
+        self.frames_published = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self._page = None
+        self._cdp = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._new_frame = asyncio.Event()
+        self._pending: Optional[tuple] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_digest: Optional[bytes] = None
+        self._last_published_at = 0.0
+        self._seq = 0
+
+    async def frames(self) -> AsyncIterator[Frame]:
+        """
+        订阅画面：先给出最近一帧，之后每有新帧给出一次；处理较慢的观看者直接跳到最新帧
+        """
+        self.viewers += 1
+        try:
+            if self.viewers == 1:
+                await self.start()
+            seq = -1
+            while not self.closed:
+                frame = self.latest
+                if frame is not None and frame.seq != seq:
+                    seq = frame.seq
+                    yield frame
+                    continue
+                await self._new_frame.wait()
+        finally:
+            self.viewers -= 1
+            if self.viewers == 0 and not self.closed:
+                asyncio.get_running_loop().create_task(self.stop())
+
+    async def start(self):
+        """开始 screencast（已开始时忽略）"""
+        async with self._lock:
+            if self._cdp is not None or self.closed:
+                return
+            await self._attach(await self.context.get_agent_current_page())
+            self._watcher = asyncio.create_task(self._follow_page())
+
+    async def stop(self):
+        """停止 screencast（仍有观看者时忽略）"""
+        async with self._lock:
+            if self.viewers > 0 and not self.closed:
+                return
+            if self._watcher is not None:
+                self._watcher.cancel()
+                self._watcher = None
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            await self._detach()
+
+    async def close(self):
+        """关闭实时画面：结束所有观看者的订阅并停止 screencast"""
+        self.closed = True
+        self._new_frame.set()
+        await self.stop()
+
+    async def _attach(self, page):
+        cdp = await page.context.new_cdp_session(page)
+        cdp.on("Page.screencastFrame", lambda params: self._on_frame(cdp, params))
+        # 先记录会话：第一帧可能在 startScreencast 返回前到达
+        self._page, self._cdp = page, cdp
+        await cdp.send("Page.startScreencast", {
+            "format": "jpeg",
+            "quality": self.settings.quality,
+            "maxWidth": self.settings.max_width,
+            "maxHeight": self.settings.max_height,
+        })
+        logger.debug(f"Live view screencast started on {getattr(page, 'url', page)}")
+
+    async def _detach(self):
+        cdp, self._cdp, self._page = self._cdp, None, None
+        if cdp is None:
+            return
+        try:
+            await cdp.send("Page.stopScreencast")
+            await cdp.detach()
+        except Exception as e:
+            logger.debug(f"Failed to stop screencast: {e}")
+
+    async def _follow_page(self):
+        """Agent 切换标签页后把 screencast 转到新页面"""
+        while True:
+            await asyncio.sleep(PAGE_CHECK_INTERVAL)
+            try:
+                page = await self.context.get_agent_current_page()
+                if page is self._page:
+                    continue
+                async with self._lock:
+                    await self._detach()
+                    await self._attach(page)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Live view failed to follow page: {e}")
+
+    def _on_frame(self, cdp, params: Dict[str, Any]):
+        """收到一帧：立即确认（浏览器收到确认后才发下一帧），再去重、限流"""
+        asyncio.get_running_loop().create_task(self._ack(cdp, params["sessionId"]))
+        if cdp is not self._cdp:
+            return
+        self.frames_received += 1
+        data = params["data"]
+        digest = hashlib.blake2b(data.encode("ascii"), digest_size=16).digest()
+        if digest == self._last_digest and self._pending is None:
+            self.frames_dropped += 1
+            return
+        if self._pending is not None:
+            self.frames_dropped += 1
+        self._pending = (data, digest)
+
+        wait = self._last_published_at + 1.0 / self.settings.max_fps - time.monotonic()
+        if wait <= 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(wait, self._flush)
+
+    async def _ack(self, cdp, session_id: int):
+        try:
+            await cdp.send("Page.screencastFrameAck", {"sessionId": session_id})
+        except Exception as e:
+            logger.debug(f"Failed to ack screencast frame: {e}")
+
+    def _flush(self):
+        """发布等待中的最新一帧"""
+        self._flush_handle = None
+        if self._pending is None:
+            return
+        (data, digest), self._pending = self._pending, None
+        if digest == self._last_digest:
+            self.frames_dropped += 1
+            return
+        self._last_digest = digest
+        self._last_published_at = time.monotonic()
+        self._seq += 1
+        self.latest = Frame(data=base64.b64decode(data), seq=self._seq)
+        self.frames_published += 1
+        event, self._new_frame = self._new_frame, asyncio.Event()
+        event.set()
+
+
+async def mjpeg_stream(view: LiveView) -> AsyncIterator[bytes]:
+    """把实时画面编码为 MJPEG 分段（配合 MJPEG_MEDIA_TYPE 使用）"""
+    async for frame in view.frames():
+        yield (
+            f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame.data)}\r\n\r\n".encode("ascii")
+            + frame.data
+            + b"\r\n"
+        )
+
+
+# 当前可观看的实时画面（按运行ID）
+_live_views: Dict[str, LiveView] = {}
+
+
+def register_live_view(key: str, context: Any, settings: Optional[LiveViewSettings] = None) -> LiveView:
+    """为一个运行注册实时画面（同一上下文重复注册时返回已有的）"""
+    view = _live_views.get(key)
+    if view is not None and view.context is context and not view.closed:
+        return view
+    if view is not None:
+        asyncio.get_running_loop().create_task(view.close())
+    view = LiveView(context, settings)
+    _live_views[key] = view
+    return view
+
+
+def get_live_view(key: str) -> Optional[LiveView]:
+    return _live_views.get(key)
+
+
+async def unregister_live_view(key: str):
+    """运行结束时注销并关闭实时画面"""
+    view = _live_views.pop(key, None)
+    if view is not None:
+        await view.close()
@@ -0,0 +1,229 @@
+"""
+截图服务 - Screenshot Service
+CustomBrowserContext 的截图入口，供 Agent 的视觉步骤和 WebUI 的实时画面共用：
+
+- 缩放与压缩：限制最大尺寸，按 JPEG / WebP / PNG 与质量编码（JPEG 由浏览器直接编码）
+- 帧缓存：短时间内的多次请求共用一次截图，并发请求只截一次
+- 感知哈希（dHash）：页面外观与上次发给模型的截图相同、且该截图仍在提示词中时，Agent 可以不再发送图片（默认关闭）
+
+缩放与哈希依赖 Pillow（可选），未安装时只做浏览器侧编码，不做缩放和跳过
+"""
+import asyncio
+import base64
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+@dataclass
+class ScreenshotSettings:
+    """截图配置"""
+    max_width: int = 1280
+    max_height: int = 1280
+    format: str = "jpeg"
+    quality: int = 75
+    # 帧缓存有效期（秒），0 表示不缓存
+    cache_ttl: float = 0.1
+    # 默认关闭：browser_use 每步结束后移除状态消息（连同截图），跳过后模型可能看不到任何页面截图
+    skip_unchanged: bool = False
+    # 感知哈希的汉明距离不超过该值视为未变化
+    hash_distance: int = 2
+
+    @classmethod
+    def from_env(cls) -> "ScreenshotSettings":
+        """
+        从环境变量读取配置
+
+        SCREENSHOT_MAX_WIDTH / SCREENSHOT_MAX_HEIGHT / SCREENSHOT_FORMAT / SCREENSHOT_QUALITY /
+        SCREENSHOT_CACHE_MS / SCREENSHOT_SKIP_UNCHANGED / SCREENSHOT_HASH_DISTANCE
+        """
+        image_format = os.getenv("SCREENSHOT_FORMAT", "jpeg").lower()
+        if image_format not in MIME_TYPES:
+            logger.warning(f"Unknown SCREENSHOT_FORMAT '{image_format}', falling back to jpeg")
+            image_format = "jpeg"
+        return cls(
+            max_width=int(os.getenv("SCREENSHOT_MAX_WIDTH", "1280")),
+            max_height=int(os.getenv("SCREENSHOT_MAX_HEIGHT", "1280")),
+            format=image_format,
+            quality=int(os.getenv("SCREENSHOT_QUALITY", "75")),
+            cache_ttl=int(os.getenv("SCREENSHOT_CACHE_MS", "100")) / 1000,
+            skip_unchanged=os.getenv("SCREENSHOT_SKIP_UNCHANGED", "false").lower() in ("true", "1", "yes"),
+            hash_distance=int(os.getenv("SCREENSHOT_HASH_DISTANCE", "2")),
+        )
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+
+@dataclass
+class Screenshot:
+    """一次截图"""
+    data: str  # base64
+    mime_type: str
+    phash: Optional[int] = None
+    captured_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.data}"
+
+
+def encode_image(image: bytes, settings: ScreenshotSettings) -> Tuple[bytes, Optional[int]]:
+    """
+    按配置缩放与重新编码，同时计算感知哈希
+
+    Returns:
+        (编码后的图片, dHash)；未安装 Pillow 时原样返回，哈希为 None
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return image, None
+
+    with Image.open(io.BytesIO(image)) as img:
+        phash = perceptual_hash(img)
+        width, height = img.size
+        scale = min(1.0, settings.max_width / width if settings.max_width else 1.0,
+                    settings.max_height / height if settings.max_height else 1.0)
+        source_format = (img.format or "").lower()
+        if scale >= 1.0 and source_format == settings.format:
+            return image, phash
+        if scale < 1.0:
+            img = img.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+        if settings.format in ("jpeg", "webp") and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        if settings.format == "png":
+            img.save(out, format="PNG", optimize=True)
+        else:
+            img.save(out, format=settings.format.upper(), quality=settings.quality)
+        return out.getvalue(), phash
+
+
+def perceptual_hash(img) -> int:
+    """dHash：缩成 9x8 灰度图，比较相邻像素亮度，得到64位哈希"""
+    from PIL import Image
+
+    small = img.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class ScreenshotService:
+    """
+    一个浏览器上下文的截图服务
+    """
+
+    def __init__(self, settings: Optional[ScreenshotSettings] = None):
+        self.settings = settings or ScreenshotSettings.from_env()
+        self.captures = 0
+        self.cache_hits = 0
+        self.skipped = 0
+        self._last: Optional[Screenshot] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._sent_hash: Optional[int] = None
+
+    @property
+    def last(self) -> Optional[Screenshot]:
+        return self._last
+
+    def invalidate(self):
+        """页面即将变化（如重绘高亮标签）时丢弃缓存的帧"""
+        self._last = None
+
+    async def capture(self, grab: Callable[[], Awaitable[bytes]]) -> Screenshot:
+        """
+        获取一帧截图：缓存未过期时直接返回，已有截图进行中时等待同一次结果
+
+        Args:
+            grab: 实际截图的协程函数，返回浏览器编码的图片
+        """
+        last = self._last
+        if last is not None and time.monotonic() - last.captured_at <= self.settings.cache_ttl:
+            self.cache_hits += 1
+            return last
+        if self._inflight is not None:
+            self.cache_hits += 1
+            return await asyncio.shield(self._inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight = future
+        try:
+            image = await grab()
+            encoded, phash = await asyncio.to_thread(encode_image, image, self.settings)
+            shot = Screenshot(
+                data=base64.b64encode(encoded).decode("utf-8"),
+                mime_type=self.settings.mime_type if phash is not None or self.settings.format == "jpeg" else "image/png",
+                phash=phash,
+            )
+            self.captures += 1
+            self._last = shot
+            future.set_result(shot)
+            return shot
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight = None
+
+    def should_send(self, data: str, previous_available: bool = True) -> bool:
+        """
+        Agent 发送截图前调用：与上次发送给模型的截图外观相同时返回 False
+
+        Args:
+            data: 截图的 base64（通常是最近一次截图）
+            previous_available: 上次发送的截图是否仍在提示词中；不在时必须发送
+        """
+        if not self.settings.skip_unchanged:
+            return True
+        last = self._last
+        phash = last.phash if last is not None and last.data == data else self._hash(data)
+        if phash is None:
+            return True
+        if (
+            previous_available
+            and self._sent_hash is not None
+            and hamming_distance(phash, self._sent_hash) <= self.settings.hash_distance
+        ):
+            self.skipped += 1
+            return False
+        self._sent_hash = phash
+        return True
+
+    def mime_type_of(self, data: str) -> str:
+        """截图的MIME类型（用于修正 data URL）"""
+        last = self._last
+        if last is not None and last.data == data:
+            return last.mime_type
+        return self.settings.mime_type
+
+    @staticmethod
+    def _hash(data: str) -> Optional[int]:
+        try:
+            from PIL import Image
+        except ImportError:
+            return None
+        try:
+            with Image.open(io.BytesIO(base64.b64decode(data))) as img:
+                return perceptual_hash(img)
+        except Exception as e:
+            logger.debug(f"Failed to hash screenshot: {e}")
+            return None
@@ -27,6 +27,7 @@ import os
 from langchain_core.language_models.chat_models import BaseChatModel
 from browser_use.agent.views import ActionModel, ActionResult
 
+from src.utils.execution_monitor import monitor_phase
 from src.utils.mcp_client import create_tool_param_model, setup_mcp_client_and_tools
 from src.mcp_servers import ZKHEcommerceServer
 
@@ -259,21 +260,22 @@ class CustomController(Controller):
         try:
             for action_name, params in action.model_dump(exclude_unset=True).items():
                 if params is not None:
-                    if action_name.startswith("mcp"):
-                        # this is a mcp tool
-                        logger.debug(f"Invoke MCP tool: {action_name}")
-                        mcp_tool = self.registry.registry.actions.get(action_name).function
-                        result = await mcp_tool.ainvoke(params)
-                    else:
-                        result = await self.registry.execute_action(
-                            action_name,
-                            params,
-                            browser=browser_context,
-                            page_extraction_llm=page_extraction_llm,
-                            sensitive_data=sensitive_data,
-                            available_file_paths=available_file_paths,
-                            context=context,
-                        )
+                    with monitor_phase(f"action:{action_name}"):
+                        if action_name.startswith("mcp"):
+                            # this is a mcp tool
+                            logger.debug(f"Invoke MCP tool: {action_name}")
+                            mcp_tool = self.registry.registry.actions.get(action_name).function
+                            result = await mcp_tool.ainvoke(params)
+                        else:
+                            result = await self.registry.execute_action(
+                                action_name,
+                                params,
+                                browser=browser_context,
+                                page_extraction_llm=page_extraction_llm,
+                                sensitive_data=sensitive_data,
+                                available_file_paths=available_file_paths,
+                                context=context,
+                            )
 
                     if isinstance(result, str):
                         return ActionResult(extracted_content=result)
@@ -0,0 +1,200 @@
+"""
+产物存储 - Artifact Store
+按内容寻址（SHA-256）保存截图等二进制产物，界面通过URL引用，不再把 base64 内联进聊天记录。
+相同内容只保存一份；文件名即摘要，URL可以永久缓存。
+保留策略：超过 max_age 秒未再写入的产物、以及总大小超过 max_bytes 时最早的产物，在写入时按 sweep_interval 清理
+"""
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 文件头 -> 扩展名
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF8", "gif"),
+)
+MIME_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif", "bin": "application/octet-stream"}
+_NAME_PATTERN = re.compile(r"^([0-9a-f]{64})\.(" + "|".join(MIME_TYPES) + r")$")
+
+
+def sniff_extension(data: bytes) -> str:
+    """按文件头判断扩展名"""
+    for signature, ext in _SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "bin"
+
+
+@dataclass
+class Artifact:
+    """一个已保存的产物"""
+    digest: str
+    ext: str
+    path: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.digest}.{self.ext}"
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.ext]
+
+
+class ArtifactStore:
+    """
+    本地目录上的内容寻址存储（按摘要前两位分目录）
+    """
+
+    def __init__(
+        self,
+        root_dir: str = "./tmp/artifacts",
+        url_prefix: str = "/artifacts",
+        max_age: float = 0,
+        max_bytes: int = 0,
+        sweep_interval: float = 600.0,
+    ):
+        """
+        Args:
+            root_dir: 存储目录
+            url_prefix: 产物URL前缀（由 WebUI 服务的路由提供）
+            max_age: 产物最后一次写入后保留的秒数，0 表示不按时间清理
+            max_bytes: 存储目录总大小上限（字节），超出时删除最早的产物，0 表示不限制
+            sweep_interval: 写入时触发清理的最小间隔（秒）
+        """
+        self.root_dir = root_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self.removed_count = 0
+
+    @classmethod
+    def from_env(cls) -> "ArtifactStore":
+        """
+        从环境变量读取配置
+
+        ARTIFACT_STORE_DIR / ARTIFACT_STORE_MAX_AGE_SECONDS / ARTIFACT_STORE_MAX_BYTES
+        """
+        return cls(
+            root_dir=os.getenv("ARTIFACT_STORE_DIR", "./tmp/artifacts"),
+            max_age=float(os.getenv("ARTIFACT_STORE_MAX_AGE_SECONDS", "604800")),
+            max_bytes=int(os.getenv("ARTIFACT_STORE_MAX_BYTES", str(2 * 1024 ** 3))),
+        )
+
+    @property
+    def retention_enabled(self) -> bool:
+        return self.max_age > 0 or self.max_bytes > 0
+
+    def put(self, data: bytes, ext: Optional[str] = None) -> Artifact:
+        """
+        保存产物，内容已存在时直接返回
+
+        Args:
+            data: 产物内容
+            ext: 扩展名，默认按文件头判断
+        """
+        ext = ext or sniff_extension(data)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再改名，并发写入同一内容时不会读到半个文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        elif self.retention_enabled:
+            # 再次引用的产物刷新修改时间，按最后一次写入计算保留期
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        self._maybe_sweep()
+        return Artifact(digest=digest, ext=ext, path=path, size=len(data))
+
+    def put_base64(self, data: str, ext: Optional[str] = None) -> Artifact:
+        """保存 base64 编码的产物（如 BrowserState.screenshot）"""
+        return self.put(base64.b64decode(data), ext)
+
+    def url(self, artifact: Artifact) -> str:
+        return f"{self.url_prefix}/{artifact.name}"
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        按URL中的文件名找到产物路径；文件名不合法或不存在时返回 None
+        """
+        match = _NAME_PATTERN.match(name)
+        if not match:
+            return None
+        path = self._path(match.group(1), match.group(2))
+        return path if os.path.isfile(path) else None
+
+    def sweep(self) -> int:
+        """按保留策略删除产物（以及遗留的临时文件），返回删除的文件数"""
+        self._last_sweep = time.monotonic()
+        if not self.retention_enabled:
+            return 0
+        files: List[Tuple[float, int, str]] = []
+        for dirpath, _, names in os.walk(self.root_dir):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        removed = 0
+        total = sum(size for _, size, _ in files)
+        deadline = time.time() - self.max_age if self.max_age > 0 else None
+        for mtime, size, path in files:
+            expired = deadline is not None and mtime < deadline
+            oversize = self.max_bytes > 0 and total > self.max_bytes
+            if not expired and not oversize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            self.removed_count += removed
+            logger.info(f"Artifact store removed {removed} files, {total} bytes remaining")
+        return removed
+
+    def _maybe_sweep(self):
+        if self.retention_enabled and time.monotonic() - self._last_sweep >= self.sweep_interval:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Artifact store sweep failed: {e}")
+
+    def _path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root_dir, digest[:2], f"{digest}.{ext}")
+
+
+_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """获取进程共享的产物存储"""
+    global _store
+    if _store is None:
+        _store = ArtifactStore.from_env()
+    return _store
@@ -0,0 +1,316 @@
+"""
+Token预算 - Budget Governor
+按运行、租户（每天）和全局（每天）限制Token数与费用（按模型价格表折算）：
+越过软限制时触发一次降级动作（换用便宜模型、关闭视觉、压缩历史），越过硬限制时Agent在步骤之间停止运行（BUDGET_EXCEEDED）
+
+租户与全局的每日花费记在进程内（BudgetLedger），按本地日期自动清零，进程重启后从0开始
+"""
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils import telemetry
+
+logger = logging.getLogger(__name__)
+
+BUDGET_OK = "ok"
+BUDGET_SOFT = "soft"
+BUDGET_HARD = "hard"
+
+# 软限制触发的降级动作
+ACTION_DOWNGRADE = "downgrade"            # 换用 BUDGET_DOWNGRADE_MODEL
+ACTION_DISABLE_VISION = "disable_vision"  # 不再发送截图
+ACTION_COMPACT = "compact"                # 压缩消息历史
+SOFT_ACTIONS = (ACTION_DOWNGRADE, ACTION_DISABLE_VISION, ACTION_COMPACT)
+
+# 默认价格表（美元 / 百万Token：提示词, 输出），键为模型名或 provider:model，可用 LLM_PRICES 覆盖或补充
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "o3-mini": (1.1, 4.4),
+    "deepseek-chat": (0.27, 1.1),
+    "deepseek-reasoner": (0.55, 2.19),
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-7-sonnet-20250219": (3.0, 15.0),
+    "gemini-2.0-flash": (0.1, 0.4),
+}
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    解析价格配置
+
+    格式: "zkh:ep_20251217_i18v=0.8/2,gpt-4o=2.5/10"（每百万Token的提示词/输出价格）
+    """
+    prices: Dict[str, Tuple[float, float]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, values = item.rpartition("=")
+        prompt, _, completion = values.partition("/")
+        try:
+            prices[key.strip()] = (float(prompt), float(completion or prompt))
+        except ValueError:
+            logger.error(f"Invalid LLM_PRICES entry '{item}', expected [provider:]model=PROMPT/COMPLETION")
+    return prices
+
+
+@dataclass
+class Limit:
+    """一个维度的软/硬限制，None 表示不限"""
+    soft: Optional[float] = None
+    hard: Optional[float] = None
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> "Limit":
+        """解析 "软/硬" 或只有硬限制的 "硬"，如 "200000/400000"、"/1.5"、"400000" """
+        if not spec or not spec.strip():
+            return cls()
+        if "/" not in spec:
+            return cls(hard=float(spec))
+        soft, _, hard = spec.partition("/")
+        return cls(soft=float(soft) if soft.strip() else None, hard=float(hard) if hard.strip() else None)
+
+    def level(self, value: float) -> str:
+        if self.hard is not None and value >= self.hard:
+            return BUDGET_HARD
+        if self.soft is not None and value >= self.soft:
+            return BUDGET_SOFT
+        return BUDGET_OK
+
+
+@dataclass
+class BudgetLimits:
+    """一个范围（运行/租户/全局）的Token与费用限制"""
+    tokens: Limit = field(default_factory=Limit)
+    cost: Limit = field(default_factory=Limit)
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "BudgetLimits":
+        """读取 {prefix}_TOKENS 与 {prefix}_COST"""
+        return cls(tokens=Limit.parse(os.getenv(f"{prefix}_TOKENS")), cost=Limit.parse(os.getenv(f"{prefix}_COST")))
+
+    def check(self, spend: "Spend") -> Tuple[str, Optional[str]]:
+        """返回 (级别, 触发的维度)"""
+        worst, reason = BUDGET_OK, None
+        for name, limit, value in (("tokens", self.tokens, spend.tokens), ("cost", self.cost, spend.cost)):
+            level = limit.level(value)
+            if _RANK[level] > _RANK[worst]:
+                worst, reason = level, name
+        return worst, reason
+
+
+_RANK = {BUDGET_OK: 0, BUDGET_SOFT: 1, BUDGET_HARD: 2}
+
+
+@dataclass
+class Spend:
+    """累计花费"""
+    tokens: int = 0
+    cost: float = 0.0
+
+    def add(self, tokens: int, cost: float):
+        self.tokens += tokens
+        self.cost += cost
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"tokens": self.tokens, "cost": round(self.cost, 6)}
+
+
+class BudgetLedger:
+    """进程内按天累计的租户与全局花费"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = date.today()
+        self._tenants: Dict[str, Spend] = {}
+        self._total = Spend()
+
+    def _rollover(self):
+        today = date.today()
+        if today != self._day:
+            self._day, self._tenants, self._total = today, {}, Spend()
+
+    def add(self, tenant_id: str, tokens: int, cost: float):
+        with self._lock:
+            self._rollover()
+            self._tenants.setdefault(tenant_id, Spend()).add(tokens, cost)
+            self._total.add(tokens, cost)
+
+    def spend(self, tenant_id: str) -> Tuple[Spend, Spend]:
+        """今日的 (租户花费, 全局花费) 副本"""
+        with self._lock:
+            self._rollover()
+            tenant = self._tenants.get(tenant_id, Spend())
+            return Spend(tenant.tokens, tenant.cost), Spend(self._total.tokens, self._total.cost)
+
+
+_ledger = BudgetLedger()
+
+
+def get_budget_ledger() -> BudgetLedger:
+    """获取进程共享的每日花费账本"""
+    return _ledger
+
+
+class BudgetGovernor:
+    """
+    一次运行的预算控制器
+
+    TokenTrackingLLM 把每次调用的Token按价格表折算后记到当前上下文的控制器（见 set_current_budget），
+    Agent 在每个步骤开始前调用 check()：软限制时执行 take_soft_actions() 返回的降级动作，硬限制时停止运行
+    """
+
+    def __init__(
+        self,
+        run_limits: Optional[BudgetLimits] = None,
+        tenant_limits: Optional[BudgetLimits] = None,
+        daily_limits: Optional[BudgetLimits] = None,
+        tenant_id: str = "default",
+        prices: Optional[Dict[str, Tuple[float, float]]] = None,
+        soft_actions: Tuple[str, ...] = SOFT_ACTIONS,
+        downgrade_model: Optional[str] = None,
+        ledger: Optional[BudgetLedger] = None,
+    ):
+        """
+        Args:
+            run_limits: 单次运行的限制
+            tenant_limits: 租户每天的限制
+            daily_limits: 全局每天的限制
+            tenant_id: 租户ID
+            prices: 价格表（美元 / 百万Token），默认 DEFAULT_PRICES
+            soft_actions: 越过软限制时依次执行的降级动作
+            downgrade_model: 降级使用的模型 "provider:model"，未设置时跳过 downgrade 动作
+            ledger: 每日花费账本，默认进程共享
+        """
+        self.run_limits = run_limits or BudgetLimits()
+        self.tenant_limits = tenant_limits or BudgetLimits()
+        self.daily_limits = daily_limits or BudgetLimits()
+        self.tenant_id = tenant_id
+        self.prices = prices if prices is not None else dict(DEFAULT_PRICES)
+        self.soft_actions = tuple(a for a in soft_actions if a != ACTION_DOWNGRADE or downgrade_model)
+        self.downgrade_model = downgrade_model
+        self.ledger = ledger or _ledger
+        self.spend = Spend()
+        self.level = BUDGET_OK
+        self.reason: Optional[str] = None
+        self.actions_taken: List[str] = []
+        self._soft_triggered = False
+
+    @classmethod
+    def from_env(cls, tenant_id: str = "default") -> "BudgetGovernor":
+        """
+        从环境变量读取配置
+
+        BUDGET_RUN_TOKENS / BUDGET_RUN_COST：单次运行（"软/硬"）
+        BUDGET_TENANT_DAILY_TOKENS / BUDGET_TENANT_DAILY_COST：租户每天
+        BUDGET_DAILY_TOKENS / BUDGET_DAILY_COST：全局每天
+        BUDGET_SOFT_ACTIONS：逗号分隔的降级动作（downgrade, disable_vision, compact）
+        BUDGET_DOWNGRADE_MODEL：降级模型 "provider:model"
+        LLM_PRICES：价格表覆盖，见 parse_prices
+        """
+        actions = os.getenv("BUDGET_SOFT_ACTIONS")
+        soft_actions = SOFT_ACTIONS if actions is None else tuple(
+            a.strip() for a in actions.split(",") if a.strip() in SOFT_ACTIONS
+        )
+        return cls(
+            run_limits=BudgetLimits.from_env("BUDGET_RUN"),
+            tenant_limits=BudgetLimits.from_env("BUDGET_TENANT_DAILY"),
+            daily_limits=BudgetLimits.from_env("BUDGET_DAILY"),
+            tenant_id=tenant_id,
+            prices={**DEFAULT_PRICES, **parse_prices(os.getenv("LLM_PRICES", ""))},
+            soft_actions=soft_actions,
+            downgrade_model=os.getenv("BUDGET_DOWNGRADE_MODEL") or None,
+        )
+
+    def price(self, provider: str, model: str) -> Tuple[float, float]:
+        """查价格：provider:model 优先于模型名，未知模型按0计"""
+        return self.prices.get(f"{provider}:{model}") or self.prices.get(model) or (0.0, 0.0)
+
+    def record(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """
+        记录一次LLM调用
+
+        Returns:
+            本次调用的费用
+        """
+        prompt_price, completion_price = self.price(provider, model)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        tokens = prompt_tokens + completion_tokens
+        self.spend.add(tokens, cost)
+        self.ledger.add(self.tenant_id, tokens, cost)
+        telemetry.observe_llm_cost(provider, model, cost)
+        return cost
+
+    def check(self) -> str:
+        """
+        按当前花费重新评估（租户与全局花费也会因其他运行增长）
+
+        Returns:
+            BUDGET_OK / BUDGET_SOFT / BUDGET_HARD
+        """
+        tenant_spend, daily_spend = self.ledger.spend(self.tenant_id)
+        worst, reason = BUDGET_OK, None
+        for scope, limits, spend in (
+            ("run", self.run_limits, self.spend),
+            ("tenant", self.tenant_limits, tenant_spend),
+            ("daily", self.daily_limits, daily_spend),
+        ):
+            level, dimension = limits.check(spend)
+            if _RANK[level] > _RANK[worst]:
+                worst, reason = level, f"{scope} {dimension}"
+        if worst != self.level:
+            if worst != BUDGET_OK:
+                logger.warning(
+                    f"Budget {worst} limit reached ({reason}): run tokens={self.spend.tokens}, "
+                    f"cost={self.spend.cost:.4f}, tenant={self.tenant_id}"
+                )
+                telemetry.observe_budget_event(reason.split()[0], worst)
+            self.level = worst
+        self.reason = reason
+        return worst
+
+    def take_soft_actions(self) -> List[str]:
+        """首次越过软限制时返回要执行的降级动作，之后返回空列表"""
+        if self._soft_triggered or _RANK[self.level] < _RANK[BUDGET_SOFT]:
+            return []
+        self._soft_triggered = True
+        self.actions_taken = list(self.soft_actions)
+        return self.actions_taken
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "reason": self.reason,
+            "tenantId": self.tenant_id,
+            "spend": self.spend.to_dict(),
+            "actionsTaken": self.actions_taken,
+        }
+
+
+# 当前运行的预算控制器，与运行级Token账户一起在LLM首次使用之前设置
+_current_budget: ContextVar[Optional[BudgetGovernor]] = ContextVar("current_budget", default=None)
+
+
+def get_current_budget() -> Optional[BudgetGovernor]:
+    """获取当前上下文的预算控制器"""
+    return _current_budget.get()
+
+
+def set_current_budget(budget: Optional[BudgetGovernor]):
+    """
+    设置当前上下文的预算控制器
+
+    Returns:
+        用于 reset_current_budget 的token
+    """
+    return _current_budget.set(budget)
+
+
+def reset_current_budget(token):
+    """恢复设置之前的预算控制器"""
+    _current_budget.reset(token)
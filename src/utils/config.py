@@ -4,6 +4,7 @@ PROVIDER_DISPLAY_NAMES = {
     "deepseek": "DeepSeek",
     "ollama": "Ollama (本地模型)",
     "lmstudio": "LM Studio (本地模型)",
+    "router": "LLM Router (多供应商路由)",
 }
 
 # Predefined model names for common providers
@@ -39,4 +40,6 @@ model_names = {
         "deepseek-coder-v2", "deepseek-r1-distill-qwen",
         "phi-4", "gemma-2-9b"
     ],
+    # 实际后端由 LLM_ROUTER_BACKENDS 配置
+    "router": ["auto"],
 }
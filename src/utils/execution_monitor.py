@@ -4,13 +4,33 @@
 """
 import time
 import logging
-from typing import Dict, List, Optional, Any
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Any
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 
+from src.utils import telemetry
+from src.utils.histogram import LogHistogram
+from src.utils.run_events import EVENT_RETRY, EVENT_STEP, EVENT_TOKENS, RunEvents
+
 logger = logging.getLogger(__name__)
 
+# 阶段分类：用于判断慢任务是LLM瓶颈还是浏览器瓶颈
+# dom/screenshot/action:* 属于浏览器，llm/rate_limit（等待限流额度）属于模型，prompt/parse 属于Agent自身
+PHASE_CATEGORIES = {
+    "dom": "browser",
+    "screenshot": "browser",
+    "action": "browser",
+    "llm": "llm",
+    "rate_limit": "llm",
+    "prompt": "agent",
+    "parse": "agent",
+}
+# 与其他阶段重叠、不计入分解合计的指标（首Token延迟、流式Token间延迟包含在 llm 阶段内）
+OVERLAPPING_PHASES = {"llm_ttft", "llm_itl"}
+
 
 class ExecutionStatus(Enum):
     """执行状态枚举"""
@@ -19,9 +39,10 @@ class ExecutionStatus(Enum):
     FAILED = "FAILED"
     STEP_LIMIT_EXCEEDED = "STEP_LIMIT_EXCEEDED"
     CANCELLED = "CANCELLED"
+    BUDGET_EXCEEDED = "BUDGET_EXCEEDED"
 
 
-@dataclass
+@dataclass(slots=True)
 class RetryRecord:
     """重试记录"""
     step_number: int
@@ -47,7 +68,7 @@ class TokenUsage:
         self.completion_tokens += completion
 
 
-@dataclass
+@dataclass(slots=True)
 class StepMetrics:
     """单步执行指标"""
     step_number: int
@@ -57,6 +78,8 @@ class StepMetrics:
     duration: Optional[float] = None
     success: bool = True
     error: Optional[str] = None
+    # 各阶段独占耗时（秒），例如 {"dom": 0.8, "llm": 3.2, "action:click_element": 0.4}
+    phases: Dict[str, float] = field(default_factory=dict)
     
     def finish(self, success: bool = True, error: Optional[str] = None):
         """完成步骤"""
@@ -66,19 +89,52 @@ class StepMetrics:
         self.error = error
 
 
+@dataclass(slots=True, frozen=True)
+class MonitorSnapshot:
+    """监控快照：只包含标量，供UI高频轮询"""
+    status: str
+    current_step: int
+    max_steps: int
+    total_duration: float
+    average_step_duration: float
+    min_step_duration: float
+    max_step_duration: float
+    p50_step_duration: float
+    p95_step_duration: float
+    p99_step_duration: float
+    failed_steps: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    system_retry_count: int
+    business_retry_count: int
+    total_retry_count: int
+    llm_cache_hits: int
+    llm_cache_misses: int
+    compaction_count: int
+    compaction_saved_tokens: int
+
+
 class ExecutionMonitor:
     """执行监控器"""
     
-    def __init__(self, max_steps: int = 30, task_id: Optional[str] = None):
+    def __init__(self, max_steps: int = 30, task_id: Optional[str] = None,
+                 labels: Optional[Dict[str, str]] = None, token_usage: Optional[TokenUsage] = None,
+                 events: Optional[RunEvents] = None):
         """
         初始化执行监控器
         
         Args:
             max_steps: 最大步数限制
             task_id: 任务ID
+            labels: 导出指标的标签 {"agent", "provider", "model"}，见 telemetry.run_labels
+            token_usage: 共享的运行级Token账户（见 set_current_token_usage），默认新建
+            events: 运行事件队列，步骤结束、重试和Token记录时发布事件（见 run_events）
         """
         self.max_steps = max_steps
         self.task_id = task_id or f"task_{int(time.time())}"
+        self.labels = labels or {}
+        self.events = events
         
         # 执行状态
         self.status = ExecutionStatus.RUNNING
@@ -86,18 +142,39 @@ class ExecutionMonitor:
         self.start_time = time.time()
         self.end_time: Optional[float] = None
         
-        # Token统计
-        self.token_usage = TokenUsage()
+        # Token统计（与运行级Token账户共享时包含监控器创建之前的调用）
+        self.token_usage = token_usage if token_usage is not None else TokenUsage()
         
         # 重试追踪
         self.retry_records: List[RetryRecord] = []
         self.system_retry_count = 0
         self.business_retry_count = 0
         
+        # LLM响应缓存
+        self.llm_cache_hits = 0
+        self.llm_cache_misses = 0
+        
+        # 消息历史压缩
+        self.compaction_count = 0
+        self.compaction_saved_tokens = 0
+        
         # 步骤指标
         self.step_metrics: List[StepMetrics] = []
         self.current_step_metric: Optional[StepMetrics] = None
         
+        # 步骤耗时的增量聚合，轮询时不再遍历 step_metrics
+        self._step_duration_sum = 0.0
+        self._step_duration_min: Optional[float] = None
+        self._step_duration_max: Optional[float] = None
+        self._failed_steps = 0
+        self._step_latency = LogHistogram()
+        self._quantile_cache: Optional[tuple] = None
+        
+        # 阶段耗时：跨步骤的每阶段直方图，以及嵌套阶段栈 [名称, 开始时间, 子阶段耗时]
+        self._phase_latency: Dict[str, LogHistogram] = {}
+        self._phase_stack: List[list] = []
+        self._last_phase_end: Optional[float] = None
+        
         logger.info(f"ExecutionMonitor initialized: task_id={self.task_id}, max_steps={self.max_steps}")
     
     def start_step(self, action_type: str) -> bool:
@@ -122,6 +199,7 @@ class ExecutionMonitor:
             return False
         
         # 创建步骤指标
+        self._last_phase_end = None
         self.current_step_metric = StepMetrics(
             step_number=self.current_step,
             action_type=action_type,
@@ -140,8 +218,19 @@ class ExecutionMonitor:
             error: 错误信息
         """
         if self.current_step_metric:
-            self.current_step_metric.finish(success=success, error=error)
-            self.step_metrics.append(self.current_step_metric)
+            metric = self.current_step_metric
+            metric.finish(success=success, error=error)
+            self.step_metrics.append(metric)
+            
+            duration = metric.duration
+            self._step_duration_sum += duration
+            self._step_duration_min = duration if self._step_duration_min is None else min(self._step_duration_min, duration)
+            self._step_duration_max = duration if self._step_duration_max is None else max(self._step_duration_max, duration)
+            self._step_latency.record(duration)
+            self._quantile_cache = None
+            if not success:
+                self._failed_steps += 1
+            telemetry.observe_step(self.labels, duration, success)
             
             logger.debug(
                 f"Step {self.current_step} finished: "
@@ -150,6 +239,108 @@ class ExecutionMonitor:
             )
             
             self.current_step_metric = None
+            self._publish(EVENT_STEP, self.current_step)
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        计时一个阶段（记录独占耗时）
+        
+        阶段可嵌套，外层阶段会扣除内层阶段的耗时，例如 dom 内部的 screenshot
+        只计入 screenshot，parse 内部的 llm 只计入 llm
+        
+        Args:
+            name: 阶段名，如 "dom" / "screenshot" / "llm" / "parse" / "action:click_element"
+        """
+        frame = [name, time.perf_counter(), 0.0]
+        self._phase_stack.append(frame)
+        try:
+            with telemetry.span(f"agent.{name}", {"step": self.current_step}):
+                yield
+        finally:
+            end = time.perf_counter()
+            elapsed = end - frame[1]
+            self._phase_stack.pop()
+            if self._phase_stack:
+                self._phase_stack[-1][2] += elapsed
+            self._last_phase_end = end
+            self.record_phase(name, elapsed - frame[2])
+    
+    def record_child_phase(self, name: str, duration: float):
+        """
+        记录发生在当前阶段内部、但无法用 phase() 包住的耗时，并从外层阶段扣除
+        
+        用于流式LLM调用：等待模型返回数据块的时间与调用方处理数据块的时间交错，只能累计后一次性记录
+        
+        Args:
+            name: 阶段名
+            duration: 耗时（秒）
+        """
+        duration = max(0.0, duration)
+        if self._phase_stack:
+            self._phase_stack[-1][2] += duration
+        self.record_phase(name, duration)
+    
+    def mark_prompt_start(self):
+        """
+        记录提示词构建阶段：从上一个阶段结束（状态提取完成）到现在的间隔
+        
+        在调用LLM之前调用
+        """
+        if self._last_phase_end is not None and not self._phase_stack:
+            self.record_phase("prompt", time.perf_counter() - self._last_phase_end)
+            self._last_phase_end = None
+    
+    def record_phase(self, name: str, duration: float):
+        """
+        记录一个阶段耗时（累加到当前步骤并计入跨步骤统计）
+        
+        Args:
+            name: 阶段名
+            duration: 耗时（秒）
+        """
+        duration = max(0.0, duration)
+        if self.current_step_metric is not None:
+            phases = self.current_step_metric.phases
+            phases[name] = phases.get(name, 0.0) + duration
+        hist = self._phase_latency.get(name)
+        if hist is None:
+            hist = self._phase_latency[name] = LogHistogram()
+        hist.record(duration)
+        telemetry.observe_phase(self.labels, name, duration)
+    
+    def get_phase_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        获取各阶段的跨步骤统计
+        
+        Returns:
+            {阶段名: {"count", "total", "avg", "p50", "p95", "max"}}
+        """
+        return {
+            name: {
+                "count": hist.count,
+                "total": round(hist.sum, 3),
+                "avg": round(hist.mean, 3),
+                "p50": round(hist.quantile(0.50), 3),
+                "p95": round(hist.quantile(0.95), 3),
+                "max": round(hist.max or 0.0, 3),
+            }
+            for name, hist in sorted(self._phase_latency.items())
+        }
+    
+    def get_phase_breakdown(self) -> Dict[str, float]:
+        """
+        按类别汇总阶段耗时（秒）：browser / llm / agent
+        
+        用于判断任务是LLM瓶颈还是浏览器瓶颈
+        """
+        breakdown = {"browser": 0.0, "llm": 0.0, "agent": 0.0}
+        for name, hist in self._phase_latency.items():
+            if name in OVERLAPPING_PHASES:
+                continue
+            category = PHASE_CATEGORIES.get(name.split(":", 1)[0], "agent")
+            breakdown[category] += hist.sum
+        return {k: round(v, 3) for k, v in breakdown.items()}
     
     def record_retry(self, retry_type: str, reason: str):
         """
@@ -170,6 +361,8 @@ class ExecutionMonitor:
             self.system_retry_count += 1
         elif retry_type == "business":
             self.business_retry_count += 1
+        telemetry.observe_retry(self.labels, retry_type)
+        self._publish(EVENT_RETRY, retry_type)
         
         logger.info(
             f"Retry recorded: step={self.current_step}, "
@@ -185,6 +378,7 @@ class ExecutionMonitor:
             completion_tokens: 完成Token数
         """
         self.token_usage.add(prompt=prompt_tokens, completion=completion_tokens)
+        self._publish(EVENT_TOKENS, self.token_usage.total_tokens)
         
         logger.debug(
             f"Tokens recorded: prompt={prompt_tokens}, "
@@ -192,6 +386,32 @@ class ExecutionMonitor:
             f"total={self.token_usage.total_tokens}"
         )
     
+    def record_cache_lookup(self, hit: bool):
+        """
+        记录一次LLM响应缓存查询
+        
+        Args:
+            hit: 是否命中
+        """
+        if hit:
+            self.llm_cache_hits += 1
+        else:
+            self.llm_cache_misses += 1
+    
+    def record_compaction(self, before_tokens: int, after_tokens: int):
+        """
+        记录一次消息历史压缩
+        
+        Args:
+            before_tokens: 压缩前的提示词Token数（估算）
+            after_tokens: 压缩后的提示词Token数（估算）
+        """
+        saved = max(0, before_tokens - after_tokens)
+        self.compaction_count += 1
+        self.compaction_saved_tokens += saved
+        telemetry.observe_compaction(self.labels, saved)
+        logger.debug(f"History compacted: {before_tokens} -> {after_tokens} tokens")
+    
     def finish(self, status: ExecutionStatus = ExecutionStatus.SUCCESS):
         """
         完成执行
@@ -201,6 +421,7 @@ class ExecutionMonitor:
         """
         self.end_time = time.time()
         self.status = status
+        telemetry.observe_run(self.labels, status.value, self.get_total_duration())
         
         logger.info(
             f"Execution finished: status={status.value}, "
@@ -208,6 +429,10 @@ class ExecutionMonitor:
             f"steps={self.current_step}/{self.max_steps}"
         )
     
+    def _publish(self, kind: str, data: Any = None):
+        if self.events is not None:
+            self.events.publish(kind, data)
+    
     def get_total_duration(self) -> float:
         """获取总耗时（秒）"""
         if self.end_time:
@@ -215,14 +440,55 @@ class ExecutionMonitor:
         return time.time() - self.start_time
     
     def get_average_step_duration(self) -> float:
-        """获取平均步骤耗时（秒）"""
+        """获取平均步骤耗时（秒），O(1)"""
         if not self.step_metrics:
             return 0.0
+        return self._step_duration_sum / len(self.step_metrics)
+    
+    def get_step_duration_quantiles(self) -> tuple:
+        """
+        获取步骤耗时的 p50/p95/p99（秒）
+        
+        基于对数直方图近似，结果缓存到下一个步骤完成
+        """
+        if self._quantile_cache is None:
+            self._quantile_cache = (
+                self._step_latency.quantile(0.50),
+                self._step_latency.quantile(0.95),
+                self._step_latency.quantile(0.99),
+            )
+        return self._quantile_cache
+    
+    def get_snapshot(self) -> MonitorSnapshot:
+        """
+        获取监控快照
         
-        total_duration = sum(
-            m.duration for m in self.step_metrics if m.duration is not None
+        只读取增量维护的计数，开销与已执行步数无关，适合UI轮询
+        """
+        p50, p95, p99 = self.get_step_duration_quantiles()
+        return MonitorSnapshot(
+            status=self.status.value,
+            current_step=self.current_step,
+            max_steps=self.max_steps,
+            total_duration=self.get_total_duration(),
+            average_step_duration=self.get_average_step_duration(),
+            min_step_duration=self._step_duration_min or 0.0,
+            max_step_duration=self._step_duration_max or 0.0,
+            p50_step_duration=p50,
+            p95_step_duration=p95,
+            p99_step_duration=p99,
+            failed_steps=self._failed_steps,
+            prompt_tokens=self.token_usage.prompt_tokens,
+            completion_tokens=self.token_usage.completion_tokens,
+            total_tokens=self.token_usage.total_tokens,
+            system_retry_count=self.system_retry_count,
+            business_retry_count=self.business_retry_count,
+            total_retry_count=len(self.retry_records),
+            llm_cache_hits=self.llm_cache_hits,
+            llm_cache_misses=self.llm_cache_misses,
+            compaction_count=self.compaction_count,
+            compaction_saved_tokens=self.compaction_saved_tokens,
         )
-        return total_duration / len(self.step_metrics)
     
     def get_summary(self) -> Dict[str, Any]:
         """
@@ -231,6 +497,7 @@ class ExecutionMonitor:
         Returns:
             包含所有监控指标的字典
         """
+        p50, p95, p99 = self.get_step_duration_quantiles()
         return {
             "task_id": self.task_id,
             "status": self.status.value,
@@ -242,11 +509,29 @@ class ExecutionMonitor:
                 "start_time": datetime.fromtimestamp(self.start_time).isoformat(),
                 "end_time": datetime.fromtimestamp(self.end_time).isoformat() if self.end_time else None,
             },
+            "phases": self.get_phase_stats(),
+            "phase_breakdown": self.get_phase_breakdown(),
+            "step_latency": {
+                "min": round(self._step_duration_min or 0.0, 2),
+                "max": round(self._step_duration_max or 0.0, 2),
+                "p50": round(p50, 2),
+                "p95": round(p95, 2),
+                "p99": round(p99, 2),
+                "failed_steps": self._failed_steps,
+            },
             "tokens": {
                 "prompt_tokens": self.token_usage.prompt_tokens,
                 "completion_tokens": self.token_usage.completion_tokens,
                 "total_tokens": self.token_usage.total_tokens,
             },
+            "llm_cache": {
+                "hits": self.llm_cache_hits,
+                "misses": self.llm_cache_misses,
+            },
+            "compaction": {
+                "count": self.compaction_count,
+                "saved_tokens": self.compaction_saved_tokens,
+            },
             "retries": {
                 "system_retry_count": self.system_retry_count,
                 "business_retry_count": self.business_retry_count,
@@ -268,6 +553,7 @@ class ExecutionMonitor:
                     "duration": round(m.duration, 2) if m.duration else None,
                     "success": m.success,
                     "error": m.error,
+                    "phases": {k: round(v, 3) for k, v in m.phases.items()},
                 }
                 for m in self.step_metrics
             ],
@@ -280,26 +566,98 @@ class ExecutionMonitor:
         Returns:
             格式化的指标文本
         """
-        summary = self.get_summary()
+        snapshot = self.get_snapshot()
         
         text = f"""
 ### 📊 执行指标
 
-**状态**: {summary['status']}
+**状态**: {snapshot.status}
 
 **执行统计**:
-- 当前步数: {summary['execution']['current_step']} / {summary['execution']['max_steps']}
-- 总耗时: {summary['execution']['total_duration']}秒
-- 平均步骤耗时: {summary['execution']['average_step_duration']}秒
+- 当前步数: {snapshot.current_step} / {snapshot.max_steps}
+- 总耗时: {snapshot.total_duration:.2f}秒
+- 平均步骤耗时: {snapshot.average_step_duration:.2f}秒
+- 步骤耗时 P50/P95/P99: {snapshot.p50_step_duration:.2f} / {snapshot.p95_step_duration:.2f} / {snapshot.p99_step_duration:.2f}秒
 
 **Token消耗**:
-- Prompt Tokens: {summary['tokens']['prompt_tokens']}
-- Completion Tokens: {summary['tokens']['completion_tokens']}
-- 总Token数: {summary['tokens']['total_tokens']}
+- Prompt Tokens: {snapshot.prompt_tokens}
+- Completion Tokens: {snapshot.completion_tokens}
+- 总Token数: {snapshot.total_tokens}
 
 **重试统计**:
-- 系统级重试: {summary['retries']['system_retry_count']}
-- 业务级重试: {summary['retries']['business_retry_count']}
-- 总重试次数: {summary['retries']['total_retry_count']}
+- 系统级重试: {snapshot.system_retry_count}
+- 业务级重试: {snapshot.business_retry_count}
+- 总重试次数: {snapshot.total_retry_count}
+"""
+        if snapshot.llm_cache_hits or snapshot.llm_cache_misses:
+            text += f"""
+**LLM缓存**:
+- 命中 / 未命中: {snapshot.llm_cache_hits} / {snapshot.llm_cache_misses}
+"""
+        if snapshot.compaction_count:
+            text += f"""
+**历史压缩**:
+- 压缩次数: {snapshot.compaction_count}
+- 移除的提示词Token: {snapshot.compaction_saved_tokens}
 """
         return text.strip()
+
+
+# 当前协程上下文中正在运行的监控器，由 BrowserUseAgent.run 设置；
+# 浏览器上下文、LLM包装器、控制器通过它记录阶段耗时，无需显式传递监控器
+_current_monitor: ContextVar[Optional[ExecutionMonitor]] = ContextVar("current_execution_monitor", default=None)
+
+
+def get_current_monitor() -> Optional[ExecutionMonitor]:
+    """获取当前上下文的执行监控器"""
+    return _current_monitor.get()
+
+
+def set_current_monitor(monitor: Optional[ExecutionMonitor]):
+    """
+    设置当前上下文的执行监控器
+    
+    Returns:
+        用于 reset_current_monitor 的token
+    """
+    return _current_monitor.set(monitor)
+
+
+def reset_current_monitor(token):
+    """恢复设置之前的监控器"""
+    _current_monitor.reset(token)
+
+
+# 运行级Token账户：在LLM首次使用之前设置，TokenTrackingLLM 把本上下文（及其派生任务）中的调用记到这里
+_current_token_usage: ContextVar[Optional[TokenUsage]] = ContextVar("current_token_usage", default=None)
+
+
+def get_current_token_usage() -> Optional[TokenUsage]:
+    """获取当前上下文的运行级Token账户"""
+    return _current_token_usage.get()
+
+
+def set_current_token_usage(usage: Optional[TokenUsage]):
+    """
+    设置当前上下文的运行级Token账户
+    
+    Returns:
+        用于 reset_current_token_usage 的token
+    """
+    return _current_token_usage.set(usage)
+
+
+def reset_current_token_usage(token):
+    """恢复设置之前的Token账户"""
+    _current_token_usage.reset(token)
+
+
+@contextmanager
+def monitor_phase(name: str) -> Iterator[None]:
+    """在当前监控器上计时一个阶段；没有监控器时不做任何事"""
+    monitor = _current_monitor.get()
+    if monitor is None:
+        yield
+        return
+    with monitor.phase(name):
+        yield
@@ -0,0 +1,145 @@
+"""
+对数直方图 - Log Histogram
+HDR风格的对数-线性分桶：每个2的幂区间再均分为固定数量的子桶，相对误差有界，内存与样本数无关
+"""
+import math
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# 每个2的幂区间的子桶数为 2**SUB_BUCKET_BITS，相对误差约 1/32
+SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def _bucket_index(units: int) -> int:
+    if units < _SUB_BUCKETS:
+        return units
+    shift = units.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * _SUB_BUCKETS + (units >> shift)
+
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """桶覆盖的整数单位区间 [lower, upper)"""
+    if index < 2 * _SUB_BUCKETS:
+        return index, index + 1
+    shift = index // _SUB_BUCKETS - 1
+    mantissa = index - shift * _SUB_BUCKETS
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class LogHistogram:
+    """
+    对数直方图
+
+    - record: O(1)，只更新一个稀疏桶
+    - merge: 直接按桶相加，可用于把分钟桶合并成小时/天
+    - quantile: 按桶累计计数近似，误差受子桶数约束
+    """
+
+    def __init__(self, unit: float = 0.001):
+        """
+        初始化直方图
+
+        Args:
+            unit: 最小分辨率（记录值会先除以 unit 取整），默认 1ms
+        """
+        self.unit = unit
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, value: float, count: int = 1):
+        """记录一个样本（负数按0处理）"""
+        value = max(0.0, float(value))
+        index = _bucket_index(int(value / self.unit))
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LogHistogram"):
+        """合并另一个直方图（分辨率必须相同）"""
+        if other.unit != self.unit:
+            raise ValueError(f"Cannot merge histograms with different units: {self.unit} vs {other.unit}")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def _representative(self, index: int) -> float:
+        lower, upper = _bucket_bounds(index)
+        value = (lower + upper - 1) / 2 * self.unit
+        if self.min is not None:
+            value = max(value, self.min)
+        if self.max is not None:
+            value = min(value, self.max)
+        return value
+
+    def quantile(self, q: float) -> float:
+        """
+        近似分位数
+
+        Args:
+            q: 0~1 之间的分位，例如 0.95
+
+        Returns:
+            分位数值，无样本时返回 0.0
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self._representative(index)
+        return self.max or 0.0
+
+    def count_between(self, lower: float, upper: Optional[float] = None) -> int:
+        """统计落在 [lower, upper) 内的样本数（按桶代表值归属）"""
+        total = 0
+        for index, count in self.counts.items():
+            value = self._representative(index)
+            if value >= lower and (upper is None or value < upper):
+                total += count
+        return total
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可JSON编码的字典"""
+        return {
+            "unit": self.unit,
+            "counts": {str(k): v for k, v in self.counts.items()},
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogHistogram":
+        """从 to_dict() 的结果恢复"""
+        hist = cls(unit=data.get("unit", 0.001))
+        hist.counts = {int(k): v for k, v in data.get("counts", {}).items()}
+        hist.count = data.get("count", 0)
+        hist.sum = data.get("sum", 0.0)
+        hist.min = data.get("min")
+        hist.max = data.get("max")
+        return hist
+
+    @classmethod
+    def merged(cls, histograms: Iterable["LogHistogram"], unit: float = 0.001) -> "LogHistogram":
+        """合并多个直方图为一个新直方图"""
+        result = cls(unit=unit)
+        for hist in histograms:
+            result.merge(hist)
+        return result
@@ -0,0 +1,185 @@
+"""
+共享HTTP客户端池 - HTTP Client Pool
+按 (provider, base_url, api_key) 在进程内共享 keep-alive 的 httpx 客户端，
+每次 get_llm_model 创建的 ChatOpenAI / ZKHChatOpenAI 复用同一连接池，避免每个Agent重复建连和TLS握手
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HTTPPoolConfig:
+    """连接池配置"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls) -> "HTTPPoolConfig":
+        """
+        从环境变量读取配置
+
+        LLM_HTTP_MAX_CONNECTIONS / LLM_HTTP_MAX_KEEPALIVE / LLM_HTTP_KEEPALIVE_EXPIRY /
+        LLM_HTTP_CONNECT_TIMEOUT / LLM_HTTP2
+        """
+        return cls(
+            max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30")),
+            connect_timeout=float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10")),
+            http2=os.getenv("LLM_HTTP2", "true").lower() in ("true", "1", "yes"),
+        )
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+@dataclass
+class PoolStats:
+    """一个共享连接池的请求统计"""
+    provider: str
+    base_url: str
+    max_connections: int
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    requests: int = 0
+    _transport: Any = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns:
+            含当前连接数（open/idle）与饱和度（in_flight / max_connections）的字典
+        """
+        open_connections, idle_connections = _connection_counts(self._transport)
+        return {
+            "provider": self.provider,
+            "baseUrl": self.base_url,
+            "maxConnections": self.max_connections,
+            "openConnections": open_connections,
+            "idleConnections": idle_connections,
+            "inFlight": self.in_flight,
+            "peakInFlight": self.peak_in_flight,
+            "requests": self.requests,
+            "saturation": round(self.in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+        }
+
+
+def _connection_counts(transport: Any) -> Tuple[int, int]:
+    """读取 httpcore 连接池中的连接数 (open, idle)"""
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return 0, 0
+    return len(connections), sum(1 for c in connections if c.is_idle())
+
+
+class _InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    """统计在途请求数的传输层（从发出请求到收到响应头）"""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            stats.in_flight -= 1
+
+
+@dataclass
+class _SharedClients:
+    async_client: httpx.AsyncClient
+    sync_client: httpx.Client
+    stats: PoolStats
+
+
+_clients: Dict[Tuple[str, str, str], _SharedClients] = {}
+_lock = threading.Lock()
+_config: Optional[HTTPPoolConfig] = None
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _build(provider: str, base_url: str, config: HTTPPoolConfig) -> _SharedClients:
+    http2 = config.http2 and _http2_available()
+    if config.http2 and not http2:
+        logger.warning("LLM_HTTP2 is enabled but the 'h2' package is not installed, falling back to HTTP/1.1")
+    timeout = httpx.Timeout(None, connect=config.connect_timeout)
+    stats = PoolStats(provider=provider, base_url=base_url, max_connections=config.max_connections)
+    transport = _InstrumentedAsyncTransport(stats, http2=http2, limits=config.limits())
+    stats._transport = transport
+    logger.info(
+        f"Created shared HTTP client pool: provider={provider}, base_url={base_url}, "
+        f"max_connections={config.max_connections}, http2={http2}"
+    )
+    return _SharedClients(
+        async_client=httpx.AsyncClient(transport=transport, timeout=timeout),
+        sync_client=httpx.Client(http2=http2, limits=config.limits(), timeout=timeout),
+        stats=stats,
+    )
+
+
+def _shared(provider: str, base_url: str, api_key: Optional[str]) -> _SharedClients:
+    global _config
+    key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    key = (provider, base_url, key_hash)
+    clients = _clients.get(key)
+    if clients is None:
+        with _lock:
+            clients = _clients.get(key)
+            if clients is None:
+                if _config is None:
+                    _config = HTTPPoolConfig.from_env()
+                clients = _clients[key] = _build(provider, base_url, _config)
+    return clients
+
+
+def get_async_http_client(provider: str, base_url: str, api_key: Optional[str] = None) -> httpx.AsyncClient:
+    """
+    获取共享的异步HTTP客户端
+
+    同一进程内相同 (provider, base_url, api_key) 返回同一个客户端，调用方不应自行关闭
+    """
+    return _shared(provider, base_url, api_key).async_client
+
+
+def get_sync_http_client(provider: str, base_url: str, api_key: Optional[str] = None) -> httpx.Client:
+    """获取共享的同步HTTP客户端（与异步客户端同键）"""
+    return _shared(provider, base_url, api_key).sync_client
+
+
+def get_http_pool_stats() -> List[Dict[str, Any]]:
+    """所有共享连接池的当前统计"""
+    return [clients.stats.to_dict() for clients in list(_clients.values())]
+
+
+async def close_all_http_clients():
+    """关闭所有共享HTTP客户端"""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for shared in clients:
+        await shared.async_client.aclose()
+        shared.sync_client.close()
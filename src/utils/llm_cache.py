@@ -0,0 +1,278 @@
+"""
+LLM响应缓存 - LLM Cache
+按归一化后的消息列表、模型与调用参数精确匹配缓存 temperature=0 的响应，
+回放已知流程（回归测试的同一场景）时直接返回缓存结果，不再调用LLM
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCacheBackend(ABC):
+    """
+    缓存后端接口
+
+    值为序列化后的 ChatResult（JSON字符串）；实现需自行处理 TTL 与容量淘汰
+    """
+
+    # 读写会阻塞（磁盘/网络I/O）：异步调用路径在线程中执行，不占用事件循环
+    blocking = False
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: 最多保留的条目数，超出时淘汰最久未使用的条目
+            ttl: 条目有效期（秒），None 表示不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """读取条目，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        """写入条目"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """当前条目数（含尚未清理的过期条目）"""
+
+    @abstractmethod
+    def clear(self):
+        """清空缓存"""
+
+    def close(self):
+        pass
+
+
+class MemoryLLMCache(LLMCacheBackend):
+    """进程内LRU缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0], time.time()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteLLMCache(LLMCacheBackend):
+    """
+    基于SQLite的磁盘缓存，进程重启后仍可命中
+
+    读取时更新访问时间，超出容量时按访问时间淘汰
+    """
+
+    blocking = True
+
+    def __init__(self, db_path: str = "./tmp/llm_cache.db", max_entries: int = 10000, ttl: Optional[float] = None):
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], now):
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)", (key, value, now, now))
+                if self.ttl is not None:
+                    self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+                self._conn.execute(
+                    """
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _normalize_content(content: Any) -> Any:
+    """归一化消息内容：去除行尾与首尾空白，多段内容逐段处理"""
+    if isinstance(content, str):
+        return "\n".join(line.rstrip() for line in content.strip().splitlines())
+    if isinstance(content, list):
+        return [_normalize_content(part) for part in content]
+    if isinstance(content, dict):
+        return {k: _normalize_content(v) for k, v in content.items()}
+    return content
+
+
+def _normalize_message(message: BaseMessage) -> Dict[str, Any]:
+    normalized: Dict[str, Any] = {"type": message.type, "content": _normalize_content(message.content)}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        normalized["tool_calls"] = [{"name": c.get("name"), "args": c.get("args")} for c in tool_calls]
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id:
+        normalized["tool_call_id"] = tool_call_id
+    return normalized
+
+
+def make_cache_key(
+    messages: Sequence[BaseMessage],
+    model: str,
+    params: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    计算缓存键
+
+    Args:
+        messages: 消息列表（内容做空白归一化，工具调用ID等随机字段不参与）
+        model: 模型标识（提供商/模型名）
+        params: 影响输出的调用参数，如 stop、绑定的 tools / tool_choice
+    """
+    payload = {
+        "model": model,
+        "messages": [_normalize_message(m) for m in messages],
+        "params": params or {},
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def dump_result(result: ChatResult) -> str:
+    """序列化 ChatResult"""
+    return json.dumps(
+        {
+            "generations": [
+                {"message": message_to_dict(g.message), "generation_info": g.generation_info}
+                for g in result.generations
+            ],
+            "llm_output": result.llm_output,
+        },
+        ensure_ascii=False,
+        default=str,
+    )
+
+
+def load_result(value: str) -> ChatResult:
+    """反序列化 ChatResult"""
+    data = json.loads(value)
+    messages: List[BaseMessage] = messages_from_dict([g["message"] for g in data["generations"]])
+    return ChatResult(
+        generations=[
+            ChatGeneration(message=message, generation_info=g.get("generation_info"))
+            for message, g in zip(messages, data["generations"])
+        ],
+        llm_output=data.get("llm_output"),
+    )
+
+
+_cache: Optional[LLMCacheBackend] = None
+_cache_loaded = False
+
+
+def get_llm_cache() -> Optional[LLMCacheBackend]:
+    """
+    按环境变量获取进程共享的缓存后端，未启用时返回 None
+
+    LLM_CACHE: off（默认）/ memory / sqlite
+    LLM_CACHE_PATH: SQLite 文件路径
+    LLM_CACHE_MAX_ENTRIES: 最大条目数
+    LLM_CACHE_TTL: 有效期（秒），0 表示不过期
+    """
+    global _cache, _cache_loaded
+    if _cache_loaded:
+        return _cache
+    _cache_loaded = True
+    backend = os.getenv("LLM_CACHE", "off").lower()
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+    ttl = float(os.getenv("LLM_CACHE_TTL", "0")) or None
+    if backend == "memory":
+        _cache = MemoryLLMCache(max_entries=max_entries, ttl=ttl)
+    elif backend == "sqlite":
+        _cache = SQLiteLLMCache(
+            db_path=os.getenv("LLM_CACHE_PATH", "./tmp/llm_cache.db"), max_entries=max_entries, ttl=ttl
+        )
+    elif backend not in ("", "off", "false", "0"):
+        logger.warning(f"Unknown LLM_CACHE backend '{backend}', caching disabled")
+    if _cache is not None:
+        logger.info(f"LLM response cache enabled: backend={backend}, max_entries={max_entries}, ttl={ttl}")
+    return _cache
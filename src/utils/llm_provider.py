@@ -1,17 +1,21 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import os
 import logging
-from typing import Any, Optional, Sequence, Union, Mapping
+import time
+from typing import Any, AsyncIterator, Optional, Sequence, Union, Mapping
 
 from langchain_openai import ChatOpenAI
 from langchain_ollama import ChatOllama
 from langchain_core.language_models.base import LanguageModelInput
-from langchain_core.messages import AIMessage, SystemMessage, BaseMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, SystemMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
 from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
 
 from src.utils import config
+from src.utils.http_client_pool import get_async_http_client, get_sync_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -87,67 +91,138 @@ class ZKHChatOpenAI(ChatOpenAI):
         return await super()._agenerate(messages, stop, run_manager, **filtered_kwargs)
 
 
+def _to_r1_messages(messages: Sequence[BaseMessage]) -> list[dict]:
+    """转换为 DeepSeek R1 接口的消息格式（只保留角色与内容）"""
+    message_history = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            message_history.append({"role": "system", "content": message.content})
+        elif isinstance(message, AIMessage):
+            message_history.append({"role": "assistant", "content": message.content})
+        else:
+            message_history.append({"role": "user", "content": message.content})
+    return message_history
+
+
+def _r1_usage_metadata(usage: Any) -> Optional[dict]:
+    if usage is None:
+        return None
+    return {
+        "input_tokens": usage.prompt_tokens or 0,
+        "output_tokens": usage.completion_tokens or 0,
+        "total_tokens": usage.total_tokens or 0,
+    }
+
+
 class DeepSeekR1ChatOpenAI(ChatOpenAI):
-    """支持 DeepSeek R1 推理模式的 ChatOpenAI 子类"""
+    """
+    支持 DeepSeek R1 推理模式的 ChatOpenAI 子类
+
+    异步调用基于 AsyncOpenAI 流式读取 reasoning_content 与 content，推理期间不阻塞事件循环；
+    返回的 AIMessage 带有 reasoning_content，llm_output 中带有首Token延迟 first_token_latency
+    """
+
+    _r1_client: Any = PrivateAttr(default=None)
+    _r1_async_client: Any = PrivateAttr(default=None)
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
-        self.client = OpenAI(
+        self._r1_client = OpenAI(
+            base_url=kwargs.get("base_url"),
+            api_key=kwargs.get("api_key"),
+            http_client=kwargs.get("http_client"),
+        )
+        self._r1_async_client = AsyncOpenAI(
             base_url=kwargs.get("base_url"),
-            api_key=kwargs.get("api_key")
+            api_key=kwargs.get("api_key"),
+            http_client=kwargs.get("http_async_client"),
         )
 
-    async def ainvoke(
+    async def _astream(
             self,
-            input: LanguageModelInput,
-            config: Optional[RunnableConfig] = None,
-            *,
+            messages: list[BaseMessage],
             stop: Optional[list[str]] = None,
+            run_manager: Optional[Any] = None,
             **kwargs: Any,
-    ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
-
-        response = self.client.chat.completions.create(
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """流式返回推理内容（additional_kwargs["reasoning_content"]）与回答，最后一块带Token用量"""
+        stream = await self._r1_async_client.chat.completions.create(
             model=self.model_name,
-            messages=message_history
+            messages=_to_r1_messages(messages),
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        async for chunk in stream:
+            usage_metadata = _r1_usage_metadata(getattr(chunk, "usage", None))
+            if not chunk.choices:
+                if usage_metadata:
+                    yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage_metadata))
+                continue
+            delta = chunk.choices[0].delta
+            reasoning = getattr(delta, "reasoning_content", None)
+            content = delta.content or ""
+            if not reasoning and not content and not usage_metadata:
+                continue
+            message_chunk = AIMessageChunk(
+                content=content,
+                additional_kwargs={"reasoning_content": reasoning} if reasoning else {},
+                usage_metadata=usage_metadata,
+            )
+            generation_chunk = ChatGenerationChunk(message=message_chunk)
+            if run_manager and content:
+                await run_manager.on_llm_new_token(content, chunk=generation_chunk)
+            yield generation_chunk
 
-        reasoning_content = getattr(response.choices[0].message, 'reasoning_content', None)
-        content = response.choices[0].message.content
-        return AIMessage(content=content, reasoning_content=reasoning_content)
-
-    def invoke(
+    async def _agenerate(
             self,
-            input: LanguageModelInput,
-            config: Optional[RunnableConfig] = None,
-            *,
+            messages: list[BaseMessage],
             stop: Optional[list[str]] = None,
+            run_manager: Optional[Any] = None,
             **kwargs: Any,
-    ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
+    ) -> ChatResult:
+        """聚合流式结果，记录首Token（推理或回答的第一块）延迟"""
+        started = time.perf_counter()
+        first_token_latency = None
+        aggregated: Optional[ChatGenerationChunk] = None
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            if first_token_latency is None and (chunk.message.content or chunk.message.additional_kwargs):
+                first_token_latency = time.perf_counter() - started
+            aggregated = chunk if aggregated is None else aggregated + chunk
 
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=message_history
+        if aggregated is None:
+            message = AIMessage(content="", reasoning_content=None)
+        else:
+            message = AIMessage(
+                content=aggregated.message.content,
+                reasoning_content=aggregated.message.additional_kwargs.get("reasoning_content"),
+                additional_kwargs=aggregated.message.additional_kwargs,
+                usage_metadata=aggregated.message.usage_metadata,
+            )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"model_name": self.model_name, "first_token_latency": first_token_latency},
         )
 
-        reasoning_content = getattr(response.choices[0].message, 'reasoning_content', None)
-        content = response.choices[0].message.content
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+    def _generate(
+            self,
+            messages: list[BaseMessage],
+            stop: Optional[list[str]] = None,
+            run_manager: Optional[Any] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        """同步调用（供同步 invoke 使用；异步代码应使用 ainvoke）"""
+        response = self._r1_client.chat.completions.create(
+            model=self.model_name,
+            messages=_to_r1_messages(messages),
+        )
+        reasoning_content = getattr(response.choices[0].message, "reasoning_content", None)
+        message = AIMessage(
+            content=response.choices[0].message.content or "",
+            reasoning_content=reasoning_content,
+            additional_kwargs={"reasoning_content": reasoning_content} if reasoning_content else {},
+            usage_metadata=_r1_usage_metadata(getattr(response, "usage", None)),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"model_name": self.model_name})
 
 
 class DeepSeekR1ChatOllama(ChatOllama):
@@ -194,6 +269,14 @@ class DeepSeekR1ChatOllama(ChatOllama):
         return AIMessage(content=content, reasoning_content=reasoning_content)
 
 
+def _shared_http_clients(provider: str, base_url: str, api_key: str) -> dict:
+    """OpenAI兼容模型复用进程共享的keep-alive连接池（见 http_client_pool）"""
+    return {
+        "http_client": get_sync_http_client(provider, base_url, api_key),
+        "http_async_client": get_async_http_client(provider, base_url, api_key),
+    }
+
+
 def get_llm_model(provider: str, **kwargs):
     """
     获取 LLM 模型实例
@@ -204,13 +287,14 @@ def get_llm_model(provider: str, **kwargs):
     - deepseek: DeepSeek
     - ollama: Ollama 本地模型
     - lmstudio: LM Studio 本地模型 (OpenAI 兼容 API)
+    - router: 按 LLM_ROUTER_BACKENDS 在多个供应商间路由（见 llm_router.RoutedChatModel）
     
     :param provider: LLM 供应商名称
     :param kwargs: 模型配置参数
     :return: LLM 模型实例
     """
-    # Ollama 和 LM Studio 不需要 API Key (LM Studio 支持空 API key)
-    if provider not in ("ollama", "lmstudio"):
+    # Ollama 和 LM Studio 不需要 API Key (LM Studio 支持空 API key)，router 的各后端分别读取自己的 API Key
+    if provider not in ("ollama", "lmstudio", "router"):
         env_var = f"{provider.upper()}_API_KEY"
         api_key = kwargs.get("api_key", "") or os.getenv(env_var, "")
         if not api_key:
@@ -229,6 +313,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            **_shared_http_clients(provider, base_url, api_key),
         )
     
     # ==================== OpenAI ====================
@@ -240,6 +325,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            **_shared_http_clients(provider, base_url, api_key),
         )
     
     # ==================== DeepSeek ====================
@@ -253,6 +339,7 @@ def get_llm_model(provider: str, **kwargs):
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
                 api_key=api_key,
+                **_shared_http_clients(provider, base_url, api_key),
             )
         else:
             return ChatOpenAI(
@@ -260,6 +347,7 @@ def get_llm_model(provider: str, **kwargs):
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
                 api_key=api_key,
+                **_shared_http_clients(provider, base_url, api_key),
             )
     
     # ==================== Ollama (本地模型) ====================
@@ -295,7 +383,13 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key if api_key else "not-needed",  # LM Studio 接受任意 API key 或 "not-needed"
+            **_shared_http_clients(provider, base_url, api_key),
         )
     
+    # ==================== Router (多供应商路由) ====================
+    elif provider == "router":
+        from src.utils.llm_router import RoutedChatModel
+        return RoutedChatModel.from_env(temperature=kwargs.get("temperature", 0.0))
+    
     else:
-        raise ValueError(f"Unsupported provider: {provider}. Supported providers: zkh, openai, deepseek, ollama, lmstudio")
+        raise ValueError(f"Unsupported provider: {provider}. Supported providers: zkh, openai, deepseek, ollama, lmstudio, router")
@@ -0,0 +1,306 @@
+"""
+LLM路由 - LLM Router
+在多个后端（zkh / openai / deepseek / ollama / lmstudio）之间按延迟与错误率路由每次调用：
+- 每个后端维护 EWMA 延迟、随时间衰减的 EWMA 错误率与延迟直方图
+- 每次调用选择得分最低的后端，遇到 5xx / 429 / 超时 / 连接错误时切换到下一个后端
+- 可选对冲：主后端超过其 p95 延迟仍未返回时，向次优后端发出重复请求，取先成功的结果
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from pydantic import ConfigDict, Field, PrivateAttr
+
+from src.utils.histogram import LogHistogram
+
+logger = logging.getLogger(__name__)
+
+# 错误率对得分的放大系数：错误率 10% 的后端相当于延迟翻倍
+ERROR_PENALTY = 10.0
+
+# 按名称识别的可重试异常（openai SDK 的超时与连接错误没有状态码）
+_RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout"}
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """是否应切换到其他后端重试：超时、连接错误、HTTP 5xx 与 429"""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return type(exc).__name__ in _RETRYABLE_ERROR_NAMES
+
+
+@dataclass
+class BackendStats:
+    """单个后端的延迟与错误统计"""
+    name: str
+    ewma_latency: Optional[float] = None
+    ewma_error_rate: float = 0.0
+    last_failure_at: Optional[float] = None
+    in_flight: int = 0
+    calls: int = 0
+    failures: int = 0
+    hedges: int = 0
+    hedges_won: int = 0
+    latency: LogHistogram = field(default_factory=LogHistogram)
+
+    def record(self, latency: Optional[float], success: bool, alpha: float):
+        """记录一次调用结果（失败时 latency 不计入延迟统计）"""
+        self.calls += 1
+        self.ewma_error_rate += alpha * ((0.0 if success else 1.0) - self.ewma_error_rate)
+        if success:
+            self.latency.record(latency)
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += alpha * (latency - self.ewma_latency)
+        else:
+            self.failures += 1
+            self.last_failure_at = time.time()
+
+    def error_rate(self, half_life: float, now: Optional[float] = None) -> float:
+        """
+        当前错误率：距上次失败越久衰减越多，长期不被选中的故障后端也能重新获得流量
+        """
+        if self.last_failure_at is None or half_life <= 0:
+            return self.ewma_error_rate
+        elapsed = (now or time.time()) - self.last_failure_at
+        return self.ewma_error_rate * 0.5 ** (elapsed / half_life)
+
+    def to_dict(self, half_life: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "ewmaLatency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "p95Latency": round(self.latency.quantile(0.95), 3),
+            "errorRate": round(self.error_rate(half_life), 3),
+            "inFlight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedgesWon": self.hedges_won,
+        }
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    多后端路由的聊天模型
+
+    与 TokenTrackingLLM、bind_tools / with_structured_output 兼容：工具在调用时按所选后端分别绑定，
+    因此各后端自己的参数适配（如 ZKHChatOpenAI 的参数过滤）仍然生效
+    """
+
+    backends: Dict[str, Any] = Field(default_factory=dict, exclude=True)
+    model_name: str = "auto"
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    request_timeout: Optional[float] = None
+    ewma_alpha: float = 0.2
+    error_half_life: float = 30.0
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    _stats: Dict[str, BackendStats] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, backends: Dict[str, BaseChatModel], **kwargs: Any):
+        """
+        初始化路由模型
+
+        Args:
+            backends: 名称 -> 模型实例，按优先级排列（没有统计数据时按此顺序选择）
+            hedge: 是否启用对冲请求
+            hedge_quantile: 对冲截止时间取主后端延迟的该分位数
+            hedge_min_samples: 主后端至少有多少次成功调用后才启用对冲
+            request_timeout: 单次后端调用超时（秒），超时视为可重试错误
+            ewma_alpha: EWMA 平滑系数
+            error_half_life: 错误率衰减半衰期（秒）
+        """
+        if not backends:
+            raise ValueError("RoutedChatModel requires at least one backend")
+        if "model_name" not in kwargs:
+            first = next(iter(backends.values()))
+            kwargs["model_name"] = getattr(first, "model_name", None) or getattr(first, "model", None) or "auto"
+        super().__init__(backends=backends, **kwargs)
+        self._stats = {name: BackendStats(name=name) for name in backends}
+
+    @classmethod
+    def from_env(cls, temperature: float = 0.0) -> "RoutedChatModel":
+        """
+        按环境变量构建
+
+        LLM_ROUTER_BACKENDS: 逗号分隔的 provider[:model]，如 "zkh:ep_20251217_i18v,deepseek:deepseek-chat,ollama:qwen2.5:7b"
+        LLM_ROUTER_HEDGE: 是否启用对冲（默认 false）
+        LLM_ROUTER_TIMEOUT: 单次后端调用超时（秒），0 表示不限
+        """
+        from src.utils.llm_provider import get_llm_model
+
+        spec = os.getenv("LLM_ROUTER_BACKENDS", "")
+        backends: Dict[str, BaseChatModel] = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            provider, _, model_name = item.partition(":")
+            kwargs: Dict[str, Any] = {"temperature": temperature}
+            if model_name:
+                kwargs["model_name"] = model_name
+            backends[item] = get_llm_model(provider=provider, **kwargs)
+        if not backends:
+            raise ValueError("LLM_ROUTER_BACKENDS is empty, e.g. LLM_ROUTER_BACKENDS=zkh,deepseek:deepseek-chat")
+        return cls(
+            backends=backends,
+            hedge=os.getenv("LLM_ROUTER_HEDGE", "false").lower() in ("true", "1", "yes"),
+            request_timeout=float(os.getenv("LLM_ROUTER_TIMEOUT", "0")) or None,
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"backends": list(self.backends)}
+
+    def get_backend_stats(self) -> List[Dict[str, Any]]:
+        """各后端的当前统计"""
+        return [s.to_dict(self.error_half_life) for s in self._stats.values()]
+
+    def _rank(self) -> List[str]:
+        """按得分从低到高排列后端：EWMA延迟 ×（1 + 错误率惩罚），没有延迟数据的后端按已知最好的延迟估计"""
+        now = time.time()
+        known = [s.ewma_latency for s in self._stats.values() if s.ewma_latency is not None]
+        baseline = min(known) if known else 1.0
+        order = {name: i for i, name in enumerate(self.backends)}
+
+        def score(name: str) -> tuple:
+            stats = self._stats[name]
+            latency = stats.ewma_latency if stats.ewma_latency is not None else baseline
+            return latency * (1 + ERROR_PENALTY * stats.error_rate(self.error_half_life, now)), order[name]
+
+        return sorted(self.backends, key=score)
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        stats = self._stats[name]
+        if not self.hedge or stats.latency.count < self.hedge_min_samples:
+            return None
+        return stats.latency.quantile(self.hedge_quantile)
+
+    def bind_tools(self, tools, **kwargs):
+        """
+        绑定工具
+
+        只记录工具与参数，实际调用时由所选后端的 bind_tools 生成各自格式的请求参数
+        """
+        structured_output_format = kwargs.pop("ls_structured_output_format", None)
+        binding_kwargs: Dict[str, Any] = {"routed_tools": list(tools), "routed_tool_kwargs": kwargs}
+        if structured_output_format is not None:
+            binding_kwargs["ls_structured_output_format"] = structured_output_format
+        return self.bind(**binding_kwargs)
+
+    @staticmethod
+    def _backend_kwargs(backend: BaseChatModel, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        call_kwargs = dict(kwargs)
+        tools = call_kwargs.pop("routed_tools", None)
+        tool_kwargs = call_kwargs.pop("routed_tool_kwargs", None) or {}
+        if tools is not None:
+            binding = backend.bind_tools(tools, **tool_kwargs)
+            call_kwargs.update(getattr(binding, "kwargs", {}))
+            call_kwargs.pop("ls_structured_output_format", None)
+        return call_kwargs
+
+    def _finish(self, name: str, started: float, result: ChatResult) -> ChatResult:
+        self._stats[name].record(time.perf_counter() - started, True, self.ewma_alpha)
+        result.llm_output = {**(result.llm_output or {}), "routed_backend": name}
+        return result
+
+    async def _acall_backend(self, name: str, messages: List[BaseMessage], stop: Optional[List[str]],
+                             kwargs: Dict[str, Any]) -> ChatResult:
+        backend = self.backends[name]
+        stats = self._stats[name]
+        stats.in_flight += 1
+        started = time.perf_counter()
+        try:
+            call = backend._agenerate(messages, stop, None, **self._backend_kwargs(backend, kwargs))
+            result = await (asyncio.wait_for(call, self.request_timeout) if self.request_timeout else call)
+        except asyncio.CancelledError:
+            # 对冲中落败被取消，不计入该后端的统计
+            raise
+        except Exception:
+            stats.record(None, False, self.ewma_alpha)
+            raise
+        finally:
+            stats.in_flight -= 1
+        return self._finish(name, started, result)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
+        """按得分选择后端调用；可重试错误时切换后端，主后端超过 p95 仍未返回时发出对冲请求"""
+        candidates = self._rank()
+        pending: Dict[asyncio.Task, str] = {}
+        hedge_name: Optional[str] = None
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            name = candidates.pop(0)
+            task = asyncio.create_task(self._acall_backend(name, messages, stop, kwargs))
+            pending[task] = name
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge_name is None and candidates and len(pending) == 1:
+                    timeout = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    primary = next(iter(pending.values()))
+                    logger.info(f"LLM router: {primary} exceeded p{int(self.hedge_quantile * 100)} "
+                                f"({timeout:.2f}s), hedging to {candidates[0]}")
+                    hedge_name = candidates[0]
+                    self._stats[hedge_name].hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if name == hedge_name and pending:
+                            self._stats[name].hedges_won += 1
+                        return task.result()
+                    if not is_retryable_error(error):
+                        raise error
+                    last_error = error
+                    logger.warning(f"LLM router: backend {name} failed ({type(error).__name__}: {error}), failing over")
+                if not pending and candidates:
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
+        """同步调用：按得分依次尝试各后端（不对冲）"""
+        last_error: Optional[BaseException] = None
+        for name in self._rank():
+            backend = self.backends[name]
+            started = time.perf_counter()
+            try:
+                result = backend._generate(messages, stop, None, **self._backend_kwargs(backend, kwargs))
+            except Exception as e:
+                self._stats[name].record(None, False, self.ewma_alpha)
+                if not is_retryable_error(e):
+                    raise
+                last_error = e
+                logger.warning(f"LLM router: backend {name} failed ({type(e).__name__}: {e}), failing over")
+                continue
+            return self._finish(name, started, result)
+        raise last_error
@@ -0,0 +1,234 @@
+"""
+指标汇总 - Metrics Rollup
+运行结束时把 ExecutionMonitor 摘要增量写入分钟/小时/天三级时间桶（Token、耗时直方图、重试、状态），
+看板按时间范围读取预聚合的桶，不扫描原始运行记录
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from src.utils.histogram import LogHistogram
+
+logger = logging.getLogger(__name__)
+
+# 粒度 -> 保留时长（秒），None 表示永久保留
+RETENTION: Dict[str, Optional[int]] = {
+    "minute": 2 * 86400,
+    "hour": 35 * 86400,
+    "day": None,
+}
+
+
+def bucket_start(ts: float, granularity: str) -> int:
+    """计算时间戳所在桶的起始时间（按本地时间对齐）"""
+    dt = datetime.fromtimestamp(ts)
+    if granularity == "minute":
+        dt = dt.replace(second=0, microsecond=0)
+    elif granularity == "hour":
+        dt = dt.replace(minute=0, second=0, microsecond=0)
+    elif granularity == "day":
+        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    return int(dt.timestamp())
+
+
+@dataclass
+class RollupBucket:
+    """一个时间桶的聚合值"""
+    granularity: str
+    start: int
+    runs: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    system_retries: int = 0
+    business_retries: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+    durations: LogHistogram = field(default_factory=LogHistogram)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add_run(self, summary: Dict[str, Any]):
+        """累加一次运行摘要（ExecutionMonitor.get_summary() 格式）"""
+        tokens = summary.get("tokens", {})
+        retries = summary.get("retries", {})
+        status = summary.get("status", "UNKNOWN")
+        self.runs += 1
+        self.prompt_tokens += tokens.get("prompt_tokens", 0)
+        self.completion_tokens += tokens.get("completion_tokens", 0)
+        self.system_retries += retries.get("system_retry_count", 0)
+        self.business_retries += retries.get("business_retry_count", 0)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.durations.record(summary.get("execution", {}).get("total_duration", 0.0))
+
+
+class MetricsRollup:
+    """
+    基于SQLite的指标汇总
+
+    每次 record_run 在一个事务内更新三个桶（分钟/小时/天），查询90天只需读取约90行天桶
+    """
+
+    def __init__(self, db_path: str = "./tmp/metrics.db"):
+        """
+        初始化汇总存储
+
+        Args:
+            db_path: 数据库文件路径，":memory:" 表示内存库
+        """
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    @classmethod
+    def from_env(cls) -> "MetricsRollup":
+        """从环境变量 METRICS_DB_PATH 读取数据库路径"""
+        return cls(db_path=os.getenv("METRICS_DB_PATH", "./tmp/metrics.db"))
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rollups (
+                    granularity TEXT NOT NULL,
+                    bucket_start INTEGER NOT NULL,
+                    runs INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    system_retries INTEGER NOT NULL,
+                    business_retries INTEGER NOT NULL,
+                    statuses TEXT NOT NULL,
+                    durations TEXT NOT NULL,
+                    PRIMARY KEY (granularity, bucket_start)
+                ) WITHOUT ROWID
+                """
+            )
+
+    @staticmethod
+    def _row_to_bucket(row: sqlite3.Row) -> RollupBucket:
+        return RollupBucket(
+            granularity=row["granularity"],
+            start=row["bucket_start"],
+            runs=row["runs"],
+            prompt_tokens=row["prompt_tokens"],
+            completion_tokens=row["completion_tokens"],
+            system_retries=row["system_retries"],
+            business_retries=row["business_retries"],
+            statuses=json.loads(row["statuses"]),
+            durations=LogHistogram.from_dict(json.loads(row["durations"])),
+        )
+
+    def record_run(self, summary: Dict[str, Any], finished_at: Optional[float] = None):
+        """
+        把一次运行摘要计入各粒度的桶
+
+        Args:
+            summary: ExecutionMonitor.get_summary() 格式的摘要
+            finished_at: 归属时间戳，默认取摘要中的结束时间，没有则取当前时间
+        """
+        if finished_at is None:
+            end_time = summary.get("execution", {}).get("end_time")
+            finished_at = datetime.fromisoformat(end_time).timestamp() if end_time else time.time()
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for granularity in RETENTION:
+                    start = bucket_start(finished_at, granularity)
+                    row = self._conn.execute(
+                        "SELECT * FROM rollups WHERE granularity = ? AND bucket_start = ?",
+                        (granularity, start),
+                    ).fetchone()
+                    bucket = self._row_to_bucket(row) if row else RollupBucket(granularity=granularity, start=start)
+                    bucket.add_run(summary)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            granularity, start, bucket.runs,
+                            bucket.prompt_tokens, bucket.completion_tokens,
+                            bucket.system_retries, bucket.business_retries,
+                            json.dumps(bucket.statuses), json.dumps(bucket.durations.to_dict()),
+                        ),
+                    )
+                self._prune(finished_at)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _prune(self, now: float):
+        for granularity, retention in RETENTION.items():
+            if retention:
+                self._conn.execute(
+                    "DELETE FROM rollups WHERE granularity = ? AND bucket_start < ?",
+                    (granularity, int(now - retention)),
+                )
+
+    def query(self, granularity: str, since: float, until: Optional[float] = None) -> List[RollupBucket]:
+        """
+        读取时间范围内的桶（按时间升序，没有运行的时间段不返回）
+
+        Args:
+            granularity: "minute" / "hour" / "day"
+            since: 起始时间戳（包含所在的桶）
+            until: 结束时间戳（不含），默认不限
+        """
+        params: List[Any] = [granularity, bucket_start(since, granularity)]
+        sql = "SELECT * FROM rollups WHERE granularity = ? AND bucket_start >= ?"
+        if until is not None:
+            sql += " AND bucket_start < ?"
+            params.append(int(until))
+        sql += " ORDER BY bucket_start"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_bucket(r) for r in rows]
+
+    def daily_tokens(self, days: int) -> List[Dict[str, Any]]:
+        """
+        最近 days 天（含今天）每天的Token消耗，没有运行的日期补0
+
+        Returns:
+            [{"date": datetime, "tokens": int}, ...]
+        """
+        today = datetime.fromtimestamp(bucket_start(time.time(), "day"))
+        first = today - timedelta(days=days - 1)
+        by_start = {b.start: b.total_tokens for b in self.query("day", first.timestamp())}
+        result = []
+        for i in range(days):
+            day = first + timedelta(days=i)
+            result.append({"date": day, "tokens": by_start.get(int(day.timestamp()), 0)})
+        return result
+
+    def aggregate(self, days: int) -> RollupBucket:
+        """合并最近 days 天的天桶，得到该范围内的总计与耗时分布"""
+        today = datetime.fromtimestamp(bucket_start(time.time(), "day"))
+        first = today - timedelta(days=days - 1)
+        total = RollupBucket(granularity="range", start=int(first.timestamp()))
+        for bucket in self.query("day", first.timestamp()):
+            total.runs += bucket.runs
+            total.prompt_tokens += bucket.prompt_tokens
+            total.completion_tokens += bucket.completion_tokens
+            total.system_retries += bucket.system_retries
+            total.business_retries += bucket.business_retries
+            for status, count in bucket.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+            total.durations.merge(bucket.durations)
+        return total
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
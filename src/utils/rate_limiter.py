@@ -0,0 +1,272 @@
+"""
+LLM限流 - Rate Limiter
+按 provider/model 在进程内共享令牌桶，同时限制每分钟请求数（RPM）与每分钟Token数（TPM）：
+发送前按提示词长度预估Token并排队等待额度，多个运行之间轮转出队，让并发Agent平滑地使用配额而不是撞上429再重试
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from src.utils import telemetry
+
+logger = logging.getLogger(__name__)
+
+# 每张图片按高分辨率截图的大致Token数预估
+IMAGE_TOKENS = 1100
+# 每条消息的格式开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    """
+    预估提示词Token数（宁多勿少）
+
+    文本按UTF-8字节数/3估算：英文约每4字符1个Token会略微高估，中文约每字1个Token；图片按 IMAGE_TOKENS 计
+    """
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        content = message.content
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, str):
+                total += len(part.encode("utf-8")) // 3
+            elif isinstance(part, dict):
+                if part.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+                else:
+                    total += len(str(part.get("text", "")).encode("utf-8")) // 3
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            total += len(str(tool_calls).encode("utf-8")) // 3
+    return total
+
+
+class TokenBucket:
+    """按分钟速率匀速补充的令牌桶"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            per_minute: 每分钟补充量
+            capacity: 桶容量（允许的突发量），默认等于每分钟补充量
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: Optional[float] = None) -> float:
+        """距离可以取出 amount 还需等待的秒数（超过容量的请求等到桶满即可放行）"""
+        self._refill(now or time.monotonic())
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def consume(self, amount: float):
+        """取出额度（可以透支为负，之后的请求等待补回）"""
+        self._refill(time.monotonic())
+        self.level -= amount
+
+    def refund(self, amount: float):
+        self._refill(time.monotonic())
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class _Waiter:
+    tokens: int
+    future: asyncio.Future
+
+
+class RateLimiter:
+    """
+    一个 provider/model 的共享限流器
+
+    排队按运行（run_id）分组，每次放行后该运行移到队尾，单个运行的突发调用不会饿死其他运行
+    """
+
+    def __init__(self, name: str, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        """
+        Args:
+            name: 限流器名称（配置中的 provider 或 provider:model）
+            rpm: 每分钟请求数上限，None 表示不限
+            tpm: 每分钟Token数上限（提示词+输出），None 表示不限
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for queue in self._queues.values() for w in queue if not w.future.done())
+
+    def _wait_time(self, tokens: int) -> float:
+        now = time.monotonic()
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def _consume(self, tokens: int):
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(tokens)
+
+    def settle(self, estimated: int, actual: int):
+        """用实际Token数修正预估值（少用的额度退回，多用的额度透支）"""
+        if self.tokens is None or actual == estimated:
+            return
+        if actual > estimated:
+            self.tokens.consume(actual - estimated)
+        else:
+            self.tokens.refund(estimated - actual)
+
+    def _dispatch(self):
+        """按运行轮转放行队首请求；额度不足时按最早可放行时间定时重试"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queues:
+            run_id, queue = next(iter(self._queues.items()))
+            while queue and queue[0].future.done():
+                queue.popleft()
+            if not queue:
+                del self._queues[run_id]
+                continue
+            waiter = queue[0]
+            wait = self._wait_time(waiter.tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            queue.popleft()
+            self._consume(waiter.tokens)
+            waiter.future.set_result(None)
+            del self._queues[run_id]
+            if queue:
+                self._queues[run_id] = queue
+
+    async def acquire(self, tokens: int, run_id: str = "default") -> float:
+        """
+        等待一次请求的额度
+
+        Args:
+            tokens: 预估Token数（提示词+输出预留）
+            run_id: 所属运行，用于运行间公平排队
+
+        Returns:
+            排队等待的秒数
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        waiter = _Waiter(tokens=tokens, future=loop.create_future())
+        self._queues.setdefault(run_id, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已放行但调用方被取消：退回额度
+                self.settle(tokens, 0)
+                if self.requests is not None:
+                    self.requests.refund(1)
+            self._dispatch()
+            raise
+        return loop.time() - started
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """
+    解析限流配置
+
+    格式: "zkh=600/400000,openai:gpt-4o=500/30000,deepseek=/1000000"（provider[:model]=RPM/TPM，留空表示不限）
+    """
+    limits: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        try:
+            limits[key.strip()] = (int(rpm) if rpm.strip() else None, int(tpm) if tpm.strip() else None)
+        except ValueError:
+            logger.error(f"Invalid LLM_RATE_LIMITS entry '{item}', expected provider[:model]=RPM/TPM")
+    return limits
+
+
+_limits: Optional[Dict[str, Tuple[Optional[int], Optional[int]]]] = None
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(provider: str, model: str) -> Optional[RateLimiter]:
+    """
+    获取 provider/model 对应的共享限流器（LLM_RATE_LIMITS 未配置时返回 None）
+
+    provider:model 的规则优先；只配置了 provider 时该供应商的所有模型共享一个限流器
+    """
+    global _limits
+    if _limits is None:
+        _limits = parse_rate_limits(os.getenv("LLM_RATE_LIMITS", ""))
+    for key in (f"{provider}:{model}", provider):
+        if key in _limits:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                rpm, tpm = _limits[key]
+                limiter = _limiters[key] = RateLimiter(key, rpm=rpm, tpm=tpm)
+            return limiter
+    return None
+
+
+class Reservation:
+    """一次已放行请求的额度，调用完成后用实际Token数结算"""
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, estimated: int = 0):
+        self.limiter = limiter
+        self.estimated = estimated
+        self._settled = False
+
+    def settle(self, actual_tokens: int):
+        """用实际Token数（提示词+输出）结算，只生效一次"""
+        if self.limiter is not None and not self._settled:
+            self.limiter.settle(self.estimated, actual_tokens)
+        self._settled = True
+
+    def release(self):
+        """调用结束时释放：未结算（例如调用失败）则退回预估的Token额度"""
+        self.settle(0)
+
+
+async def acquire_llm_quota(provider: str, model: str, messages: Sequence[BaseMessage],
+                            run_id: str = "default") -> Reservation:
+    """
+    为一次LLM调用等待限流额度（未配置对应规则时立即返回）
+
+    调用方拿到响应后调用 reservation.settle(实际Token数)，并在 finally 中调用 reservation.release()
+    """
+    limiter = get_rate_limiter(provider, model)
+    if limiter is None:
+        return Reservation()
+    estimated = estimate_tokens(messages) + int(os.getenv("LLM_RATE_COMPLETION_RESERVE", "512"))
+    telemetry.set_rate_limit_queue(limiter.name, limiter.queued + 1)
+    try:
+        waited = await limiter.acquire(estimated, run_id=run_id)
+    finally:
+        telemetry.set_rate_limit_queue(limiter.name, limiter.queued)
+    telemetry.observe_rate_limit_wait(limiter.name, waited)
+    if waited > 1:
+        logger.info(f"Rate limiter {limiter.name}: waited {waited:.2f}s for quota (run={run_id})")
+    return Reservation(limiter, estimated)
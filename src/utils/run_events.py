@@ -0,0 +1,124 @@
+"""
+运行事件 - Run Events
+Agent、ExecutionMonitor、TokenTrackingLLM 与 WebUI 回调把运行中的变化发布到一个 asyncio 队列，
+界面的生成器只在有事件时更新，不再每100ms轮询一次：
+
+- 空闲时不消耗任何资源，事件到达后立即处理
+- 合并突发：一批事件按类型合并（同类型只保留最新的数据），两批之间至少间隔 min_interval 秒
+- 可以在其他线程中发布（转交事件循环处理）
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EVENT_STEP = "step"              # 步骤结束
+EVENT_TOKENS = "tokens"          # Token/费用更新
+EVENT_RETRY = "retry"            # 记录了一次重试
+EVENT_MESSAGE = "message"        # 聊天记录新增消息
+EVENT_HELP = "help"              # Agent 请求人工协助
+EVENT_PAUSED = "paused"
+EVENT_RESUMED = "resumed"
+EVENT_STOPPED = "stopped"
+EVENT_DONE = "done"              # 运行结束（任务完成、失败或被取消）
+
+
+class RunEvents:
+    """
+    一次运行的事件队列（一个消费者）
+    """
+
+    def __init__(self, min_interval: float = 0.05):
+        """
+        Args:
+            min_interval: 两批事件之间的最小间隔（秒），间隔内到达的事件合并为一批
+        """
+        self.min_interval = min_interval
+        self.published = 0
+        self.batches = 0
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_batch_at = 0.0
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+
+    def publish(self, kind: str, data: Any = None):
+        """发布一个事件（不阻塞）"""
+        self.published += 1
+        loop = self._loop
+        if loop is None:
+            self._queue.put_nowait((kind, data))
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._queue.put_nowait((kind, data))
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._queue.put_nowait, (kind, data))
+
+    async def next_batch(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        等待下一批事件
+
+        Args:
+            timeout: 等待第一个事件的超时（秒），None 表示一直等待
+
+        Returns:
+            {事件类型: 该类型最新的数据}；超时时为空字典
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        try:
+            kind, data = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return {}
+        batch = {kind: data}
+        # 上一批刚处理完时稍等片刻，让同一突发中的事件合并进来
+        wait = self._last_batch_at + self.min_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        while not self._queue.empty():
+            kind, data = self._queue.get_nowait()
+            batch[kind] = data
+        self._last_batch_at = time.monotonic()
+        self.batches += 1
+        return batch
+
+
+# 当前运行的事件队列：WebUI 在运行上下文中设置，监控器、LLM包装器与 Agent 从这里取得
+_current_run_events: ContextVar[Optional[RunEvents]] = ContextVar("current_run_events", default=None)
+
+
+def get_current_run_events() -> Optional[RunEvents]:
+    """获取当前上下文的运行事件队列"""
+    return _current_run_events.get()
+
+
+def set_current_run_events(events: Optional[RunEvents]):
+    """
+    设置当前上下文的运行事件队列
+
+    Returns:
+        用于 reset_current_run_events 的token
+    """
+    return _current_run_events.set(events)
+
+
+def reset_current_run_events(token):
+    """恢复设置之前的事件队列"""
+    _current_run_events.reset(token)
+
+
+def publish_run_event(kind: str, data: Any = None):
+    """向当前上下文的事件队列发布事件；没有队列时不做任何事"""
+    events = _current_run_events.get()
+    if events is not None:
+        events.publish(kind, data)
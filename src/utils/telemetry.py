@@ -0,0 +1,335 @@
+"""
+遥测导出 - Telemetry
+把 ExecutionMonitor 与 TokenTrackingLLM 的数据导出为 Prometheus 指标，并可选输出 OTLP 链路（run → step → LLM调用 → 动作）
+
+两者都是可选依赖：
+- 未安装 prometheus_client 时指标调用为空操作，/metrics 返回 503
+- 未设置 OTEL_EXPORTER_OTLP_ENDPOINT 或未安装 opentelemetry-sdk / OTLP exporter 时不产生链路
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import prometheus_client
+except ImportError:  # 可选依赖
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+
+# 直方图桶（秒）：运行按分钟级SLO，步骤/阶段/LLM按秒级SLO
+RUN_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+STEP_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+RUN_LABELS = ("agent", "provider", "model")
+
+
+class _Metrics:
+    """Prometheus 指标集合"""
+
+    def __init__(self, registry):
+        Counter, Gauge, Histogram = prometheus_client.Counter, prometheus_client.Gauge, prometheus_client.Histogram
+        self.runs = Counter(
+            "webui_agent_runs", "Agent runs by final status",
+            RUN_LABELS + ("status",), registry=registry,
+        )
+        self.run_duration = Histogram(
+            "webui_agent_run_duration_seconds", "Agent run wall time",
+            RUN_LABELS + ("status",), buckets=RUN_BUCKETS, registry=registry,
+        )
+        self.steps = Counter(
+            "webui_agent_steps", "Agent steps by outcome",
+            RUN_LABELS + ("status",), registry=registry,
+        )
+        self.step_duration = Histogram(
+            "webui_agent_step_duration_seconds", "Agent step wall time",
+            RUN_LABELS, buckets=STEP_BUCKETS, registry=registry,
+        )
+        self.phase_duration = Histogram(
+            "webui_agent_phase_duration_seconds", "Exclusive time per step phase (dom, screenshot, llm, action:*)",
+            ("agent", "phase"), buckets=PHASE_BUCKETS, registry=registry,
+        )
+        self.retries = Counter(
+            "webui_agent_retries", "Agent retries by type (system/business)",
+            ("agent", "type"), registry=registry,
+        )
+        self.llm_tokens = Counter(
+            "webui_llm_tokens", "LLM tokens by direction",
+            ("provider", "model", "type"), registry=registry,
+        )
+        self.llm_requests = Counter(
+            "webui_llm_requests", "LLM calls by outcome",
+            ("provider", "model", "status"), registry=registry,
+        )
+        self.llm_duration = Histogram(
+            "webui_llm_request_duration_seconds", "LLM call latency",
+            ("provider", "model"), buckets=PHASE_BUCKETS, registry=registry,
+        )
+        self.compaction_saved = Counter(
+            "webui_agent_compaction_saved_tokens", "Prompt tokens removed by message history compaction",
+            ("agent",), registry=registry,
+        )
+        self.llm_cost = Counter(
+            "webui_llm_cost", "LLM cost by model (price table currency, see budget.DEFAULT_PRICES)",
+            ("provider", "model"), registry=registry,
+        )
+        self.budget_events = Counter(
+            "webui_budget_events", "Runs crossing a soft/hard budget limit",
+            ("scope", "level"), registry=registry,
+        )
+        self.llm_cache = Counter(
+            "webui_llm_cache_lookups", "LLM response cache lookups",
+            ("result",), registry=registry,
+        )
+        self.http_in_flight = Gauge(
+            "webui_llm_http_in_flight", "In-flight requests on a shared LLM HTTP pool",
+            ("provider", "base_url"), registry=registry,
+        )
+        self.http_connections = Gauge(
+            "webui_llm_http_connections", "Connections in a shared LLM HTTP pool",
+            ("provider", "base_url", "state"), registry=registry,
+        )
+        self.http_saturation = Gauge(
+            "webui_llm_http_saturation", "In-flight requests / max connections of a shared LLM HTTP pool",
+            ("provider", "base_url"), registry=registry,
+        )
+        self.rate_limit_wait = Histogram(
+            "webui_llm_rate_limit_wait_seconds", "Time an LLM call queued for rate limit quota",
+            ("limiter",), buckets=PHASE_BUCKETS, registry=registry,
+        )
+        self.rate_limit_queued = Gauge(
+            "webui_llm_rate_limit_queued", "LLM calls waiting for rate limit quota",
+            ("limiter",), registry=registry,
+        )
+        self.api_jobs = Gauge(
+            "webui_api_jobs", "API job engine load",
+            ("state",), registry=registry,
+        )
+
+
+_metrics: Optional[_Metrics] = _Metrics(prometheus_client.REGISTRY) if prometheus_client else None
+
+
+def metrics_enabled() -> bool:
+    """是否可以导出 Prometheus 指标"""
+    return _metrics is not None
+
+
+def llm_labels(llm: Any, provider: Optional[str] = None) -> Tuple[str, str]:
+    """
+    从LLM实例推断 (provider, model) 标签
+
+    Args:
+        llm: LLM实例（TokenTrackingLLM 会解包到被包装的模型）
+        provider: 显式指定的提供商名，如 "openai" / "ollama"
+    """
+    provider = provider or getattr(llm, "provider", None)
+    inner = getattr(llm, "wrapped_llm", None) or llm
+    if not provider:
+        try:
+            provider = inner._llm_type
+        except Exception:
+            provider = None
+    model = getattr(inner, "model_name", None) or getattr(inner, "model", None)
+    return str(provider or UNKNOWN), str(model or UNKNOWN)
+
+
+def run_labels(agent: Optional[str] = None, llm: Any = None) -> Dict[str, str]:
+    """构造运行级标签 {"agent", "provider", "model"}"""
+    provider, model = llm_labels(llm) if llm is not None else (UNKNOWN, UNKNOWN)
+    return {"agent": agent or UNKNOWN, "provider": provider, "model": model}
+
+
+def _run_label_values(labels: Optional[Dict[str, str]]) -> Tuple[str, ...]:
+    labels = labels or {}
+    return tuple(labels.get(name) or UNKNOWN for name in RUN_LABELS)
+
+
+def observe_run(labels: Optional[Dict[str, str]], status: str, duration: float):
+    """记录一次运行结束"""
+    if _metrics is None:
+        return
+    values = _run_label_values(labels) + (status,)
+    _metrics.runs.labels(*values).inc()
+    _metrics.run_duration.labels(*values).observe(duration)
+
+
+def observe_step(labels: Optional[Dict[str, str]], duration: float, success: bool):
+    """记录一个步骤结束"""
+    if _metrics is None:
+        return
+    values = _run_label_values(labels)
+    _metrics.steps.labels(*values, "success" if success else "failed").inc()
+    _metrics.step_duration.labels(*values).observe(duration)
+
+
+def observe_phase(labels: Optional[Dict[str, str]], phase: str, duration: float):
+    """记录一个阶段的独占耗时"""
+    if _metrics is None:
+        return
+    _metrics.phase_duration.labels((labels or {}).get("agent") or UNKNOWN, phase).observe(duration)
+
+
+def observe_retry(labels: Optional[Dict[str, str]], retry_type: str):
+    """记录一次重试"""
+    if _metrics is None:
+        return
+    _metrics.retries.labels((labels or {}).get("agent") or UNKNOWN, retry_type).inc()
+
+
+def observe_compaction(labels: Optional[Dict[str, str]], saved_tokens: int):
+    """记录一次消息历史压缩节省的Token"""
+    if _metrics is None:
+        return
+    _metrics.compaction_saved.labels((labels or {}).get("agent") or UNKNOWN).inc(saved_tokens)
+
+
+def observe_llm_tokens(provider: str, model: str, prompt_tokens: int, completion_tokens: int):
+    """记录一次LLM调用的Token消耗"""
+    if _metrics is None:
+        return
+    if prompt_tokens:
+        _metrics.llm_tokens.labels(provider, model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        _metrics.llm_tokens.labels(provider, model, "completion").inc(completion_tokens)
+
+
+def observe_llm_request(provider: str, model: str, duration: float, success: bool = True):
+    """记录一次LLM调用的耗时与结果"""
+    if _metrics is None:
+        return
+    _metrics.llm_requests.labels(provider, model, "success" if success else "error").inc()
+    _metrics.llm_duration.labels(provider, model).observe(duration)
+
+
+def observe_llm_cost(provider: str, model: str, cost: float):
+    """记录一次LLM调用的费用"""
+    if _metrics is None or cost <= 0:
+        return
+    _metrics.llm_cost.labels(provider, model).inc(cost)
+
+
+def observe_budget_event(scope: str, level: str):
+    """记录一次越过预算限制（scope: run/tenant/daily, level: soft/hard）"""
+    if _metrics is None:
+        return
+    _metrics.budget_events.labels(scope, level).inc()
+
+
+def observe_llm_cache(hit: bool):
+    """记录一次LLM响应缓存查询"""
+    if _metrics is None:
+        return
+    _metrics.llm_cache.labels("hit" if hit else "miss").inc()
+
+
+def observe_rate_limit_wait(limiter: str, duration: float):
+    """记录一次LLM调用等待限流额度的时长"""
+    if _metrics is None:
+        return
+    _metrics.rate_limit_wait.labels(limiter).observe(duration)
+
+
+def set_rate_limit_queue(limiter: str, queued: int):
+    """更新等待限流额度的调用数"""
+    if _metrics is None:
+        return
+    _metrics.rate_limit_queued.labels(limiter).set(queued)
+
+
+def set_job_counts(running: int, queued: int):
+    """更新API执行引擎的负载"""
+    if _metrics is None:
+        return
+    _metrics.api_jobs.labels("running").set(running)
+    _metrics.api_jobs.labels("queued").set(queued)
+
+
+def set_http_pool_stats(pools: List[Dict[str, Any]]):
+    """更新共享HTTP连接池的负载（http_client_pool.get_http_pool_stats() 格式）"""
+    if _metrics is None:
+        return
+    for pool in pools:
+        labels = (pool["provider"], pool["baseUrl"])
+        _metrics.http_in_flight.labels(*labels).set(pool["inFlight"])
+        _metrics.http_saturation.labels(*labels).set(pool["saturation"])
+        _metrics.http_connections.labels(*labels, "open").set(pool["openConnections"])
+        _metrics.http_connections.labels(*labels, "idle").set(pool["idleConnections"])
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    以 Prometheus 文本格式输出全部指标
+
+    Returns:
+        (内容, Content-Type)
+
+    Raises:
+        RuntimeError: 未安装 prometheus_client
+    """
+    if prometheus_client is None:
+        raise RuntimeError("prometheus_client is not installed")
+    return prometheus_client.generate_latest(prometheus_client.REGISTRY), prometheus_client.CONTENT_TYPE_LATEST
+
+
+# =============================================================================
+# 链路追踪（OTLP）
+# =============================================================================
+
+_tracer: Any = None
+_tracing_initialized = False
+_tracing_lock = threading.Lock()
+
+
+def _init_tracing() -> Any:
+    """按环境变量初始化 OTLP 导出（只执行一次），返回 tracer 或 None"""
+    global _tracer, _tracing_initialized
+    with _tracing_lock:
+        if _tracing_initialized:
+            return _tracer
+        _tracing_initialized = True
+        if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            return None
+        try:
+            from opentelemetry import trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            except ImportError:
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            logger.warning(f"OTEL_EXPORTER_OTLP_ENDPOINT is set but OpenTelemetry SDK/exporter is missing: {e}")
+            return None
+
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "web-ui-auto")})
+        )
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer("web-ui-auto")
+        logger.info(f"OTLP tracing enabled: endpoint={os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')}")
+        return _tracer
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """
+    在当前链路下开启一个子span；未启用链路追踪时不做任何事
+
+    Args:
+        name: span名，如 "agent.run" / "agent.step" / "agent.llm"
+        attributes: span属性
+    """
+    tracer = _tracer if _tracing_initialized else _init_tracing()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
@@ -2,17 +2,65 @@
 Token追踪LLM包装器
 用于捕获LLM调用的真实token使用情况
 """
+import asyncio
 import logging
-from typing import Any, Optional, List
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 
 from pydantic import Field, ConfigDict
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import BaseMessage, AIMessage
-from langchain_core.outputs import ChatResult
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from src.utils import telemetry
+from src.utils.budget import get_current_budget
+from src.utils.execution_monitor import get_current_monitor, get_current_token_usage, monitor_phase
+from src.utils.llm_cache import LLMCacheBackend, dump_result, get_llm_cache, load_result, make_cache_key
+from src.utils.rate_limiter import acquire_llm_quota
+from src.utils.run_events import EVENT_TOKENS, publish_run_event
 
 logger = logging.getLogger(__name__)
 
 
+class _StreamStats:
+    """一次流式调用的计时与用量汇总"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.token_chunks = 0
+        # 阻塞等待模型返回数据块的累计时间（不含调用方处理数据块的时间）
+        self.waiting = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+    
+    def add(self, chunk: ChatGenerationChunk, waited: float):
+        self.waiting += waited
+        message = chunk.message
+        if message.content or getattr(message, "tool_call_chunks", None):
+            now = time.perf_counter()
+            if self.first_token_at is None:
+                self.first_token_at = now
+            self.last_token_at = now
+            self.token_chunks += 1
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens += usage.get("input_tokens", 0)
+            self.completion_tokens += usage.get("output_tokens", 0)
+    
+    @property
+    def first_token_latency(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started
+    
+    @property
+    def inter_token_latency(self) -> Optional[float]:
+        """相邻内容块之间的平均间隔"""
+        if self.token_chunks < 2:
+            return None
+        return (self.last_token_at - self.first_token_at) / (self.token_chunks - 1)
+
+
 class TokenTrackingLLM(BaseChatModel):
     """
     LLM包装器，用于追踪token使用情况
@@ -25,22 +73,33 @@ class TokenTrackingLLM(BaseChatModel):
     
     wrapped_llm: Any = Field(default=None, exclude=True)
     token_callback: Optional[Any] = Field(default=None, exclude=True)
+    provider: Optional[str] = Field(default=None, exclude=True)
+    response_cache: Optional[Any] = Field(default=None, exclude=True)
     
     model_config = ConfigDict(
         arbitrary_types_allowed=True,
         extra='allow'
     )
     
-    def __init__(self, llm: BaseChatModel, token_callback: Optional[callable] = None, **kwargs):
+    def __init__(self, llm: BaseChatModel, token_callback: Optional[callable] = None,
+                 provider: Optional[str] = None, response_cache: Optional[LLMCacheBackend] = None, **kwargs):
         """
         初始化Token追踪LLM
         
         Args:
             llm: 被包装的LLM实例
             token_callback: token使用回调函数，签名为 (prompt_tokens, completion_tokens) -> None
+            provider: 提供商名（指标标签），默认取被包装模型的 _llm_type
+            response_cache: 响应缓存后端，默认按 LLM_CACHE 环境变量取进程共享的缓存（未启用则不缓存）
         """
         # 调用父类初始化
-        super().__init__(wrapped_llm=llm, token_callback=token_callback, **kwargs)
+        super().__init__(
+            wrapped_llm=llm,
+            token_callback=token_callback,
+            provider=provider,
+            response_cache=response_cache if response_cache is not None else get_llm_cache(),
+            **kwargs,
+        )
     
     def _extract_token_usage(self, response: AIMessage) -> tuple[int, int]:
         """
@@ -85,7 +144,26 @@ class TokenTrackingLLM(BaseChatModel):
         return prompt_tokens, completion_tokens
     
     def _notify_token_usage(self, prompt_tokens: int, completion_tokens: int):
-        """通知token使用情况"""
+        """
+        记录并通知token使用情况
+        
+        记到当前上下文的运行级Token账户与执行监控器（两者共享同一账户时只记一次），并发运行之间互不混淆；
+        有预算控制器时按价格表计入费用
+        """
+        labels = telemetry.llm_labels(self)
+        telemetry.observe_llm_tokens(*labels, prompt_tokens, completion_tokens)
+        budget = get_current_budget()
+        if budget is not None:
+            budget.record(*labels, prompt_tokens, completion_tokens)
+        usage = get_current_token_usage()
+        if usage is not None:
+            usage.add(prompt=prompt_tokens, completion=completion_tokens)
+        monitor = get_current_monitor()
+        if monitor is not None and monitor.token_usage is not usage:
+            monitor.record_tokens(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        else:
+            # 监控器记录时自己发布；否则在这里通知界面Token与费用已更新
+            publish_run_event(EVENT_TOKENS, usage.total_tokens if usage is not None else None)
         if self.token_callback and (prompt_tokens > 0 or completion_tokens > 0):
             try:
                 self.token_callback(prompt_tokens, completion_tokens)
@@ -93,10 +171,82 @@ class TokenTrackingLLM(BaseChatModel):
             except Exception as e:
                 logger.error(f"Error in token callback: {e}", exc_info=True)
     
+    def _cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Optional[str]:
+        """
+        计算缓存键；未启用缓存或 temperature 不为0（输出不确定）时返回 None
+        """
+        if self.response_cache is None:
+            return None
+        temperature = kwargs.get("temperature", getattr(self.wrapped_llm, "temperature", None))
+        if temperature != 0:
+            return None
+        provider, model = telemetry.llm_labels(self)
+        return make_cache_key(messages, f"{provider}/{model}", {"stop": stop, **kwargs})
+    
+    def _cache_get(self, key: Optional[str]) -> Optional[ChatResult]:
+        """查询缓存并把命中/未命中计入当前监控器"""
+        if key is None:
+            return None
+        return self._cache_lookup_result(self.response_cache.get(key))
+    
+    async def _acache_get(self, key: Optional[str]) -> Optional[ChatResult]:
+        """异步路径的缓存查询：阻塞的后端（SQLite）在线程中读取，不阻塞事件循环"""
+        if key is None:
+            return None
+        if self.response_cache.blocking:
+            value = await asyncio.to_thread(self.response_cache.get, key)
+        else:
+            value = self.response_cache.get(key)
+        return self._cache_lookup_result(value)
+    
+    def _cache_lookup_result(self, value: Optional[str]) -> Optional[ChatResult]:
+        hit = value is not None
+        monitor = get_current_monitor()
+        if monitor is not None:
+            monitor.record_cache_lookup(hit)
+        telemetry.observe_llm_cache(hit)
+        if not hit:
+            return None
+        try:
+            return load_result(value)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable LLM cache entry: {e}")
+            return None
+    
+    def _cache_put(self, key: Optional[str], result: ChatResult):
+        if key is None:
+            return
+        try:
+            self.response_cache.set(key, dump_result(result))
+        except Exception as e:
+            logger.warning(f"Failed to store LLM response in cache: {e}")
+    
+    async def _acache_put(self, key: Optional[str], result: ChatResult):
+        if key is None:
+            return
+        try:
+            if self.response_cache.blocking:
+                await asyncio.to_thread(self.response_cache.set, key, dump_result(result))
+            else:
+                self.response_cache.set(key, dump_result(result))
+        except Exception as e:
+            logger.warning(f"Failed to store LLM response in cache: {e}")
+    
     def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, 
                   run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
         """同步生成（拦截并追踪token）"""
-        result = self.wrapped_llm._generate(messages, stop, run_manager, **kwargs)
+        cache_key = self._cache_key(messages, stop, kwargs)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        try:
+            with monitor_phase("llm"):
+                result = self.wrapped_llm._generate(messages, stop, run_manager, **kwargs)
+        except Exception:
+            telemetry.observe_llm_request(*telemetry.llm_labels(self), time.perf_counter() - started, success=False)
+            raise
+        self._record_first_token_latency(time.perf_counter() - started, result)
         
         # 提取token使用情况
         if result.generations and result.generations[0]:
@@ -105,22 +255,147 @@ class TokenTrackingLLM(BaseChatModel):
                 prompt_tokens, completion_tokens = self._extract_token_usage(message)
                 self._notify_token_usage(prompt_tokens, completion_tokens)
         
+        self._cache_put(cache_key, result)
         return result
     
     async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
                         run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
         """异步生成（拦截并追踪token）"""
-        result = await self.wrapped_llm._agenerate(messages, stop, run_manager, **kwargs)
-        
-        # 提取token使用情况
-        if result.generations and result.generations[0]:
-            message = result.generations[0].message
-            if isinstance(message, AIMessage):
-                prompt_tokens, completion_tokens = self._extract_token_usage(message)
-                self._notify_token_usage(prompt_tokens, completion_tokens)
+        cache_key = self._cache_key(messages, stop, kwargs)
+        cached = await self._acache_get(cache_key)
+        if cached is not None:
+            return cached
+        monitor = get_current_monitor()
+        run_id = monitor.task_id if monitor is not None else "default"
+        # 共享限流：未配置 LLM_RATE_LIMITS 时直接放行
+        with monitor_phase("rate_limit"):
+            reservation = await acquire_llm_quota(*telemetry.llm_labels(self), messages, run_id=run_id)
+        try:
+            started = time.perf_counter()
+            try:
+                with monitor_phase("llm"):
+                    result = await self.wrapped_llm._agenerate(messages, stop, run_manager, **kwargs)
+            except Exception:
+                telemetry.observe_llm_request(*telemetry.llm_labels(self), time.perf_counter() - started, success=False)
+                raise
+            self._record_first_token_latency(time.perf_counter() - started, result)
+            
+            # 提取token使用情况
+            prompt_tokens = completion_tokens = 0
+            if result.generations and result.generations[0]:
+                message = result.generations[0].message
+                if isinstance(message, AIMessage):
+                    prompt_tokens, completion_tokens = self._extract_token_usage(message)
+                    self._notify_token_usage(prompt_tokens, completion_tokens)
+            # 响应中没有用量时保留预估值，否则整笔预估被退回、TPM限制形同虚设
+            reservation.settle(prompt_tokens + completion_tokens or reservation.estimated)
+        finally:
+            reservation.release()
         
+        await self._acache_put(cache_key, result)
         return result
     
+    def _should_stream(self, *, async_api: bool, run_manager: Optional[Any] = None, **kwargs: Any) -> bool:
+        """被包装的模型不支持（或禁用了）流式时，stream/astream 回退到 _generate/_agenerate"""
+        if self.wrapped_llm is None:
+            return False
+        return self.wrapped_llm._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+    
+    def _stream_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """OpenAI兼容模型默认不在流中返回用量，显式请求最后一块带上 usage_metadata"""
+        if "stream_usage" not in kwargs and "stream_usage" in type(self.wrapped_llm).model_fields:
+            return {**kwargs, "stream_usage": True}
+        return kwargs
+    
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[Any] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        """
+        同步流式生成：数据块到达即转发，不做缓冲
+        
+        新Token回调由外层 BaseChatModel.stream 触发，因此不把 run_manager 传给被包装的模型，避免重复回调
+        """
+        stats = _StreamStats()
+        chunks = self.wrapped_llm._stream(messages, stop, **self._stream_kwargs(kwargs))
+        failed = False
+        try:
+            while True:
+                waited = time.perf_counter()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                stats.add(chunk, time.perf_counter() - waited)
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            chunks.close()
+            self._finish_stream(stats, success=not failed)
+    
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[Any] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        """
+        异步流式生成：数据块到达即转发，不做缓冲
+        
+        与 _agenerate 一样先等待共享限流额度；流式调用不读写响应缓存
+        """
+        monitor = get_current_monitor()
+        run_id = monitor.task_id if monitor is not None else "default"
+        with monitor_phase("rate_limit"):
+            reservation = await acquire_llm_quota(*telemetry.llm_labels(self), messages, run_id=run_id)
+        stats = _StreamStats()
+        chunks = self.wrapped_llm._astream(messages, stop, **self._stream_kwargs(kwargs))
+        failed = False
+        try:
+            while True:
+                waited = time.perf_counter()
+                chunk = await anext(chunks, None)
+                if chunk is None:
+                    break
+                stats.add(chunk, time.perf_counter() - waited)
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            await chunks.aclose()
+            if not failed:
+                # 流中没有返回用量时保留预估值
+                reservation.settle(stats.prompt_tokens + stats.completion_tokens or reservation.estimated)
+            reservation.release()
+            self._finish_stream(stats, success=not failed)
+    
+    def _finish_stream(self, stats: _StreamStats, success: bool):
+        """
+        流结束（或被调用方提前关闭）时汇总：
+        等待模型的时间计入 llm 阶段，首Token延迟计入 llm_ttft，平均Token间延迟计入 llm_itl
+        """
+        labels = telemetry.llm_labels(self)
+        telemetry.observe_llm_request(*labels, time.perf_counter() - stats.started, success=success)
+        monitor = get_current_monitor()
+        if monitor is not None:
+            monitor.record_child_phase("llm", stats.waiting)
+            if stats.first_token_latency is not None:
+                monitor.record_phase("llm_ttft", stats.first_token_latency)
+            if stats.inter_token_latency is not None:
+                monitor.record_phase("llm_itl", stats.inter_token_latency)
+        if success and stats.prompt_tokens == 0 and stats.completion_tokens == 0:
+            logger.debug(f"Stream from {labels[0]}/{labels[1]} did not report usage_metadata")
+        self._notify_token_usage(stats.prompt_tokens, stats.completion_tokens)
+    
+    def _record_first_token_latency(self, latency: float, result: ChatResult):
+        """
+        记录首Token延迟，同时导出调用耗时指标
+        
+        被包装的模型在 llm_output["first_token_latency"] 中报告了首Token延迟（如流式的 DeepSeekR1ChatOpenAI）时使用该值；
+        否则整段响应一次返回，首Token延迟即总耗时
+        """
+        telemetry.observe_llm_request(*telemetry.llm_labels(self), latency)
+        first_token_latency = (result.llm_output or {}).get("first_token_latency")
+        monitor = get_current_monitor()
+        if monitor is not None:
+            monitor.record_phase("llm_ttft", latency if first_token_latency is None else first_token_latency)
+    
     @property
     def _llm_type(self) -> str:
         """返回LLM类型"""
@@ -172,7 +447,7 @@ class TokenTrackingLLM(BaseChatModel):
             return object.__getattribute__(self, name)
         
         # 避免在初始化过程中出错
-        if name in ('wrapped_llm', 'token_callback'):
+        if name in ('wrapped_llm', 'token_callback', 'provider', 'response_cache'):
             try:
                 return object.__getattribute__(self, name)
             except AttributeError:
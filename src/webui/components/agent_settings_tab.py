@@ -258,9 +258,9 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
         outputs=[planner_llm_model_name]
     )
 
-    async def update_wrapper(mcp_file):
+    async def update_wrapper(mcp_file, request: gr.Request):
         """Wrapper for handle_pause_resume."""
-        update_dict = await update_mcp_server(mcp_file, webui_manager)
+        update_dict = await update_mcp_server(mcp_file, webui_manager.get_session(request))
         yield update_dict
 
     mcp_json_file.change(
@@ -17,6 +17,10 @@ async def close_browser(webui_manager: WebuiManager):
         webui_manager.bu_current_task.cancel()
         webui_manager.bu_current_task = None
 
+    if webui_manager.bu_browser_lease:
+        logger.info("⚠️ Returning browser to pool when changing browser config.")
+        await webui_manager.release_browser_lease()
+
     if webui_manager.bu_browser_context:
         logger.info("⚠️ Closing browser context when changing browser config.")
         await webui_manager.bu_browser_context.close()
@@ -151,9 +155,9 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
     )
     webui_manager.add_components("browser_settings", tab_components)
 
-    async def close_wrapper():
+    async def close_wrapper(request: gr.Request):
         """Wrapper for handle_clear."""
-        await close_browser(webui_manager)
+        await close_browser(webui_manager.get_session(request))
 
     headless.change(close_wrapper)
     keep_browser_open.change(close_wrapper)
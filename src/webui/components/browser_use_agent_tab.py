@@ -1,4 +1,5 @@
 import asyncio
+import contextvars
 import json
 import logging
 import os
@@ -20,77 +21,33 @@ from langchain_core.language_models.chat_models import BaseChatModel
 
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
 from src.agent.browser_use.lmstudio_agent import LMStudioAgent
+from src.browser.browser_pool import get_browser_pool
+from src.browser.live_view import register_live_view, unregister_live_view
 from src.browser.custom_browser import CustomBrowser
 from src.controller.custom_controller import CustomController
 from src.utils import llm_provider
+from src.utils.artifact_store import get_artifact_store
+from src.utils.budget import BudgetGovernor, set_current_budget
+from src.utils.execution_monitor import TokenUsage, set_current_token_usage
+from src.utils.run_events import (
+    EVENT_DONE,
+    EVENT_HELP,
+    EVENT_MESSAGE,
+    EVENT_PAUSED,
+    EVENT_RESUMED,
+    EVENT_RETRY,
+    EVENT_STEP,
+    EVENT_TOKENS,
+    RunEvents,
+    publish_run_event,
+    set_current_run_events,
+)
 from src.utils.token_tracking_llm import TokenTrackingLLM
+from src.webui.webui_app import live_view_url
 from src.webui.webui_manager import WebuiManager
 
 logger = logging.getLogger(__name__)
 
-# 全局 Token 缓冲区，用于在 execution_monitor 创建之前临时存储 Token
-_pending_tokens = {"prompt_tokens": 0, "completion_tokens": 0}
-# 全局 webui_manager 引用，用于在回调中访问
-_webui_manager_ref = None
-
-
-def _set_webui_manager_ref(webui_manager: WebuiManager):
-    """设置全局 webui_manager 引用"""
-    global _webui_manager_ref
-    _webui_manager_ref = webui_manager
-
-
-def _record_token_usage(prompt_tokens: int, completion_tokens: int):
-    """
-    记录 Token 使用到 execution_monitor 或临时缓冲区
-    这个函数确保即使在 execution_monitor 创建之前的 Token 也能被统计
-    """
-    global _pending_tokens, _webui_manager_ref
-    
-    # 尝试记录到 execution_monitor
-    if _webui_manager_ref and hasattr(_webui_manager_ref, 'bu_agent') and _webui_manager_ref.bu_agent:
-        agent = _webui_manager_ref.bu_agent
-        if hasattr(agent, 'execution_monitor') and agent.execution_monitor:
-            # 先导入之前暂存的 Token
-            if _pending_tokens["prompt_tokens"] > 0 or _pending_tokens["completion_tokens"] > 0:
-                agent.execution_monitor.record_tokens(
-                    prompt_tokens=_pending_tokens["prompt_tokens"],
-                    completion_tokens=_pending_tokens["completion_tokens"]
-                )
-                logger.debug(f"Imported pending tokens: prompt={_pending_tokens['prompt_tokens']}, "
-                           f"completion={_pending_tokens['completion_tokens']}")
-                _pending_tokens = {"prompt_tokens": 0, "completion_tokens": 0}
-            
-            # 记录当前 Token
-            agent.execution_monitor.record_tokens(
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens
-            )
-            logger.debug(f"Real-time token recorded: prompt={prompt_tokens}, completion={completion_tokens}")
-            return True
-    
-    # 如果 execution_monitor 不存在，暂存到缓冲区
-    _pending_tokens["prompt_tokens"] += prompt_tokens
-    _pending_tokens["completion_tokens"] += completion_tokens
-    logger.debug(f"Token buffered (monitor not ready): prompt={prompt_tokens}, completion={completion_tokens}, "
-                f"total_pending: prompt={_pending_tokens['prompt_tokens']}, completion={_pending_tokens['completion_tokens']}")
-    return False
-
-
-def _import_pending_tokens_to_monitor(monitor):
-    """将暂存的 Token 导入到 execution_monitor"""
-    global _pending_tokens
-    if _pending_tokens["prompt_tokens"] > 0 or _pending_tokens["completion_tokens"] > 0:
-        monitor.record_tokens(
-            prompt_tokens=_pending_tokens["prompt_tokens"],
-            completion_tokens=_pending_tokens["completion_tokens"]
-        )
-        logger.info(f"Imported pending tokens to monitor: "
-                   f"prompt={_pending_tokens['prompt_tokens']}, "
-                   f"completion={_pending_tokens['completion_tokens']}")
-        _pending_tokens = {"prompt_tokens": 0, "completion_tokens": 0}
-
-
 # --- Helper Functions --- (Defined at module level)
 
 
@@ -214,30 +171,18 @@ async def _handle_new_step(
     # Token使用情况现在由TokenTrackingLLM自动记录，不需要在这里手动处理
 
     # --- Screenshot Handling ---
+    # 截图写入产物存储，聊天记录只引用URL：历史越长，每次推送的内容也不会随之膨胀
     screenshot_html = ""
-    # Ensure state.screenshot exists and is not empty before proceeding
-    # Use getattr for safer access
     screenshot_data = getattr(state, "screenshot", None)
     if screenshot_data:
         try:
-            # Basic validation: check if it looks like base64
-            if (
-                    isinstance(screenshot_data, str) and len(screenshot_data) > 100
-            ):  # Arbitrary length check
-                # *** UPDATED STYLE: Removed centering, adjusted width ***
-                img_tag = f'<img src="data:image/jpeg;base64,{screenshot_data}" alt="Step {step_num} Screenshot" style="max-width: 800px; max-height: 600px; object-fit:contain;" />'
-                screenshot_html = (
-                        img_tag + "<br/>"
-                )  # Use <br/> for line break after inline-block image
-            else:
-                logger.warning(
-                    f"Screenshot for step {step_num} seems invalid (type: {type(screenshot_data)}, len: {len(screenshot_data) if isinstance(screenshot_data, str) else 'N/A'})."
-                )
-                screenshot_html = "**[Invalid screenshot data]**<br/>"
-
+            store = get_artifact_store()
+            artifact = await asyncio.to_thread(store.put_base64, screenshot_data)
+            img_tag = f'<img src="{store.url(artifact)}" alt="Step {step_num} Screenshot" style="max-width: 800px; max-height: 600px; object-fit:contain;" />'
+            screenshot_html = img_tag + "<br/>"  # Use <br/> for line break after inline-block image
         except Exception as e:
             logger.error(
-                f"Error processing or formatting screenshot for step {step_num}: {e}",
+                f"Error storing screenshot for step {step_num}: {e}",
                 exc_info=True,
             )
             screenshot_html = "**[Error displaying screenshot]**<br/>"
@@ -259,8 +204,7 @@ async def _handle_new_step(
 
     # Append to the correct chat history list
     webui_manager.bu_chat_history.append(chat_message)
-
-    await asyncio.sleep(0.05)
+    publish_run_event(EVENT_MESSAGE)
 
 
 def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
@@ -298,6 +242,7 @@ def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
     webui_manager.bu_chat_history.append(
         {"role": "assistant", "content": final_summary}
     )
+    publish_run_event(EVENT_MESSAGE)
 
 
 async def _ask_assistant_callback(
@@ -320,6 +265,7 @@ async def _ask_assistant_callback(
     # Use state stored in webui_manager
     webui_manager.bu_response_event = asyncio.Event()
     webui_manager.bu_user_help_response = None  # Reset previous response
+    publish_run_event(EVENT_HELP)
 
     try:
         logger.info("Waiting for user response event...")
@@ -329,6 +275,8 @@ async def _ask_assistant_callback(
         logger.info("User response event received.")
     except asyncio.TimeoutError:
         logger.warning("Timeout waiting for user assistance.")
+        # 让界面结束等待回复、恢复运行状态
+        webui_manager.bu_response_event.set()
         webui_manager.bu_chat_history.append(
             {
                 "role": "assistant",
@@ -348,6 +296,14 @@ async def _ask_assistant_callback(
     return {"response": response}
 
 
+def _live_view_html(key: str) -> str:
+    """浏览器实时画面：<img> 直接显示 MJPEG 流"""
+    return (
+        f'<img src="{live_view_url(key)}" alt="Browser Live View" style="width:100%; height:60vh; '
+        'border:2px solid #e5e7eb; border-radius:12px; object-fit:contain; background:#fff;">'
+    )
+
+
 # --- Core Agent Execution Logic --- (Needs access to webui_manager)
 
 
@@ -356,8 +312,14 @@ async def run_agent_task(
 ) -> AsyncGenerator[Dict[gr.components.Component, Any], None]:
     """Handles the entire lifecycle of initializing and running the agent."""
 
-    # 设置全局 webui_manager 引用，供 Token 回调使用
-    _set_webui_manager_ref(webui_manager)
+    # 本次运行的上下文与Token账户：Agent初始化和运行中的LLM调用都在该上下文中执行，
+    # TokenTrackingLLM 把Token记到这个账户，ExecutionMonitor 共享它，并发运行之间互不混淆
+    run_context = contextvars.copy_context()
+    run_context.run(set_current_token_usage, TokenUsage())
+    budget = BudgetGovernor.from_env()
+    run_context.run(set_current_budget, budget)
+    run_events = RunEvents()
+    run_context.run(set_current_run_events, run_events)
 
     # --- Get Components ---
     # Need handles to specific UI components to update them
@@ -456,8 +418,8 @@ async def run_agent_task(
             planner_llm_api_key,
             planner_ollama_num_ctx if planner_llm_provider_name == "ollama" else None,
         )
-        # 使用相同的回调函数包装 planner_llm，确保 Token 被统计
-        planner_llm = TokenTrackingLLM(llm=_planner_llm, token_callback=token_usage_callback)
+        # 同样包装 planner_llm，Token 记到同一个运行账户
+        planner_llm = TokenTrackingLLM(llm=_planner_llm, provider=planner_llm_provider_name)
 
     # --- Browser Settings ---
     def get_browser_setting(key, default=None):
@@ -504,14 +466,8 @@ async def run_agent_task(
         ollama_num_ctx if llm_provider_name == "ollama" else None,
     )
     
-    # 包装LLM以追踪token使用情况
-    # 定义token回调函数，用于实时更新ExecutionMonitor
-    def token_usage_callback(prompt_tokens: int, completion_tokens: int):
-        """Token使用回调函数"""
-        _record_token_usage(prompt_tokens, completion_tokens)
-    
-    # 使用TokenTrackingLLM包装原始LLM
-    main_llm = TokenTrackingLLM(llm=base_llm, token_callback=token_usage_callback)
+    # 使用TokenTrackingLLM包装原始LLM：Token记到本次运行的Token账户（run_context）
+    main_llm = TokenTrackingLLM(llm=base_llm, provider=llm_provider_name)
 
     # Pass the webui_manager instance to the callback when wrapping it
     async def ask_callback_wrapper(
@@ -531,6 +487,7 @@ async def run_agent_task(
     try:
         # Close existing resources if not keeping open
         if not keep_browser_open:
+            await webui_manager.release_browser_lease()
             if webui_manager.bu_browser_context:
                 logger.info("Closing previous browser context.")
                 await webui_manager.bu_browser_context.close()
@@ -540,6 +497,35 @@ async def run_agent_task(
                 await webui_manager.bu_browser.close()
                 webui_manager.bu_browser = None
 
+        context_config = BrowserContextConfig(
+            trace_path=save_trace_path if save_trace_path else None,
+            save_recording_path=save_recording_path
+            if save_recording_path
+            else None,
+            save_downloads_path=save_download_path if save_download_path else None,
+            window_height=window_h,
+            window_width=window_w,
+        )
+
+        # 使用内置Chromium时，从浏览器池租用预热的浏览器，避免冷启动，各会话的浏览器互相隔离；
+        # 保持浏览器打开时租约留在会话中，直到关闭该选项、清空或会话空闲回收
+        use_browser_pool = not use_own_browser and not cdp_url and not wss_url
+        if use_browser_pool and not webui_manager.bu_browser:
+            pool = await get_browser_pool(
+                BrowserConfig(
+                    headless=headless,
+                    disable_security=disable_security,
+                    new_context_config=BrowserContextConfig(
+                        window_width=window_w,
+                        window_height=window_h,
+                    ),
+                )
+            )
+            logger.info("Leasing browser from pool.")
+            webui_manager.bu_browser_lease = await pool.acquire(context_config)
+            webui_manager.bu_browser = webui_manager.bu_browser_lease.browser
+            webui_manager.bu_browser_context = webui_manager.bu_browser_lease.context
+
         # Create Browser if needed
         if not webui_manager.bu_browser:
             logger.info("Launching new browser instance.")
@@ -572,15 +558,6 @@ async def run_agent_task(
         # Create Context if needed
         if not webui_manager.bu_browser_context:
             logger.info("Creating new browser context.")
-            context_config = BrowserContextConfig(
-                trace_path=save_trace_path if save_trace_path else None,
-                save_recording_path=save_recording_path
-                if save_recording_path
-                else None,
-                save_downloads_path=save_download_path if save_download_path else None,
-                window_height=window_h,
-                window_width=window_w,
-            )
             if not webui_manager.bu_browser:
                 raise ValueError("Browser not initialized, cannot create context.")
             webui_manager.bu_browser_context = (
@@ -634,7 +611,9 @@ async def run_agent_task(
                 logger.info(f"🤖 Using BrowserUseAgent for API model: {llm_model_name}")
                 agent_class = BrowserUseAgent
             
-            webui_manager.bu_agent = agent_class(
+            # 在运行上下文中构造：初始化时的LLM连通性检查也计入本次运行
+            webui_manager.bu_agent = run_context.run(
+                agent_class,
                 task=task,
                 llm=main_llm,
                 browser=webui_manager.bu_browser,
@@ -664,55 +643,34 @@ async def run_agent_task(
 
         # --- 6. Run Agent Task and Stream Updates ---
         agent_run_coro = webui_manager.bu_agent.run(max_steps=max_steps)
-        agent_task = asyncio.create_task(agent_run_coro)
+        agent_task = asyncio.create_task(agent_run_coro, context=run_context)
         webui_manager.bu_current_task = agent_task  # Store the task
 
+        # 浏览器画面改为 screencast 的 MJPEG 流，只需设置一次
+        live_view_key = webui_manager.bu_agent_task_id
+        register_live_view(live_view_key, webui_manager.bu_browser_context)
+        yield {browser_view_comp: gr.update(value=_live_view_html(live_view_key), visible=True)}
+
+        # 运行中的变化由 Agent、ExecutionMonitor 和回调发布到事件队列，界面只在事件到达时更新：
+        # Agent 等待LLM或暂停时这里不做任何事，事件到达后立即推送，突发的事件合并为一次更新
+        agent_task.add_done_callback(lambda _: run_events.publish(EVENT_DONE))
+        metrics_events = {EVENT_STEP, EVENT_TOKENS, EVENT_RETRY}
         last_chat_len = len(webui_manager.bu_chat_history)
         while not agent_task.done():
-            is_paused = webui_manager.bu_agent.state.paused
-            is_stopped = webui_manager.bu_agent.state.stopped
-
-            # Check for pause state
-            if is_paused:
-                yield {
-                    pause_resume_button_comp: gr.update(
-                        value="▶️ Resume", interactive=True
-                    ),
-                    stop_button_comp: gr.update(interactive=True),
-                }
-                # Wait until pause is released or task is stopped/done
-                while is_paused and not agent_task.done():
-                    # Re-check agent state in loop
-                    is_paused = webui_manager.bu_agent.state.paused
-                    is_stopped = webui_manager.bu_agent.state.stopped
-                    if is_stopped:  # Stop signal received while paused
-                        break
-                    await asyncio.sleep(0.2)
-
-                if (
-                        agent_task.done() or is_stopped
-                ):  # If stopped or task finished while paused
-                    break
-
-                # If resumed, yield UI update
-                yield {
-                    pause_resume_button_comp: gr.update(
-                        value="⏸️ Pause", interactive=True
-                    ),
-                    run_button_comp: gr.update(
-                        value="⏳ Running...", interactive=False
-                    ),
-                }
+            batch = await run_events.next_batch()
+            if agent_task.done():
+                break
+            agent_state = webui_manager.bu_agent.state
 
-            # Check if agent stopped itself or stop button was pressed (which sets agent.state.stopped)
-            if is_stopped:
+            # Check if agent stopped itself or stop button was pressed
+            if agent_state.stopped:
                 logger.info("Agent has stopped (internally or via stop button).")
                 if not agent_task.done():
-                    # Ensure the task coroutine finishes if agent just set flag
+                    # 停止会取消进行中的步骤，run() 在 stop_grace 秒内返回；再留1秒给收尾
                     try:
                         await asyncio.wait_for(
-                            agent_task, timeout=1.0
-                        )  # Give it a moment to exit run()
+                            agent_task, timeout=webui_manager.bu_agent.control.stop_grace + 1.0
+                        )
                     except asyncio.TimeoutError:
                         logger.warning(
                             "Agent task did not finish quickly after stop signal, cancelling."
@@ -722,10 +680,19 @@ async def run_agent_task(
                         pass
                 break  # Exit the streaming loop
 
-            # Check if agent is asking for help (via response_event)
             update_dict = {}
-            if webui_manager.bu_response_event is not None:
-                update_dict = {
+            if EVENT_PAUSED in batch or EVENT_RESUMED in batch:
+                if agent_state.paused:
+                    update_dict[pause_resume_button_comp] = gr.update(value="▶️ Resume", interactive=True)
+                    update_dict[stop_button_comp] = gr.update(interactive=True)
+                else:
+                    update_dict[pause_resume_button_comp] = gr.update(value="⏸️ Pause", interactive=True)
+                    update_dict[run_button_comp] = gr.update(value="⏳ Running...", interactive=False)
+
+            # Check if agent is asking for help (via response_event)
+            response_event = webui_manager.bu_response_event
+            if EVENT_HELP in batch and response_event is not None:
+                update_dict.update({
                     user_input_comp: gr.update(
                         placeholder="Agent needs help. Enter response and submit.",
                         interactive=True,
@@ -736,26 +703,28 @@ async def run_agent_task(
                     pause_resume_button_comp: gr.update(interactive=False),
                     stop_button_comp: gr.update(interactive=False),
                     chatbot_comp: gr.update(value=webui_manager.bu_chat_history),
-                }
+                })
                 last_chat_len = len(webui_manager.bu_chat_history)
                 yield update_dict
+                update_dict = {}
                 # Wait until response is submitted or task finishes
-                await webui_manager.bu_response_event.wait()
+                response_wait = asyncio.ensure_future(response_event.wait())
+                await asyncio.wait({response_wait, agent_task}, return_when=asyncio.FIRST_COMPLETED)
+                response_wait.cancel()
 
                 # Restore UI after response submitted or if task ended unexpectedly
-                if not agent_task.done():
-                    yield {
-                        user_input_comp: gr.update(
-                            placeholder="Agent is running...", interactive=False
-                        ),
-                        run_button_comp: gr.update(
-                            value="⏳ Running...", interactive=False
-                        ),
-                        pause_resume_button_comp: gr.update(interactive=True),
-                        stop_button_comp: gr.update(interactive=True),
-                    }
-                else:
+                if agent_task.done():
                     break  # Task finished while waiting for response
+                yield {
+                    user_input_comp: gr.update(
+                        placeholder="Agent is running...", interactive=False
+                    ),
+                    run_button_comp: gr.update(
+                        value="⏳ Running...", interactive=False
+                    ),
+                    pause_resume_button_comp: gr.update(interactive=True),
+                    stop_button_comp: gr.update(interactive=True),
+                }
 
             # Update Chatbot if new messages arrived via callbacks
             if len(webui_manager.bu_chat_history) > last_chat_len:
@@ -769,77 +738,47 @@ async def run_agent_task(
             metrics_tokens_comp = webui_manager.get_component_by_id("browser_use_agent.metrics_tokens")
             metrics_retries_comp = webui_manager.get_component_by_id("browser_use_agent.metrics_retries")
             
-            if webui_manager.bu_agent and hasattr(webui_manager.bu_agent, 'execution_monitor'):
+            if metrics_events & batch.keys() and hasattr(webui_manager.bu_agent, 'execution_monitor'):
                 monitor = webui_manager.bu_agent.execution_monitor
                 if monitor:
-                    # 导入暂存的 Token（如果有）
-                    _import_pending_tokens_to_monitor(monitor)
-                    
+                    # 读取快照（O(1)，不遍历步骤与重试记录）
+                    snapshot = monitor.get_snapshot()
+
                     # 执行统计卡片
                     execution_text = f"""
-**状态**: {monitor.status.value}
+**状态**: {snapshot.status}
 
 **执行统计**: 
-- 当前步数: {monitor.current_step} / {monitor.max_steps}
-- 总耗时: {monitor.get_total_duration():.2f}秒
-- 平均步骤耗时: {monitor.get_average_step_duration():.2f}秒
+- 当前步数: {snapshot.current_step} / {snapshot.max_steps}
+- 总耗时: {snapshot.total_duration:.2f}秒
+- 平均步骤耗时: {snapshot.average_step_duration:.2f}秒
+- P50/P95: {snapshot.p50_step_duration:.2f} / {snapshot.p95_step_duration:.2f}秒
 """
                     update_dict[metrics_execution_comp] = gr.update(value=execution_text.strip())
                     
                     # Token消耗卡片
                     tokens_text = f"""
 **Token消耗**: 
-- Prompt Tokens: {monitor.token_usage.prompt_tokens}
-- Completion Tokens: {monitor.token_usage.completion_tokens}
-- 总Token: {monitor.token_usage.total_tokens}
+- Prompt Tokens: {snapshot.prompt_tokens}
+- Completion Tokens: {snapshot.completion_tokens}
+- 总Token: {snapshot.total_tokens}
+- 费用: ${budget.spend.cost:.4f}{" ⚠️ 已超预算软限制" if budget.level == "soft" else ""}
 """
                     update_dict[metrics_tokens_comp] = gr.update(value=tokens_text.strip())
                     
                     # 重试统计卡片
                     retries_text = f"""
 **重试统计**: 
-- 系统级重试: {monitor.system_retry_count}
-- 业务级重试: {monitor.business_retry_count}
-- 总重试: {len(monitor.retry_records)}
+- 系统级重试: {snapshot.system_retry_count}
+- 业务级重试: {snapshot.business_retry_count}
+- 总重试: {snapshot.total_retry_count}
 """
                     update_dict[metrics_retries_comp] = gr.update(value=retries_text.strip())
 
-            # Update Browser View - 始终显示
-            if webui_manager.bu_browser_context:
-                try:
-                    screenshot_b64 = (
-                        await webui_manager.bu_browser_context.take_screenshot()
-                    )
-                    if screenshot_b64:
-                        # 使用更大的尺寸显示浏览器视图
-                        html_content = f'<img src="data:image/jpeg;base64,{screenshot_b64}" style="width:100%; height:60vh; border:2px solid #e5e7eb; border-radius:12px; object-fit:contain; background:#fff;">'
-                        update_dict[browser_view_comp] = gr.update(
-                            value=html_content, visible=True
-                        )
-                    else:
-                        html_content = "<div style='width:100%; height:60vh; display:flex; justify-content:center; align-items:center; border:2px solid #e5e7eb; border-radius:12px; background-color:#f9fafb;'><p style='color:#9ca3af; font-size:16px;'>正在等待浏览器响应...</p></div>"
-                        update_dict[browser_view_comp] = gr.update(
-                            value=html_content, visible=True
-                        )
-                except Exception as e:
-                    logger.debug(f"Failed to capture screenshot: {e}")
-                    update_dict[browser_view_comp] = gr.update(
-                        value="<div style='width:100%; height:60vh; display:flex; justify-content:center; align-items:center; border:2px solid #fca5a5; border-radius:12px; background-color:#fef2f2;'><p style='color:#dc2626; font-size:16px;'>截图加载失败</p></div>",
-                        visible=True,
-                    )
-            else:
-                # 浏览器未启动时的显示
-                update_dict[browser_view_comp] = gr.update(
-                    value="<div style='width:100%; height:60vh; display:flex; justify-content:center; align-items:center; border:2px solid #e5e7eb; border-radius:12px; background-color:#f9fafb;'><p style='color:#9ca3af; font-size:16px;'>等待任务启动...</p></div>",
-                    visible=True
-                )
-
             # Yield accumulated updates
             if update_dict:
                 yield update_dict
 
-            await asyncio.sleep(0.1)  # Polling interval
-
         # --- 7. Task Finalization ---
         webui_manager.bu_agent.state.paused = False
         webui_manager.bu_agent.state.stopped = False
@@ -861,9 +800,6 @@ async def run_agent_task(
                 monitor = webui_manager.bu_agent.execution_monitor
                 if monitor and os.path.exists(history_file):
                     try:
-                        # 导入暂存的 Token（如果有）
-                        _import_pending_tokens_to_monitor(monitor)
-                        
                         with open(history_file, 'r', encoding='utf-8') as f:
                             history_data = json.load(f)
                         
@@ -922,9 +858,13 @@ async def run_agent_task(
 
         finally:
             webui_manager.bu_current_task = None  # Clear the task reference
+            await unregister_live_view(live_view_key)
 
             # Close browser/context if requested
-            if should_close_browser_on_finish:
+            if webui_manager.bu_browser_lease and should_close_browser_on_finish:
+                logger.info("Returning browser to pool after task.")
+                await webui_manager.release_browser_lease()
+            elif should_close_browser_on_finish and not webui_manager.bu_browser_lease:
                 if webui_manager.bu_browser_context:
                     logger.info("Closing browser context after task.")
                     await webui_manager.bu_browser_context.close()
@@ -958,6 +898,9 @@ async def run_agent_task(
         # Catch errors during setup (before agent run starts)
         logger.error(f"Error setting up agent task: {e}", exc_info=True)
         webui_manager.bu_current_task = None  # Ensure state is reset
+        if webui_manager.bu_agent_task_id:
+            await unregister_live_view(webui_manager.bu_agent_task_id)
+        await webui_manager.release_browser_lease()
         yield {
             user_input_comp: gr.update(
                 interactive=True, placeholder="Error during setup. Enter task..."
@@ -1023,9 +966,9 @@ async def handle_stop(webui_manager: WebuiManager):
     task = webui_manager.bu_current_task
 
     if agent and task and not task.done():
-        # Signal the agent to stop by setting its internal flag
-        agent.state.stopped = True
+        # Signal the agent to stop (also wakes the UI loop via the run events)
         agent.state.paused = False  # Ensure not paused if stopped
+        agent.stop()
         return {
             webui_manager.get_component_by_id(
                 "browser_use_agent.stop_button"
@@ -1108,6 +1051,8 @@ async def handle_clear(webui_manager: WebuiManager):
         await webui_manager.bu_controller.close_mcp_client()
         webui_manager.bu_controller = None
     webui_manager.bu_agent = None
+    # 保持打开时留在会话中的浏览器租约一并归还
+    await webui_manager.release_browser_lease()
 
     # Reset state stored in manager
     webui_manager.bu_chat_history = []
@@ -1233,7 +1178,7 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
         with gr.Column(scale=1):
             gr.Markdown("### 📝 执行历史记录", elem_classes=["metric-card"])
             chatbot = gr.Chatbot(
-                lambda: webui_manager.bu_chat_history,
+                [],
                 elem_id="browser_use_chatbot",
                 label="Agent Interaction",
                 type="messages",
@@ -1279,26 +1224,27 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
     )  # Get all components known to manager
     run_tab_outputs = list(tab_components.values())
 
+    # 每个处理函数按请求的 Gradio 会话取得各自的 WebuiManager，会话之间的 Agent 与浏览器互不干扰
     async def submit_wrapper(
-            components_dict: Dict[Component, Any],
+            components_dict: Dict[Component, Any], request: gr.Request
     ) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_submit that yields its results."""
-        async for update in handle_submit(webui_manager, components_dict):
+        async for update in handle_submit(webui_manager.get_session(request), components_dict):
             yield update
 
-    async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
+    async def stop_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_stop."""
-        update_dict = await handle_stop(webui_manager)
+        update_dict = await handle_stop(webui_manager.get_session(request))
         yield update_dict
 
-    async def pause_resume_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
+    async def pause_resume_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_pause_resume."""
-        update_dict = await handle_pause_resume(webui_manager)
+        update_dict = await handle_pause_resume(webui_manager.get_session(request))
         yield update_dict
 
-    async def clear_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
+    async def clear_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_clear."""
-        update_dict = await handle_clear(webui_manager)
+        update_dict = await handle_clear(webui_manager.get_session(request))
         yield update_dict
 
     # --- Connect Event Handlers using the Wrappers --
@@ -420,9 +420,9 @@ def create_deep_research_agent_tab(webui_manager: WebuiManager):
     webui_manager.add_components("deep_research_agent", tab_components)
     webui_manager.init_deep_research_agent()
 
-    async def update_wrapper(mcp_file):
+    async def update_wrapper(mcp_file, request: gr.Request):
         """Wrapper for handle_pause_resume."""
-        update_dict = await update_mcp_server(mcp_file, webui_manager)
+        update_dict = await update_mcp_server(mcp_file, webui_manager.get_session(request))
         yield update_dict
 
     mcp_json_file.change(
@@ -435,12 +435,12 @@ def create_deep_research_agent_tab(webui_manager: WebuiManager):
     all_managed_inputs = set(webui_manager.get_components())
 
     # --- Define Event Handler Wrappers ---
-    async def start_wrapper(comps: Dict[Component, Any]) -> AsyncGenerator[Dict[Component, Any], None]:
-        async for update in run_deep_research(webui_manager, comps):
+    async def start_wrapper(comps: Dict[Component, Any], request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        async for update in run_deep_research(webui_manager.get_session(request), comps):
             yield update
 
-    async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
-        update_dict = await stop_deep_research(webui_manager)
+    async def stop_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        update_dict = await stop_deep_research(webui_manager.get_session(request))
         yield update_dict
 
     # --- Connect Handlers ---
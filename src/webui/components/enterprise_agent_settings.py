@@ -361,10 +361,11 @@ def create_enterprise_agent_settings(ui_manager: WebuiManager, lang: Literal["zh
         outputs=planner_llm_model_name
     )
     
-    async def update_mcp_server(mcp_file):
-        if hasattr(ui_manager, "bu_controller") and ui_manager.bu_controller:
-            await ui_manager.bu_controller.close_mcp_client()
-            ui_manager.bu_controller = None
+    async def update_mcp_server(mcp_file, request: gr.Request):
+        session = ui_manager.get_session(request)
+        if hasattr(session, "bu_controller") and session.bu_controller:
+            await session.bu_controller.close_mcp_client()
+            session.bu_controller = None
         
         if not mcp_file:
             return None, gr.update(visible=False)
@@ -230,18 +230,22 @@ def create_enterprise_browser_settings(ui_manager: WebuiManager, lang: Literal["
     ui_manager.add_components("browser_settings", tab_components)
     
     # Event handlers - close browser when critical settings change
-    async def close_browser():
-        if ui_manager.bu_current_task and not ui_manager.bu_current_task.done():
-            ui_manager.bu_current_task.cancel()
-            ui_manager.bu_current_task = None
+    async def close_browser(request: gr.Request):
+        session = ui_manager.get_session(request)
+        if session.bu_current_task and not session.bu_current_task.done():
+            session.bu_current_task.cancel()
+            session.bu_current_task = None
         
-        if ui_manager.bu_browser_context:
-            await ui_manager.bu_browser_context.close()
-            ui_manager.bu_browser_context = None
+        if session.bu_browser_lease:
+            await session.release_browser_lease()
         
-        if ui_manager.bu_browser:
-            await ui_manager.bu_browser.close()
-            ui_manager.bu_browser = None
+        if session.bu_browser_context:
+            await session.bu_browser_context.close()
+            session.bu_browser_context = None
+        
+        if session.bu_browser:
+            await session.bu_browser.close()
+            session.bu_browser = None
     
     headless.change(fn=close_browser, inputs=None, outputs=None)
     keep_browser_open.change(fn=close_browser, inputs=None, outputs=None)
@@ -165,17 +165,18 @@ def create_enterprise_deep_research(ui_manager: WebuiManager, lang: Literal["zh"
     dr_tab_outputs = list(tab_components.values())
     all_managed_inputs = set(ui_manager.get_components())
     
-    async def start_wrapper(comps: Dict[Component, Any]) -> AsyncGenerator[Dict[Component, Any], None]:
-        async for update in run_deep_research(ui_manager, comps):
+    async def start_wrapper(comps: Dict[Component, Any], request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        async for update in run_deep_research(ui_manager.get_session(request), comps):
             yield update
     
-    async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
-        update_dict = await stop_deep_research(ui_manager)
+    async def stop_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        update_dict = await stop_deep_research(ui_manager.get_session(request))
         yield update_dict
     
-    async def update_mcp_wrapper(mcp_file):
-        if hasattr(ui_manager, "dr_agent") and ui_manager.dr_agent:
-            await ui_manager.dr_agent.close_mcp_client()
+    async def update_mcp_wrapper(mcp_file, request: gr.Request):
+        session = ui_manager.get_session(request)
+        if hasattr(session, "dr_agent") and session.dr_agent:
+            await session.dr_agent.close_mcp_client()
         
         if not mcp_file:
             return None, gr.update(visible=False)
@@ -258,22 +258,23 @@ def create_enterprise_run_agent(ui_manager: WebuiManager, lang: Literal["zh", "e
     all_managed_components = set(ui_manager.get_components())
     run_tab_outputs = list(tab_components.values())
     
+    # 按请求的 Gradio 会话取得各自的运行状态
     async def submit_wrapper(
-        components_dict: Dict[Component, Any]
+        components_dict: Dict[Component, Any], request: gr.Request
     ) -> AsyncGenerator[Dict[Component, Any], None]:
-        async for update in handle_submit(ui_manager, components_dict):
+        async for update in handle_submit(ui_manager.get_session(request), components_dict):
             yield update
     
-    async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
-        update_dict = await handle_stop(ui_manager)
+    async def stop_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        update_dict = await handle_stop(ui_manager.get_session(request))
         yield update_dict
     
-    async def pause_resume_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
-        update_dict = await handle_pause_resume(ui_manager)
+    async def pause_resume_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        update_dict = await handle_pause_resume(ui_manager.get_session(request))
         yield update_dict
     
-    async def clear_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
-        update_dict = await handle_clear(ui_manager)
+    async def clear_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        update_dict = await handle_clear(ui_manager.get_session(request))
         yield update_dict
     
     # Connect events
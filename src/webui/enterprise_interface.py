@@ -1196,5 +1196,8 @@ def create_enterprise_ui(theme_mode: Literal["light", "dark", "auto"] = "auto",
                 # Tab 5: Config Management
                 with gr.TabItem(t["tabs"]["config"]):
                     create_enterprise_config_manager(ui_manager, lang)
-    
+
+        # 页面关闭时释放该会话的 Agent 与浏览器
+        demo.unload(ui_manager.end_session)
+
     return demo
@@ -296,4 +296,7 @@ def create_ui(theme_name="Ocean"):
             with gr.TabItem("📁 Load & Save Config"):
                 create_load_save_config_tab(ui_manager)
 
+        # 页面关闭时释放该会话的 Agent 与浏览器
+        demo.unload(ui_manager.end_session)
+
     return demo
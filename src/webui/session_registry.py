@@ -0,0 +1,184 @@
+"""
+会话注册表 - Session Registry
+WebUI 按 Gradio 会话（session_hash）隔离运行状态，每个会话有自己的 Agent、浏览器、控制器和聊天记录：
+
+- 容量：本进程同时存在的会话数不超过 max_sessions，已满时先回收空闲会话，仍无名额则拒绝新会话
+- 空闲回收：超过 idle_timeout 秒没有操作、且没有运行中任务的会话被关闭（归还浏览器、关闭MCP客户端）
+- 运行中的会话不回收：判断由 busy 回调提供
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SessionLimitError(RuntimeError):
+    """会话数已达上限且没有可回收的空闲会话"""
+
+
+@dataclass
+class SessionEntry(Generic[T]):
+    """一个会话及其活跃时间"""
+    key: str
+    value: T
+    created_at: float = field(default_factory=time.monotonic)
+    last_active: float = field(default_factory=time.monotonic)
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_active
+
+
+class SessionRegistry(Generic[T]):
+    """
+    按会话键管理会话状态
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], T],
+        close: Optional[Callable[[T], Awaitable[None]]] = None,
+        busy: Optional[Callable[[T], bool]] = None,
+        max_sessions: int = 8,
+        idle_timeout: float = 1800.0,
+        sweep_interval: float = 60.0,
+    ):
+        """
+        Args:
+            factory: 按会话键创建会话状态
+            close: 关闭会话时释放资源的协程函数
+            busy: 会话是否有运行中的任务（运行中的会话不回收）
+            max_sessions: 本进程最多同时存在的会话数
+            idle_timeout: 空闲超过该秒数的会话被回收，0 表示不回收
+            sweep_interval: 后台回收检查间隔（秒）
+        """
+        self._factory = factory
+        self._close = close
+        self._busy = busy or (lambda value: False)
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._sessions: Dict[str, SessionEntry[T]] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.created_count = 0
+        self.expired_count = 0
+        self.rejected_count = 0
+
+    @classmethod
+    def from_env(cls, factory: Callable[[str], T], **kwargs) -> "SessionRegistry[T]":
+        """从环境变量 WEBUI_MAX_SESSIONS / WEBUI_SESSION_IDLE_SECONDS 读取容量与空闲回收时间"""
+        return cls(
+            factory,
+            max_sessions=int(os.getenv("WEBUI_MAX_SESSIONS", "8")),
+            idle_timeout=float(os.getenv("WEBUI_SESSION_IDLE_SECONDS", "1800")),
+            **kwargs,
+        )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._sessions
+
+    def peek(self, key: str) -> Optional[T]:
+        """获取已有会话（不创建、不刷新活跃时间）"""
+        entry = self._sessions.get(key)
+        return entry.value if entry is not None else None
+
+    def get(self, key: str) -> T:
+        """
+        获取会话并刷新活跃时间，不存在时创建
+
+        Raises:
+            SessionLimitError: 会话数已达上限且没有可回收的空闲会话
+        """
+        self._ensure_sweeper()
+        entry = self._sessions.get(key)
+        if entry is None:
+            if len(self._sessions) >= self.max_sessions and not self._evict_one():
+                self.rejected_count += 1
+                raise SessionLimitError(
+                    f"Too many active sessions ({len(self._sessions)}/{self.max_sessions}), please try again later"
+                )
+            entry = SessionEntry(key=key, value=self._factory(key))
+            self._sessions[key] = entry
+            self.created_count += 1
+            logger.info(f"WebUI session created: {key} ({len(self._sessions)}/{self.max_sessions})")
+        entry.last_active = time.monotonic()
+        return entry.value
+
+    async def remove(self, key: str):
+        """移除并关闭会话"""
+        entry = self._sessions.pop(key, None)
+        if entry is not None:
+            await self._close_entry(entry)
+
+    async def sweep(self) -> List[str]:
+        """关闭空闲超时且没有运行中任务的会话，返回被关闭的会话键"""
+        if not self.idle_timeout:
+            return []
+        expired = [
+            entry for entry in self._sessions.values()
+            if entry.idle_seconds > self.idle_timeout and not self._busy(entry.value)
+        ]
+        for entry in expired:
+            self._sessions.pop(entry.key, None)
+            self.expired_count += 1
+            await self._close_entry(entry)
+        if expired:
+            logger.info(f"Expired {len(expired)} idle WebUI sessions, {len(self._sessions)} remaining")
+        return [entry.key for entry in expired]
+
+    async def close(self):
+        """关闭所有会话并停止后台回收"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        entries = list(self._sessions.values())
+        self._sessions.clear()
+        for entry in entries:
+            await self._close_entry(entry)
+
+    def _evict_one(self) -> bool:
+        """名额已满时回收最久未活跃的空闲会话（资源在后台释放）"""
+        candidates = [entry for entry in self._sessions.values() if not self._busy(entry.value)]
+        if not candidates:
+            return False
+        entry = min(candidates, key=lambda e: e.last_active)
+        self._sessions.pop(entry.key, None)
+        self.expired_count += 1
+        logger.info(f"Evicted least recently used WebUI session {entry.key} to admit a new one")
+        asyncio.get_running_loop().create_task(self._close_entry(entry))
+        return True
+
+    async def _close_entry(self, entry: SessionEntry[T]):
+        if self._close is None:
+            return
+        try:
+            await self._close(entry.value)
+        except Exception as e:
+            logger.warning(f"Failed to close WebUI session {entry.key}: {e}")
+
+    def _ensure_sweeper(self):
+        """在事件循环中首次使用时启动后台回收"""
+        if self._sweeper is not None or not self.idle_timeout:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"WebUI session sweep failed: {e}")
@@ -0,0 +1,56 @@
+"""
+WebUI 服务：在 FastAPI 上挂载 Gradio 界面，并提供二进制内容的路由
+（Gradio 自身的 launch() 不能添加自定义路由）
+
+- /live/<运行ID>.mjpeg：浏览器实时画面
+- /artifacts/<摘要>.<扩展名>：聊天记录中引用的截图等产物
+"""
+from typing import TYPE_CHECKING, Any
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+
+from src.browser.live_view import MJPEG_MEDIA_TYPE, get_live_view, mjpeg_stream
+from src.utils.artifact_store import get_artifact_store
+
+if TYPE_CHECKING:
+    import gradio as gr
+
+
+def live_view_url(key: str) -> str:
+    """一次运行的实时画面地址"""
+    return f"/live/{key}.mjpeg"
+
+
+def create_webui_app(demo: "gr.Blocks", **mount_kwargs: Any) -> FastAPI:
+    """
+    创建 WebUI 服务
+
+    Args:
+        demo: 已调用 queue() 的 Gradio 界面
+        mount_kwargs: 透传给 gr.mount_gradio_app 的参数
+    """
+    import gradio as gr
+
+    app = FastAPI()
+
+    @app.get("/live/{key}.mjpeg")
+    async def live_view(key: str):
+        view = get_live_view(key)
+        if view is None:
+            raise HTTPException(status_code=404, detail="Live view not available")
+        return StreamingResponse(
+            mjpeg_stream(view),
+            media_type=MJPEG_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/artifacts/{name}")
+    async def artifact(name: str):
+        path = get_artifact_store().resolve(name)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        # 内容寻址：同一URL的内容不会变化
+        return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+    return gr.mount_gradio_app(app, demo, path="/", **mount_kwargs)
@@ -7,6 +7,7 @@ from datetime import datetime
 from typing import Optional, Dict, List
 import uuid
 import asyncio
+import logging
 import time
 
 from gradio.components import Component
@@ -15,18 +16,109 @@ from browser_use.browser.context import BrowserContext
 from browser_use.agent.service import Agent
 from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import CustomBrowserContext
+from src.browser.browser_pool import BrowserLease
 from src.controller.custom_controller import CustomController
 from src.agent.deep_research.deep_research_agent import DeepResearchAgent
+from src.webui.session_registry import SessionLimitError, SessionRegistry
+
+logger = logging.getLogger(__name__)
 
 
 class WebuiManager:
-    def __init__(self, settings_save_dir: str = "./tmp/webui_settings"):
+    def __init__(self, settings_save_dir: str = "./tmp/webui_settings", parent: Optional["WebuiManager"] = None):
+        """
+        Args:
+            settings_save_dir: 配置保存目录
+            parent: 创建会话时传入进程级的 WebuiManager：共享组件映射，运行状态（bu_* / dr_*）各自独立
+        """
+        if parent is not None:
+            self.id_to_component = parent.id_to_component
+            self.component_to_id = parent.component_to_id
+            self.settings_save_dir = parent.settings_save_dir
+            self.sessions: Optional[SessionRegistry["WebuiManager"]] = None
+            self.init_browser_use_agent()
+            self.init_deep_research_agent()
+            return
+
         self.id_to_component: dict[str, Component] = {}
         self.component_to_id: dict[Component, str] = {}
 
         self.settings_save_dir = settings_save_dir
         os.makedirs(self.settings_save_dir, exist_ok=True)
 
+        # 按 Gradio 会话隔离运行状态，多个操作员可以在同一进程中并发运行 Agent
+        self.sessions = SessionRegistry.from_env(
+            lambda key: WebuiManager(parent=self),
+            close=lambda session: session.close(),
+            busy=lambda session: session.is_busy(),
+        )
+
+    def get_session(self, request: Optional[gr.Request]) -> "WebuiManager":
+        """
+        获取请求所属会话的 WebuiManager；没有会话信息（如直接调用处理函数）时使用进程级实例
+
+        Raises:
+            gr.Error: 本进程的会话数已达上限
+        """
+        session_hash = getattr(request, "session_hash", None) if request is not None else None
+        if not session_hash or self.sessions is None:
+            return self
+        try:
+            return self.sessions.get(session_hash)
+        except SessionLimitError as e:
+            raise gr.Error(str(e))
+
+    async def end_session(self, request: gr.Request) -> None:
+        """页面关闭或刷新时结束会话（刷新后是新会话）；仍在运行的会话等任务结束后由空闲回收关闭"""
+        session_hash = getattr(request, "session_hash", None)
+        if not session_hash or self.sessions is None:
+            return
+        session = self.sessions.peek(session_hash)
+        if session is not None and not session.is_busy():
+            await self.sessions.remove(session_hash)
+
+    def is_busy(self) -> bool:
+        """是否有运行中的 Agent 或深度研究任务"""
+        tasks = (getattr(self, "bu_current_task", None), getattr(self, "dr_current_task", None))
+        return any(task is not None and not task.done() for task in tasks)
+
+    async def release_browser_lease(self) -> None:
+        """把从浏览器池租用的浏览器归还给池"""
+        lease = self.bu_browser_lease
+        if not lease:
+            return
+        self.bu_browser_lease = None
+        self.bu_browser_context = None
+        self.bu_browser = None
+        await lease.pool.release(lease)
+
+    async def close(self) -> None:
+        """关闭会话：停止任务，归还或关闭浏览器，关闭MCP客户端"""
+        for task in (self.bu_current_task, self.dr_current_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self.bu_current_task = None
+        self.dr_current_task = None
+        try:
+            if self.bu_browser_lease:
+                await self.release_browser_lease()
+            else:
+                if self.bu_browser_context:
+                    await self.bu_browser_context.close()
+                if self.bu_browser:
+                    await self.bu_browser.close()
+        except Exception as e:
+            logger.warning(f"Failed to close session browser: {e}")
+        self.bu_browser_context = None
+        self.bu_browser = None
+        if self.bu_controller:
+            await self.bu_controller.close_mcp_client()
+            self.bu_controller = None
+        if self.dr_agent:
+            await self.dr_agent.close_mcp_client()
+            self.dr_agent = None
+        self.bu_agent = None
+
     def init_browser_use_agent(self) -> None:
         """
         init browser use agent
@@ -34,6 +126,8 @@ class WebuiManager:
         self.bu_agent: Optional[Agent] = None
         self.bu_browser: Optional[CustomBrowser] = None
         self.bu_browser_context: Optional[CustomBrowserContext] = None
+        # 从浏览器池租用时非空，任务结束归还而不是关闭
+        self.bu_browser_lease: Optional[BrowserLease] = None
         self.bu_controller: Optional[CustomController] = None
         self.bu_chat_history: List[Dict[str, Optional[str]]] = []
         self.bu_response_event: Optional[asyncio.Event] = None
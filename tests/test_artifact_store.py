@@ -0,0 +1,64 @@
+"""
+测试内容寻址的产物存储
+"""
+import base64
+import os
+import time
+
+import pytest
+
+from src.utils.artifact_store import ArtifactStore, sniff_extension
+
+JPEG = b"\xff\xd8\xff\xe0" + b"0" * 64
+PNG = b"\x89PNG\r\n\x1a\n" + b"1" * 64
+
+
+def test_put_is_content_addressed_and_deduplicated(tmp_path):
+    """测试相同内容只保存一份，URL由摘要和按文件头判断的扩展名组成"""
+    store = ArtifactStore(root_dir=str(tmp_path), url_prefix="/artifacts/")
+    first = store.put(JPEG)
+    second = store.put_base64(base64.b64encode(JPEG).decode())
+    assert first == second
+    assert first.ext == "jpg" and first.mime_type == "image/jpeg"
+    assert store.url(first) == f"/artifacts/{first.digest}.jpg"
+    assert os.path.dirname(first.path) == os.path.join(str(tmp_path), first.digest[:2])
+    assert [name for _, _, files in os.walk(tmp_path) for name in files] == [first.name]
+
+    assert store.put(PNG).ext == "png"
+    assert sniff_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert sniff_extension(b"plain") == "bin"
+
+
+def test_resolve_rejects_unknown_or_unsafe_names(tmp_path):
+    """测试只解析合法的摘要文件名，拒绝路径穿越与不存在的产物"""
+    store = ArtifactStore(root_dir=str(tmp_path))
+    artifact = store.put(PNG)
+    assert store.resolve(artifact.name) == artifact.path
+    assert store.resolve(f"{artifact.digest}.jpg") is None
+    assert store.resolve("../secret.png") is None
+    assert store.resolve(artifact.name.upper()) is None
+
+
+def test_sweep_removes_expired_then_oldest(tmp_path):
+    """测试清理先删除过期产物，再按总大小上限删除最早的产物"""
+    blobs = [PNG + bytes([i]) for i in range(4)]
+    store = ArtifactStore(root_dir=str(tmp_path), max_age=3600, max_bytes=2 * len(blobs[0]))
+    artifacts = [store.put(blob) for blob in blobs]
+    now = time.time()
+    # 0 已过期；1、2、3 依次更新，总大小超出上限一个
+    for age, artifact in zip((7200, 300, 200, 100), artifacts):
+        os.utime(artifact.path, (now - age, now - age))
+
+    assert store.sweep() == 2
+    assert [store.resolve(a.name) is not None for a in artifacts] == [False, False, True, True]
+
+    # 再次写入已存在的内容刷新保留期
+    os.utime(artifacts[2].path, (now - 7200, now - 7200))
+    store.put(blobs[2])
+    assert store.sweep() == 0
+
+    assert ArtifactStore(root_dir=str(tmp_path)).sweep() == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,211 @@
+"""
+测试批量任务执行器
+"""
+import asyncio
+import json
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.batch.runner import BatchRunner, iter_tasks, load_finished_ids
+from src.utils.execution_monitor import (
+    ExecutionMonitor,
+    get_current_token_usage,
+    reset_current_monitor,
+    set_current_monitor,
+)
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _FakePlaywrightBrowser:
+    def is_connected(self):
+        return True
+
+
+class _FakeContext:
+    async def close(self):
+        pass
+
+
+class _FakeBrowser:
+    def __init__(self, config):
+        self.config = config
+        self.playwright_browser = None
+
+    async def get_playwright_browser(self):
+        self.playwright_browser = _FakePlaywrightBrowser()
+        return self.playwright_browser
+
+    async def new_context(self, config=None):
+        return _FakeContext()
+
+    async def close(self):
+        pass
+
+
+def test_iter_tasks_skips_invalid_lines(tmp_path):
+    """测试任务文件逐行解析，无效行被跳过，缺省ID使用行号"""
+    tasks_file = tmp_path / "tasks.jsonl"
+    tasks_file.write_text(
+        '{"id": "a", "task": "open page", "max_steps": 5}\n'
+        "not json\n"
+        "\n"
+        '{"task": "search"}\n'
+        '{"id": "c"}\n',
+        encoding="utf-8",
+    )
+    tasks = list(iter_tasks(str(tasks_file)))
+    assert [(t.task_id, t.max_steps) for t in tasks] == [("a", 5), ("line-4", None)]
+
+
+def test_resume_and_stream_results(tmp_path):
+    """测试续跑跳过已完成任务、结果逐条追加、并发不超过上限"""
+    tasks_file = tmp_path / "tasks.jsonl"
+    tasks_file.write_text(
+        "".join(json.dumps({"id": str(i), "task": f"task {i}"}) + "\n" for i in range(10)),
+        encoding="utf-8",
+    )
+    output = tmp_path / "results.jsonl"
+    # 上次运行完成了0、1，第2条写到一半时进程崩溃
+    output.write_text('{"id": "0", "status": "completed"}\n{"id": "1", "status": "failed"}\n{"id": "2", "sta', encoding="utf-8")
+    assert load_finished_ids(str(output)) == {"0", "1"}
+
+    runner = BatchRunner(
+        llm=None,
+        browser_config=None,
+        output_path=str(output),
+        concurrency=3,
+        browser_factory=_FakeBrowser,
+    )
+    running = 0
+    peak = 0
+
+    async def fake_run_task(task, pool):
+        nonlocal running, peak
+        async with pool.lease():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+        status = "failed" if task.task_id == "7" else "completed"
+        return {"id": task.task_id, "status": status, "duration": 0.01, "summary": None}
+
+    runner._run_task = fake_run_task
+    report = asyncio.run(runner.run(str(tasks_file)))
+
+    assert peak == 3
+    assert report.total == 10
+    assert report.skipped == 2
+    assert report.completed == 7
+    assert report.failed == 1
+    assert report.tasks_per_min > 0
+    assert load_finished_ids(str(output)) == {str(i) for i in range(10)}
+
+
+class _UsageChatModel(BaseChatModel):
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(
+            content="ok",
+            usage_metadata={"input_tokens": 100, "output_tokens": 10, "total_tokens": 110},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_each_task_counts_tokens_once(tmp_path):
+    """测试每个任务有独立的Token账户，一次110 Token的调用在任务摘要中只计一次"""
+    tasks_file = tmp_path / "tasks.jsonl"
+    tasks_file.write_text(
+        "".join(json.dumps({"id": str(i), "task": f"task {i}"}) + "\n" for i in range(4)),
+        encoding="utf-8",
+    )
+    output = tmp_path / "results.jsonl"
+    runner = BatchRunner(
+        llm=_UsageChatModel(),
+        browser_config=None,
+        output_path=str(output),
+        concurrency=2,
+        browser_factory=_FakeBrowser,
+    )
+    accounts = []
+
+    async def fake_run_task(task, pool):
+        # 与 BrowserUseAgent.run 相同：监控器共享运行级账户，LLM不带额外的回调
+        usage = get_current_token_usage()
+        accounts.append(usage)
+        monitor = ExecutionMonitor(max_steps=1, token_usage=usage)
+        token = set_current_monitor(monitor)
+        try:
+            await TokenTrackingLLM(llm=runner.llm).ainvoke([HumanMessage(content=task.task)])
+        finally:
+            reset_current_monitor(token)
+        return {"id": task.task_id, "status": "completed", "duration": 0.0, "summary": monitor.get_summary()}
+
+    runner._run_task = fake_run_task
+    asyncio.run(runner.run(str(tasks_file)))
+
+    assert len({id(usage) for usage in accounts}) == 4 and None not in accounts
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [r["summary"]["tokens"]["total_tokens"] for r in results] == [110] * 4
+
+
+def test_write_errors_do_not_stall_batch(tmp_path):
+    """测试结果写入失败时worker继续消费队列，批量执行正常结束并计数"""
+    tasks_file = tmp_path / "tasks.jsonl"
+    tasks_file.write_text(
+        "".join(json.dumps({"id": str(i), "task": f"task {i}"}) + "\n" for i in range(12)),
+        encoding="utf-8",
+    )
+    runner = BatchRunner(
+        llm=None,
+        browser_config=None,
+        output_path=str(tmp_path / "results.jsonl"),
+        concurrency=2,
+        browser_factory=_FakeBrowser,
+    )
+
+    async def fake_run_task(task, pool):
+        return {"id": task.task_id, "status": "completed", "duration": 0.0, "summary": None}
+
+    async def failing_write(result):
+        raise OSError("disk full")
+
+    runner._run_task = fake_run_task
+    runner._write_result = failing_write
+    report = asyncio.run(asyncio.wait_for(runner.run(str(tasks_file)), timeout=5))
+
+    assert report.write_errors == 12
+    assert report.failed == 12
+    assert report.completed == 0
+
+
+def test_run_aborts_when_workers_exit(tmp_path):
+    """测试worker全部退出时 run 报错而不是阻塞在队列上"""
+    tasks_file = tmp_path / "tasks.jsonl"
+    tasks_file.write_text(
+        "".join(json.dumps({"id": str(i), "task": f"task {i}"}) + "\n" for i in range(20)),
+        encoding="utf-8",
+    )
+    runner = BatchRunner(
+        llm=None,
+        browser_config=None,
+        output_path=str(tmp_path / "results.jsonl"),
+        concurrency=2,
+        browser_factory=_FakeBrowser,
+    )
+
+    async def dead_worker(queue, pool):
+        await queue.get()
+
+    runner._worker = dead_worker
+    with pytest.raises(RuntimeError, match="workers exited"):
+        asyncio.run(asyncio.wait_for(runner.run(str(tasks_file)), timeout=5))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,201 @@
+"""
+测试浏览器池
+"""
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from src.browser import browser_pool
+from src.browser.browser_pool import BrowserPool, BrowserPoolTimeoutError
+
+
+class _FakePlaywrightBrowser:
+    def __init__(self):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+
+class _FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeBrowser:
+    def __init__(self, config):
+        self.config = config
+        self.playwright_browser = None
+        self.closed = False
+        self.contexts = []
+
+    async def get_playwright_browser(self):
+        await asyncio.sleep(0)
+        self.playwright_browser = _FakePlaywrightBrowser()
+        return self.playwright_browser
+
+    async def new_context(self, config=None):
+        context = _FakeContext()
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+
+
+def _make_pool(**kwargs) -> BrowserPool:
+    return BrowserPool(browser_config=None, browser_factory=_FakeBrowser, **kwargs)
+
+
+def test_prewarm_and_reuse():
+    """测试预热后租用复用同一浏览器，每次租用新建上下文"""
+    async def scenario():
+        pool = _make_pool(max_size=2, min_idle=1)
+        await pool.start()
+        assert pool.stats()["idle"] == 1
+
+        async with pool.lease() as first:
+            browser = first.browser
+            first_context = first.context
+        async with pool.lease() as second:
+            assert second.browser is browser
+            assert second.context is not first_context
+        assert first_context.closed
+
+        stats = pool.stats()
+        await pool.close()
+        return stats, browser
+
+    stats, browser = asyncio.run(scenario())
+    assert stats["launched"] == 1
+    assert stats["idle"] == 1
+    assert browser.closed
+
+
+def test_capacity_limit():
+    """测试同时租用数量不超过 max_size"""
+    async def scenario():
+        pool = _make_pool(max_size=2, min_idle=0, acquire_timeout=0.05)
+        a = await pool.acquire()
+        b = await pool.acquire()
+        with pytest.raises(BrowserPoolTimeoutError, match="No browser available"):
+            await pool.acquire()
+
+        await pool.release(a)
+        c = await pool.acquire()
+        stats = pool.stats()
+        await pool.release(b)
+        await pool.release(c)
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["size"] == 2
+    assert stats["launched"] == 2
+
+
+def test_recycle_on_max_uses_and_unhealthy():
+    """测试达到使用次数或连接断开的浏览器被回收"""
+    async def scenario():
+        pool = _make_pool(max_size=1, min_idle=0, max_uses=2)
+
+        async with pool.lease() as lease:
+            first = lease.browser
+        async with pool.lease() as lease:
+            assert lease.browser is first
+        assert first.closed  # 第2次使用后达到上限
+
+        async with pool.lease() as lease:
+            second = lease.browser
+            second.playwright_browser.connected = False
+        assert second.closed
+
+        with pytest.raises(RuntimeError):
+            async with pool.lease():
+                raise RuntimeError("agent crashed")
+
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["launched"] == 3
+    assert stats["recycled"] == 3
+    assert stats["size"] == 0
+
+
+class _FakeContextConfig(BaseModel):
+    window_width: int = 1280
+    window_height: int = 1100
+
+
+class _FakeBrowserConfig(BaseModel):
+    headless: bool = True
+    new_context_config: _FakeContextConfig = _FakeContextConfig()
+
+
+def test_shared_pools_respect_node_capacity(monkeypatch):
+    """测试窗口大小不同的租用共用一个池，不同启动参数的池合计浏览器数不超过 max_size"""
+    monkeypatch.setattr(browser_pool, "_default_browser_factory", _FakeBrowser)
+    monkeypatch.setenv("BROWSER_POOL_MAX_SIZE", "2")
+    monkeypatch.setenv("BROWSER_POOL_MIN_IDLE", "1")
+    monkeypatch.setenv("BROWSER_POOL_ACQUIRE_TIMEOUT", "1")
+
+    async def scenario():
+        small = await browser_pool.get_browser_pool(
+            _FakeBrowserConfig(new_context_config=_FakeContextConfig(window_width=800, window_height=600))
+        )
+        large = await browser_pool.get_browser_pool(
+            _FakeBrowserConfig(new_context_config=_FakeContextConfig(window_width=1920, window_height=1080))
+        )
+        same_pool = small is large
+
+        # 两种窗口大小同时租用：同一个池，浏览器总数 2
+        first = await small.acquire(_FakeContextConfig(window_width=800, window_height=600))
+        second = await large.acquire(_FakeContextConfig(window_width=1920, window_height=1080))
+        sizes = [small.group.size]
+        await small.release(first)
+        await large.release(second)
+
+        # 另一种启动参数：名额被空闲浏览器占满时回收其中一个，而不是超出上限
+        headed = await browser_pool.get_browser_pool(_FakeBrowserConfig(headless=False))
+        sizes.append(small.group.size)
+        third = await headed.acquire()
+        sizes.append(small.group.size)
+        await headed.release(third)
+        sizes.append(small.group.size)
+        pools = len(browser_pool._pools)
+        await browser_pool.close_all_browser_pools()
+        return same_pool, pools, sizes
+
+    same_pool, pools, sizes = asyncio.run(scenario())
+    assert same_pool
+    assert pools == 2
+    assert max(sizes) <= 2
+
+
+def test_lease_released_to_owning_pool_after_registry_cleared(monkeypatch):
+    """测试注册表清空后，租约仍归还给租出它的池：上下文与浏览器被关闭，不会新建池"""
+    monkeypatch.setattr(browser_pool, "_default_browser_factory", _FakeBrowser)
+    monkeypatch.setenv("BROWSER_POOL_MIN_IDLE", "0")
+
+    async def scenario():
+        pool = await browser_pool.get_browser_pool(_FakeBrowserConfig())
+        lease = await pool.acquire()
+        await browser_pool.close_all_browser_pools()
+        await lease.pool.release(lease)
+        return pool, lease, dict(browser_pool._pools)
+
+    pool, lease, pools = asyncio.run(scenario())
+    assert lease.pool is pool
+    assert lease.context.closed
+    assert lease.browser.closed
+    assert pools == {}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
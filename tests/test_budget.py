@@ -0,0 +1,105 @@
+"""
+测试Token预算控制器
+"""
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.utils.budget import (
+    ACTION_COMPACT,
+    ACTION_DISABLE_VISION,
+    ACTION_DOWNGRADE,
+    BUDGET_HARD,
+    BUDGET_OK,
+    BUDGET_SOFT,
+    BudgetGovernor,
+    BudgetLedger,
+    BudgetLimits,
+    Limit,
+    parse_prices,
+    reset_current_budget,
+    set_current_budget,
+)
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _VisionChatModel(BaseChatModel):
+    model_name: str = "gpt-4o"
+
+    @property
+    def _llm_type(self) -> str:
+        return "openai-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(
+            content="ok",
+            usage_metadata={"input_tokens": 100_000, "output_tokens": 10_000, "total_tokens": 110_000},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_limit_and_price_parsing():
+    """测试 "软/硬" 限制与价格表解析"""
+    assert Limit.parse("200000/400000") == Limit(soft=200000, hard=400000)
+    assert Limit.parse("/1.5") == Limit(soft=None, hard=1.5)
+    assert Limit.parse("3") == Limit(hard=3)
+    assert Limit.parse(None).level(10 ** 9) == BUDGET_OK
+    assert parse_prices("zkh:ep_1=0.8/2, gpt-x=1") == {"zkh:ep_1": (0.8, 2.0), "gpt-x": (1.0, 1.0)}
+
+
+def test_run_limits_soft_then_hard():
+    """测试运行级限制：先触发一次软限制降级动作，再触发硬限制"""
+    budget = BudgetGovernor(
+        run_limits=BudgetLimits(cost=Limit(soft=0.3, hard=0.6)),
+        downgrade_model="deepseek:deepseek-chat",
+        ledger=BudgetLedger(),
+    )
+    # gpt-4o: 100k 提示词 * 2.5 + 10k 输出 * 10 (每百万) = 0.35
+    assert budget.record("openai", "gpt-4o", 100_000, 10_000) == pytest.approx(0.35)
+    assert budget.check() == BUDGET_SOFT
+    assert budget.reason == "run cost"
+    assert budget.take_soft_actions() == [ACTION_DOWNGRADE, ACTION_DISABLE_VISION, ACTION_COMPACT]
+    assert budget.take_soft_actions() == []
+
+    budget.record("deepseek", "deepseek-chat", 1_000_000, 0)
+    assert budget.check() == BUDGET_HARD
+    assert budget.to_dict()["spend"]["tokens"] == 1_110_000
+
+
+def test_tenant_and_daily_limits_shared_across_runs():
+    """测试租户每日限制由同一租户的多次运行累计，且不影响其他租户；未配置降级模型时跳过 downgrade"""
+    ledger = BudgetLedger()
+
+    def new_run(tenant):
+        return BudgetGovernor(
+            tenant_limits=BudgetLimits(tokens=Limit(hard=1000)),
+            daily_limits=BudgetLimits(tokens=Limit(soft=1500)),
+            tenant_id=tenant,
+            ledger=ledger,
+        )
+
+    first, second, other = new_run("acme"), new_run("acme"), new_run("globex")
+    first.record("ollama", "qwen", 600, 0)
+    assert second.check() == BUDGET_OK
+    second.record("ollama", "qwen", 500, 0)
+    assert first.check() == BUDGET_HARD and first.reason == "tenant tokens"
+    other.record("ollama", "qwen", 400, 0)
+    assert other.check() == BUDGET_SOFT and other.reason == "daily tokens"
+    assert ACTION_DOWNGRADE not in other.take_soft_actions()
+
+
+def test_token_tracking_llm_charges_current_budget():
+    """测试TokenTrackingLLM按价格表把调用费用记到当前上下文的预算控制器"""
+    budget = BudgetGovernor(ledger=BudgetLedger())
+    token = set_current_budget(budget)
+    try:
+        TokenTrackingLLM(_VisionChatModel(), provider="openai").invoke([HumanMessage(content="hi")])
+    finally:
+        reset_current_budget(token)
+    assert budget.spend.tokens == 110_000
+    assert budget.spend.cost == pytest.approx(0.35)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,84 @@
+"""
+测试 DeepSeek R1 异步流式调用
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+pytest.importorskip("openai")
+
+from langchain_core.messages import HumanMessage
+
+from src.utils.execution_monitor import ExecutionMonitor, reset_current_monitor, set_current_monitor
+from src.utils.llm_provider import DeepSeekR1ChatOpenAI
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+def _chunk(reasoning=None, content=None):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(reasoning_content=reasoning, content=content))])
+
+
+class _SlowStream:
+    """模拟推理接口：先慢慢输出推理内容，再输出回答，最后一块带用量"""
+
+    def __init__(self):
+        self.chunks = [_chunk(reasoning="Let me "), _chunk(reasoning="think."), _chunk(content="42")]
+        self.chunks.append(SimpleNamespace(
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=30, total_tokens=42), choices=[]
+        ))
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0.1)
+            yield chunk
+
+
+def test_reasoning_streams_without_blocking_loop():
+    """测试推理期间事件循环不被阻塞，推理内容与回答被聚合，首Token延迟早于总耗时"""
+    llm = DeepSeekR1ChatOpenAI(model="deepseek-reasoner", base_url="http://localhost:1", api_key="sk-test")
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return _SlowStream()
+
+    llm._r1_async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    tokens = []
+    tracked = TokenTrackingLLM(llm=llm, token_callback=lambda p, c: tokens.append((p, c)))
+    monitor = ExecutionMonitor()
+
+    async def scenario():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        token = set_current_monitor(monitor)
+        started = time.perf_counter()
+        try:
+            message = await tracked.ainvoke([HumanMessage(content="question")])
+        finally:
+            reset_current_monitor(token)
+            beat.cancel()
+        return message, ticks, time.perf_counter() - started
+
+    message, ticks, elapsed = asyncio.run(scenario())
+    assert message.content == "42"
+    assert message.additional_kwargs["reasoning_content"] == "Let me think."
+    assert tokens == [(12, 30)]
+    assert ticks >= 10
+    ttft = monitor.get_phase_stats()["llm_ttft"]["max"]
+    assert 0.05 < ttft < elapsed / 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,103 @@
+"""
+测试增量DOM提示词
+"""
+import pytest
+from browser_use.agent.message_manager.service import MessageManager
+from browser_use.browser.views import BrowserState
+from browser_use.dom.views import DOMElementNode, DOMTextNode
+from langchain_core.messages import SystemMessage
+
+from src.agent.browser_use.dom_diff import (
+    BASELINE_HEADER,
+    DIFF_HEADER,
+    DomDiffMessageManager,
+    ElementSnapshot,
+    render_diff,
+)
+
+
+def _state(items, url="https://shop.example.com/list"):
+    """items: [(xpath, 文本)]，按顺序分配高亮索引"""
+    root = DOMElementNode(is_visible=True, parent=None, tag_name="body", xpath="/body", attributes={}, children=[])
+    selector_map = {}
+    for index, (xpath, text) in enumerate(items, start=1):
+        node = DOMElementNode(
+            is_visible=True, parent=root, tag_name="a", xpath=xpath, attributes={}, children=[], highlight_index=index,
+        )
+        node.children.append(DOMTextNode(is_visible=True, parent=node, text=text))
+        root.children.append(node)
+        selector_map[index] = node
+    return BrowserState(element_tree=root, selector_map=selector_map, url=url, title="list", tabs=[])
+
+
+def _products(n, skip=None):
+    return [(f"/body/a[{i}]", f"Product {i}") for i in range(1, n + 1) if i != skip]
+
+
+def _manager():
+    manager = MessageManager(task="buy", system_message=SystemMessage(content="system"))
+    return DomDiffMessageManager.from_manager(manager, max_ratio=0.6)
+
+
+def test_render_diff_reports_changes_and_index_remap():
+    """测试增量包含新增、删除、变化的元素，未变化元素的索引偏移合并为区间"""
+    baseline = ElementSnapshot.from_state(_state(_products(40)))
+    items = [("/body/div[1]", "Filter: red")] + _products(40, skip=20)
+    items[5] = ("/body/a[5]", "Product 5 - sold out")
+    diff = render_diff(baseline, ElementSnapshot.from_state(_state(items)))
+
+    assert diff.startswith(DIFF_HEADER)
+    assert "Index remap (baseline -> current): 1..4->2..5, 6..19->7..20" in diff
+    assert "Removed (baseline index): 20" in diff
+    assert "[1]<a >Filter: red />" in diff
+    assert "[6]<a >Product 5 - sold out />" in diff
+    assert "Product 7" not in diff
+
+
+def test_manager_sends_diff_on_same_page_and_full_snapshot_on_navigation():
+    """测试第一步发送完整列表并保留为基线，同页后续步骤只发送增量，导航后回退为完整快照"""
+    manager = _manager()
+
+    manager.add_state_message(_state(_products(100)), use_vision=False)
+    assert "Product 99" in manager.get_messages()[-1].content
+    manager._remove_last_state_message()
+    baseline = manager.get_messages()[-1]
+    assert baseline.content.startswith(BASELINE_HEADER.format(url="https://shop.example.com/list"))
+
+    manager.add_state_message(_state([("/body/ul[1]", "Size: M")] + _products(100)), use_vision=False)
+    state_text = manager.get_messages()[-1].content
+    assert DIFF_HEADER in state_text and "Product 99" not in state_text
+    assert "1..100->2..101" in state_text
+    manager._remove_last_state_message()
+    assert manager.get_messages()[-1] is baseline
+    assert manager.state.history.current_tokens == sum(m.metadata.tokens for m in manager.state.history.messages)
+
+    manager.add_state_message(_state(_products(100), url="https://shop.example.com/item/1"), use_vision=False)
+    assert DIFF_HEADER not in manager.get_messages()[-1].content
+    manager._remove_last_state_message()
+    messages = manager.get_messages()
+    assert baseline not in messages
+    assert messages[-1].content.startswith(BASELINE_HEADER.format(url="https://shop.example.com/item/1"))
+    assert (manager.full_snapshots, manager.diff_snapshots) == (2, 1)
+
+
+def test_large_change_or_missing_baseline_falls_back_to_full_snapshot():
+    """测试变化太多或基线消息已被移除时发送完整快照"""
+    manager = _manager()
+    manager.add_state_message(_state(_products(50)), use_vision=False)
+    manager._remove_last_state_message()
+
+    rewritten = [(xpath, text + " (new price)") for xpath, text in _products(50)]
+    manager.add_state_message(_state(rewritten), use_vision=False)
+    assert DIFF_HEADER not in manager.get_messages()[-1].content
+    manager._remove_last_state_message()
+
+    # 历史压缩移除了基线
+    manager.state.history.messages.pop()
+    manager.add_state_message(_state(rewritten), use_vision=False)
+    assert DIFF_HEADER not in manager.get_messages()[-1].content
+    assert manager.full_snapshots == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
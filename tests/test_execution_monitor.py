@@ -6,9 +6,14 @@ import time
 from src.utils.execution_monitor import (
     ExecutionMonitor,
     ExecutionStatus,
+    get_current_monitor,
+    monitor_phase,
+    reset_current_monitor,
+    set_current_monitor,
     RetryRecord,
     TokenUsage,
-    StepMetrics
+    StepMetrics,
+    MonitorSnapshot,
 )
 
 
@@ -195,5 +200,76 @@ def test_execution_status_transitions():
     assert monitor3.status == ExecutionStatus.CANCELLED
 
 
+def test_running_aggregates_and_snapshot():
+    """测试增量聚合（平均/最值/分位数）与快照"""
+    monitor = ExecutionMonitor(max_steps=600)
+    
+    # 直接构造步骤耗时，避免sleep：1..500 毫秒
+    for i in range(1, 501):
+        monitor.start_step(f"action_{i}")
+        monitor.current_step_metric.start_time -= i / 1000
+        monitor.finish_step(success=(i % 50 != 0))
+    
+    snapshot = monitor.get_snapshot()
+    assert isinstance(snapshot, MonitorSnapshot)
+    assert snapshot.current_step == 500
+    assert snapshot.failed_steps == 10
+    assert snapshot.average_step_duration == pytest.approx(0.2505, rel=0.01)
+    assert snapshot.min_step_duration == pytest.approx(0.001, abs=0.001)
+    assert snapshot.max_step_duration == pytest.approx(0.5, rel=0.01)
+    assert snapshot.p50_step_duration == pytest.approx(0.25, rel=0.05)
+    assert snapshot.p95_step_duration == pytest.approx(0.475, rel=0.05)
+    assert snapshot.p99_step_duration == pytest.approx(0.495, rel=0.05)
+    
+    summary = monitor.get_summary()
+    assert summary["step_latency"]["failed_steps"] == 10
+    assert "P50/P95/P99" in monitor.get_metrics_display()
+    
+    # 步骤记录使用 __slots__，不带实例 __dict__
+    assert not hasattr(monitor.step_metrics[0], "__dict__")
+
+
+def test_phase_timing_exclusive():
+    """测试阶段计时：嵌套阶段只计独占耗时，提示词阶段按间隔计算"""
+    monitor = ExecutionMonitor(max_steps=10)
+    
+    # 没有当前监控器时 monitor_phase 不做任何事
+    with monitor_phase("dom"):
+        pass
+    assert get_current_monitor() is None
+    
+    token = set_current_monitor(monitor)
+    try:
+        monitor.start_step("step_0")
+        with monitor_phase("dom"):
+            time.sleep(0.02)
+            with monitor_phase("screenshot"):
+                time.sleep(0.05)
+        time.sleep(0.03)  # 构建提示词
+        monitor.mark_prompt_start()
+        with monitor_phase("parse"):
+            with monitor_phase("llm"):
+                time.sleep(0.2)
+        with monitor_phase("action:click_element"):
+            time.sleep(0.02)
+        monitor.finish_step(success=True)
+    finally:
+        reset_current_monitor(token)
+    
+    phases = monitor.step_metrics[0].phases
+    assert phases["dom"] == pytest.approx(0.02, abs=0.015)
+    assert phases["screenshot"] == pytest.approx(0.05, abs=0.015)
+    assert phases["prompt"] == pytest.approx(0.03, abs=0.015)
+    assert phases["llm"] == pytest.approx(0.2, abs=0.03)
+    assert phases["parse"] < 0.015
+    
+    breakdown = monitor.get_phase_breakdown()
+    assert breakdown["llm"] > breakdown["browser"] > breakdown["agent"]
+    
+    summary = monitor.get_summary()
+    assert summary["phases"]["action:click_element"]["count"] == 1
+    assert "llm" in summary["steps"][0]["phases"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
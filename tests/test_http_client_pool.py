@@ -0,0 +1,82 @@
+"""
+测试共享HTTP客户端池
+"""
+import asyncio
+
+import pytest
+
+from src.utils import http_client_pool
+from src.utils.http_client_pool import (
+    close_all_http_clients,
+    get_async_http_client,
+    get_http_pool_stats,
+    get_sync_http_client,
+)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(monkeypatch):
+    monkeypatch.setenv("LLM_HTTP2", "false")
+    monkeypatch.setenv("LLM_HTTP_MAX_CONNECTIONS", "8")
+    monkeypatch.setattr(http_client_pool, "_config", None)
+    monkeypatch.setattr(http_client_pool, "_clients", {})
+
+
+def test_clients_shared_per_key():
+    """测试相同 (provider, base_url, api_key) 复用同一客户端，不同密钥分开"""
+    a = get_async_http_client("zkh", "https://gateway/llm/v1", "key-1")
+    assert get_async_http_client("zkh", "https://gateway/llm/v1", "key-1") is a
+    assert get_async_http_client("zkh", "https://gateway/llm/v1", "key-2") is not a
+    assert get_sync_http_client("zkh", "https://gateway/llm/v1", "key-1") is get_sync_http_client(
+        "zkh", "https://gateway/llm/v1", "key-1"
+    )
+    stats = get_http_pool_stats()
+    assert len(stats) == 2
+    assert all("key-1" not in str(s) for s in stats)
+
+
+def test_concurrent_requests_reuse_connections():
+    """测试并发请求复用keep-alive连接，在途请求数与饱和度可观测"""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                await asyncio.sleep(0.05)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        base_url = f"http://127.0.0.1:{port}"
+        client = get_async_http_client("lmstudio", base_url)
+        peak_saturation = 0.0
+
+        async def sample():
+            nonlocal peak_saturation
+            for _ in range(5):
+                await asyncio.sleep(0.02)
+                peak_saturation = max(peak_saturation, get_http_pool_stats()[0]["saturation"])
+
+        for _ in range(2):
+            results = await asyncio.gather(*(client.get(f"{base_url}/v1/models") for _ in range(4)), sample())
+            assert all(r.status_code == 200 for r in results[:4])
+        stats = get_http_pool_stats()[0]
+        await close_all_http_clients()
+        server.close()
+        await server.wait_closed()
+        return stats, peak_saturation
+
+    stats, peak_saturation = asyncio.run(scenario())
+    assert stats["requests"] == 8
+    assert stats["inFlight"] == 0
+    assert stats["peakInFlight"] == 4
+    assert stats["openConnections"] == 4
+    assert peak_saturation == 0.5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,178 @@
+"""
+测试Agent任务执行引擎
+"""
+import asyncio
+import time
+
+import pytest
+
+from src.api.job_engine import AgentJob, AgentJobEngine, EngineSaturatedError
+
+
+def _make_job(job_id: str, tenant_id: str = "default") -> AgentJob:
+    return AgentJob(job_id=job_id, tenant_id=tenant_id, task=f"task {job_id}", state={"status": "running"})
+
+
+def test_bounded_workers():
+    """测试worker池限制同时运行的任务数"""
+    async def scenario():
+        running = 0
+        peak = 0
+
+        async def runner(job: AgentJob):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            job.state["status"] = "completed"
+
+        engine = AgentJobEngine(runner, max_workers=3, max_queue=20, max_per_tenant=20)
+        await engine.start()
+        jobs = [engine.submit(_make_job(str(i))) for i in range(10)]
+        while any(j.finished_at is None for j in jobs):
+            await asyncio.sleep(0.01)
+        await engine.shutdown()
+        return peak, jobs
+
+    peak, jobs = asyncio.run(scenario())
+    assert peak == 3
+    assert all(j.state["status"] == "completed" for j in jobs)
+
+
+def test_tenant_limit_and_backpressure():
+    """测试租户并发限制与队列饱和"""
+    async def scenario():
+        release = asyncio.Event()
+
+        async def runner(job: AgentJob):
+            await release.wait()
+
+        engine = AgentJobEngine(runner, max_workers=1, max_queue=2, max_per_tenant=2)
+        await engine.start()
+
+        engine.submit(_make_job("a1", "tenant_a"))
+        engine.submit(_make_job("a2", "tenant_a"))
+        with pytest.raises(EngineSaturatedError):
+            engine.submit(_make_job("a3", "tenant_a"))
+
+        await asyncio.sleep(0.01)  # a1 开始运行，a2 排队
+        engine.submit(_make_job("b1", "tenant_b"))
+        with pytest.raises(EngineSaturatedError):
+            engine.submit(_make_job("b2", "tenant_b"))  # 队列已满
+
+        stats = engine.stats()
+        release.set()
+        await engine.shutdown()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] == 1
+    assert stats["queued"] == 2
+    assert stats["tenants"] == {"tenant_a": 2, "tenant_b": 1}
+
+
+def test_pause_resume_stop():
+    """测试暂停、恢复与停止"""
+    async def scenario():
+        steps = []
+
+        async def runner(job: AgentJob):
+            for i in range(100):
+                await job.wait_if_paused()
+                if job.stop_requested:
+                    job.state["status"] = "stopped"
+                    return
+                steps.append(i)
+                await asyncio.sleep(0.005)
+
+        engine = AgentJobEngine(runner, max_workers=1, max_queue=1, max_per_tenant=1)
+        await engine.start()
+        job = engine.submit(_make_job("p1"))
+        await asyncio.sleep(0.03)
+
+        job.pause()
+        await asyncio.sleep(0.01)
+        paused_at = len(steps)
+        await asyncio.sleep(0.05)
+        assert len(steps) == paused_at
+
+        job.resume()
+        await asyncio.sleep(0.03)
+        assert len(steps) > paused_at
+
+        job.stop()
+        while job.finished_at is None:
+            await asyncio.sleep(0.005)
+        await engine.shutdown()
+        return job, engine.stats()
+
+    job, stats = asyncio.run(scenario())
+    assert job.state["status"] == "stopped"
+    assert stats["tenants"] == {}
+
+
+def test_sleep_returns_early_on_stop():
+    """测试任务内的等待在停止请求到达时立即返回"""
+    async def scenario():
+        job = _make_job("s1")
+        assert await job.sleep(0.01) is False
+        asyncio.get_running_loop().call_later(0.02, job.stop)
+        started = time.monotonic()
+        assert await job.sleep(5) is True
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_runner_exception_marks_error():
+    """测试任务异常不影响worker"""
+    async def scenario():
+        async def runner(job: AgentJob):
+            if job.job_id == "bad":
+                raise RuntimeError("boom")
+            job.state["status"] = "completed"
+
+        engine = AgentJobEngine(runner, max_workers=1, max_queue=5, max_per_tenant=5)
+        await engine.start()
+        bad = engine.submit(_make_job("bad"))
+        good = engine.submit(_make_job("good"))
+        while good.finished_at is None:
+            await asyncio.sleep(0.005)
+        await engine.shutdown()
+        return bad, good
+
+    bad, good = asyncio.run(scenario())
+    assert bad.state["status"] == "error"
+    assert bad.state["error"] == "boom"
+    assert good.state["status"] == "completed"
+
+
+def test_finished_jobs_evicted():
+    """测试已结束任务按保留数量/时间移出内存，租户计数归零后删除"""
+    async def scenario():
+        async def runner(job: AgentJob):
+            job.state["status"] = "completed"
+
+        engine = AgentJobEngine(runner, max_workers=2, max_queue=20, max_per_tenant=20, max_finished=3)
+        await engine.start()
+        jobs = [engine.submit(_make_job(str(i), tenant_id=f"t{i % 2}")) for i in range(6)]
+        while any(j.finished_at is None for j in jobs):
+            await asyncio.sleep(0.005)
+        kept = sorted(engine.jobs)
+        tenants = engine.stats()["tenants"]
+
+        engine.finished_ttl = 0
+        expired = engine.get("5")
+        await engine.shutdown()
+        return kept, tenants, expired, engine.jobs
+
+    kept, tenants, expired, remaining = asyncio.run(scenario())
+    assert kept == ["3", "4", "5"]
+    assert tenants == {}
+    assert expired is None
+    assert remaining == {}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
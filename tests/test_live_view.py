@@ -0,0 +1,115 @@
+"""
+测试基于 screencast 的实时画面
+"""
+import asyncio
+import base64
+
+import pytest
+
+from src.browser.live_view import (
+    LiveView,
+    LiveViewSettings,
+    get_live_view,
+    mjpeg_stream,
+    register_live_view,
+    unregister_live_view,
+)
+
+
+class _FakeCDPSession:
+    def __init__(self):
+        self.handlers = {}
+        self.sent = []
+        self.detached = False
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def send(self, method, params=None):
+        self.sent.append((method, params))
+
+    async def detach(self):
+        self.detached = True
+
+    def push(self, payload: bytes, session_id: int):
+        self.handlers["Page.screencastFrame"]({"data": base64.b64encode(payload).decode(), "sessionId": session_id})
+
+
+class _FakePage:
+    def __init__(self):
+        self.context = self
+        self.sessions = []
+
+    async def new_cdp_session(self, page):
+        self.sessions.append(_FakeCDPSession())
+        return self.sessions[-1]
+
+
+class _FakeBrowserContext:
+    def __init__(self):
+        self.page = _FakePage()
+
+    async def get_agent_current_page(self):
+        return self.page
+
+
+def test_viewers_share_one_throttled_deduplicated_screencast():
+    """测试多个观看者共享一个 screencast；重复帧丢弃；限流间隔内只保留最新一帧并在间隔结束时补发"""
+    async def scenario():
+        context = _FakeBrowserContext()
+        view = LiveView(context, LiveViewSettings(max_fps=10))
+        received = {"a": [], "b": []}
+
+        async def watch(name, count):
+            async for frame in view.frames():
+                received[name].append(frame.data)
+                if len(received[name]) == count:
+                    break
+
+        watchers = [asyncio.create_task(watch("a", 2)), asyncio.create_task(watch("b", 2))]
+        await asyncio.sleep(0.01)
+        cdp = context.page.sessions[0]
+        cdp.push(b"frame-1", 1)
+        cdp.push(b"frame-1", 2)  # 重复帧
+        cdp.push(b"frame-2", 3)  # 限流间隔内，被 frame-3 替换
+        cdp.push(b"frame-3", 4)
+        await asyncio.wait_for(asyncio.gather(*watchers), timeout=1)
+        await asyncio.sleep(0.01)
+        return context, view, received, cdp
+
+    context, view, received, cdp = asyncio.run(scenario())
+    assert len(context.page.sessions) == 1
+    assert received["a"] == received["b"] == [b"frame-1", b"frame-3"]
+    assert (view.frames_received, view.frames_published, view.frames_dropped) == (4, 2, 2)
+    acks = [params["sessionId"] for method, params in cdp.sent if method == "Page.screencastFrameAck"]
+    assert acks == [1, 2, 3, 4]
+    # 最后一个观看者离开后停止 screencast
+    assert cdp.sent[-1][0] == "Page.stopScreencast" and cdp.detached
+    assert view.viewers == 0
+
+
+def test_mjpeg_stream_and_registry():
+    """测试 MJPEG 分段格式，注销时结束观看者的订阅"""
+    async def scenario():
+        context = _FakeBrowserContext()
+        view = register_live_view("run-1", context, LiveViewSettings(max_fps=100))
+        assert register_live_view("run-1", context) is view and get_live_view("run-1") is view
+        stream = mjpeg_stream(view)
+        first = asyncio.create_task(stream.__anext__())
+        await asyncio.sleep(0.01)
+        context.page.sessions[0].push(b"\xff\xd8jpeg", 1)
+        chunk = await asyncio.wait_for(first, timeout=1)
+        pending = asyncio.create_task(stream.__anext__())
+        await unregister_live_view("run-1")
+        with pytest.raises(StopAsyncIteration):
+            await asyncio.wait_for(pending, timeout=1)
+        return chunk
+
+    chunk = asyncio.run(scenario())
+    assert chunk.startswith(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: 6\r\n\r\n")
+    assert chunk.endswith(b"\xff\xd8jpeg\r\n")
+    assert get_live_view("run-1") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,133 @@
+"""
+测试LLM响应缓存
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.utils.execution_monitor import ExecutionMonitor, reset_current_monitor, set_current_monitor
+from src.utils.llm_cache import MemoryLLMCache, SQLiteLLMCache, make_cache_key
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _CountingChatModel(BaseChatModel):
+    temperature: float = 0.0
+    model_name: str = "fake-model"
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        message = AIMessage(
+            content=f"answer {self.calls}",
+            usage_metadata={"input_tokens": 100, "output_tokens": 10, "total_tokens": 110},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+
+def test_cache_key_normalizes_whitespace():
+    """测试缓存键忽略首尾与行尾空白，区分模型和调用参数"""
+    a = [SystemMessage(content="You are a browser agent.  \n"), HumanMessage(content="  open zkh.com\n")]
+    b = [SystemMessage(content="You are a browser agent."), HumanMessage(content="open zkh.com")]
+    assert make_cache_key(a, "openai/gpt") == make_cache_key(b, "openai/gpt")
+    assert make_cache_key(a, "openai/gpt") != make_cache_key(a, "openai/other")
+    assert make_cache_key(a, "openai/gpt", {"tools": ["x"]}) != make_cache_key(a, "openai/gpt")
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_backend_lru_and_ttl(backend, tmp_path):
+    """测试容量淘汰最久未使用的条目、过期条目不再命中"""
+    if backend == "memory":
+        cache = MemoryLLMCache(max_entries=2, ttl=0.05)
+    else:
+        cache = SQLiteLLMCache(str(tmp_path / "cache.db"), max_entries=2, ttl=0.05)
+    cache.set("a", "1")
+    time.sleep(0.01)
+    cache.set("b", "2")
+    time.sleep(0.01)
+    assert cache.get("a") == "1"  # a 变为最近使用
+    time.sleep(0.01)
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert len(cache) == 2
+
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    cache.close()
+
+
+def test_token_tracking_llm_replays_from_cache():
+    """测试 temperature=0 的重复调用命中缓存、不消耗Token，命中数计入监控器"""
+    model = _CountingChatModel()
+    tokens = []
+    llm = TokenTrackingLLM(llm=model, token_callback=lambda p, c: tokens.append(p + c), response_cache=MemoryLLMCache())
+    monitor = ExecutionMonitor()
+    messages = [HumanMessage(content="search for gloves")]
+
+    async def scenario():
+        token = set_current_monitor(monitor)
+        try:
+            first = await llm.ainvoke(messages)
+            second = await llm.ainvoke([HumanMessage(content="search for gloves  ")])
+        finally:
+            reset_current_monitor(token)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.content == second.content == "answer 1"
+    assert model.calls == 1
+    assert tokens == [110]
+    assert (monitor.llm_cache_hits, monitor.llm_cache_misses) == (1, 1)
+    assert monitor.get_summary()["llm_cache"] == {"hits": 1, "misses": 1}
+
+    # 非确定性调用不走缓存
+    model.temperature = 0.7
+    llm.invoke(messages)
+    llm.invoke(messages)
+    assert model.calls == 3
+
+
+def test_sqlite_cache_io_runs_off_event_loop(tmp_path):
+    """测试异步调用时SQLite缓存的读写在线程中执行，不阻塞事件循环"""
+    threads = []
+
+    class _RecordingSQLiteCache(SQLiteLLMCache):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value):
+            threads.append(threading.get_ident())
+            super().set(key, value)
+
+    model = _CountingChatModel()
+    cache = _RecordingSQLiteCache(str(tmp_path / "cache.db"))
+    llm = TokenTrackingLLM(llm=model, response_cache=cache)
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        first = await llm.ainvoke([HumanMessage(content="search for gloves")])
+        second = await llm.ainvoke([HumanMessage(content="search for gloves")])
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(scenario())
+    cache.close()
+    assert first.content == second.content == "answer 1"
+    assert len(threads) == 3  # 未命中读取、写入、命中读取
+    assert loop_thread not in threads
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
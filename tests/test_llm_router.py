@@ -0,0 +1,124 @@
+"""
+测试LLM路由
+"""
+import asyncio
+from typing import Any, List, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel
+
+from src.utils.llm_router import RoutedChatModel, is_retryable_error
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _GatewayError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class _FakeBackend(BaseChatModel):
+    """按设定的延迟返回，或抛出设定的错误；记录收到的调用参数"""
+    model_name: str
+    delays: List[float] = [0.01]
+    error: Optional[Any] = None
+    calls: int = 0
+    last_kwargs: dict = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        self.last_kwargs = kwargs
+        await asyncio.sleep(self.delays[min(self.calls, len(self.delays)) - 1])
+        if self.error is not None:
+            raise self.error
+        if "tools" in kwargs:
+            name = kwargs["tools"][0]["function"]["name"]
+            message = AIMessage(content="", tool_calls=[{"name": name, "args": {"answer": self.model_name}, "id": "call-1"}])
+        else:
+            message = AIMessage(content=self.model_name)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class _Answer(BaseModel):
+    answer: str
+
+
+def test_routes_to_fastest_and_fails_over():
+    """测试按EWMA延迟选择后端，5xx时切换后端，非可重试错误直接抛出"""
+    slow = _FakeBackend(model_name="slow", delays=[0.08])
+    fast = _FakeBackend(model_name="fast", delays=[0.01])
+    router = RoutedChatModel(backends={"zkh": slow, "deepseek": fast})
+
+    async def scenario():
+        # 冷启动按配置顺序，各自积累延迟数据后转向更快的后端
+        first = await router.ainvoke([HumanMessage(content="hi")])
+        slow.error = _GatewayError(502)
+        second = await router.ainvoke([HumanMessage(content="hi")])
+        slow.error = None
+        third = await router.ainvoke([HumanMessage(content="hi")])
+        return first.content, second.content, third.content
+
+    assert asyncio.run(scenario()) == ("slow", "fast", "fast")
+    stats = {s["name"]: s for s in router.get_backend_stats()}
+    assert stats["zkh"]["failures"] == 1
+    assert stats["deepseek"]["calls"] == 2
+
+    assert is_retryable_error(_GatewayError(503))
+    assert is_retryable_error(_GatewayError(429))
+    assert not is_retryable_error(_GatewayError(400))
+    fast.error = _GatewayError(400)
+    with pytest.raises(_GatewayError):
+        asyncio.run(router.ainvoke([HumanMessage(content="hi")]))
+    assert slow.calls == 2
+
+
+def test_hedged_request_beats_tail_latency():
+    """测试主后端超过p95仍未返回时发出对冲请求，取先返回的结果"""
+    primary = _FakeBackend(model_name="primary", delays=[0.02] * 5 + [1.0])
+    backup = _FakeBackend(model_name="backup", delays=[0.02])
+    router = RoutedChatModel(backends={"zkh": primary, "openai": backup}, hedge=True, hedge_min_samples=5)
+
+    async def scenario():
+        for _ in range(5):
+            await router.ainvoke([HumanMessage(content="warm up")])
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await router.ainvoke([HumanMessage(content="slow one")])
+        return result.content, loop.time() - started
+
+    content, elapsed = asyncio.run(scenario())
+    assert content == "backup"
+    assert elapsed < 0.5
+    stats = {s["name"]: s for s in router.get_backend_stats()}
+    assert stats["openai"]["hedges"] == 1
+    assert stats["openai"]["hedgesWon"] == 1
+
+
+def test_structured_output_through_token_tracking():
+    """测试经 TokenTrackingLLM 包装后 with_structured_output 仍由所选后端绑定工具"""
+    backend = _FakeBackend(model_name="zkh-model")
+    llm = TokenTrackingLLM(llm=RoutedChatModel(backends={"zkh": backend}))
+    structured = llm.with_structured_output(_Answer, include_raw=True)
+
+    response = asyncio.run(structured.ainvoke([HumanMessage(content="hi")]))
+    assert response["parsed"] == _Answer(answer="zkh-model")
+    assert backend.last_kwargs["tools"][0]["function"]["name"] == "_Answer"
+    assert "routed_tools" not in backend.last_kwargs
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
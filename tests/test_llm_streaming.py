@@ -0,0 +1,97 @@
+"""
+测试TokenTrackingLLM的流式路径
+"""
+import asyncio
+import time
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.utils.execution_monitor import ExecutionMonitor, monitor_phase, reset_current_monitor, set_current_monitor
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _StreamingChatModel(BaseChatModel):
+    """首块前等待0.1秒，之后每块间隔0.02秒，最后一块只带用量"""
+    produced: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-stream"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise AssertionError("streaming path expected")
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(0.1)
+        for i, text in enumerate(["Hello", " wor", "ld"]):
+            if i:
+                await asyncio.sleep(0.02)
+            self.produced.append(text)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata={"input_tokens": 30, "output_tokens": 3, "total_tokens": 33},
+        ))
+
+
+class _PlainChatModel(BaseChatModel):
+    @property
+    def _llm_type(self) -> str:
+        return "fake-plain"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(content="done", usage_metadata={"input_tokens": 5, "output_tokens": 1, "total_tokens": 6})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_astream_forwards_chunks_and_records_latency():
+    """测试数据块到达即转发、汇总最后一块的用量，并记录 llm / llm_ttft / llm_itl 阶段"""
+    async def scenario():
+        inner = _StreamingChatModel(produced=[])
+        llm = TokenTrackingLLM(inner)
+        monitor = ExecutionMonitor(max_steps=1)
+        monitor.start_step("llm")
+        token = set_current_monitor(monitor)
+        seen_when_first = None
+        text = ""
+        try:
+            with monitor_phase("parse"):
+                async for chunk in llm.astream([HumanMessage(content="hi")]):
+                    if seen_when_first is None and chunk.content:
+                        seen_when_first = list(inner.produced)
+                    text += chunk.content
+                    time.sleep(0.01)  # 调用方逐块处理
+        finally:
+            reset_current_monitor(token)
+        monitor.finish_step(success=True)
+        return monitor, text, seen_when_first
+
+    monitor, text, seen_when_first = asyncio.run(scenario())
+    assert text == "Hello world"
+    assert seen_when_first == ["Hello"]
+    assert (monitor.token_usage.prompt_tokens, monitor.token_usage.completion_tokens) == (30, 3)
+
+    phases = monitor.step_metrics[0].phases
+    assert phases["llm_ttft"] == pytest.approx(0.1, abs=0.05)
+    assert phases["llm_itl"] == pytest.approx(0.03, abs=0.02)
+    assert phases["llm"] == pytest.approx(0.14, abs=0.05)
+    # parse 只剩调用方处理数据块的时间
+    assert phases["parse"] < 0.08
+
+
+def test_stream_falls_back_when_model_cannot_stream():
+    """测试被包装的模型不支持流式时回退到普通调用并照常记账"""
+    monitor = ExecutionMonitor(max_steps=1)
+    token = set_current_monitor(monitor)
+    try:
+        chunks = list(TokenTrackingLLM(_PlainChatModel()).stream([HumanMessage(content="hi")]))
+    finally:
+        reset_current_monitor(token)
+    assert "".join(c.content for c in chunks) == "done"
+    assert monitor.token_usage.total_tokens == 6
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+测试消息历史压缩
+"""
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from src.agent.browser_use.message_compactor import (
+    DUPLICATE_PLACEHOLDER,
+    HISTORY_START_MARKER,
+    SUMMARY_HEADER,
+    MessageCompactor,
+    estimate_message_tokens,
+)
+from src.utils.execution_monitor import ExecutionMonitor
+
+IMAGE = {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}
+
+
+def _step(n: int, result: str):
+    """一步历史：动作结果、模型输出（tool_call）与对应的 ToolMessage"""
+    call_id = str(n)
+    return [
+        HumanMessage(content=f"Action result: {result}"),
+        AIMessage(content="", tool_calls=[{
+            "name": "AgentOutput",
+            "id": call_id,
+            "args": {"current_state": {"next_goal": f"goal {n}"}, "action": [{"click_element": {"index": n}}]},
+        }]),
+        ToolMessage(content="", tool_call_id=call_id),
+    ]
+
+
+def _conversation(steps, state=None):
+    messages = [SystemMessage(content="system"), HumanMessage(content="task"), HumanMessage(content=HISTORY_START_MARKER)]
+    for n, result in enumerate(steps, start=1):
+        messages += _step(n, result)
+    messages.append(state or HumanMessage(content=[{"type": "text", "text": "current state"}, IMAGE]))
+    return messages
+
+
+def test_under_target_is_untouched():
+    """测试未超过目标时不压缩，目标为0时禁用"""
+    messages = _conversation(["ok"] * 3)
+    assert MessageCompactor(target_tokens=10_000).compact(messages) is None
+    assert not MessageCompactor(target_tokens=0).enabled
+    assert MessageCompactor(target_tokens=0).compact(messages) is None
+
+
+def test_strip_images_and_dedupe_before_summarizing():
+    """测试先去掉历史截图、合并重复页面内容；足够时不折叠步骤，且当前状态保持原样"""
+    page = "extracted page " * 40
+    messages = _conversation([page, "ok", page])
+    messages.insert(4, HumanMessage(content=[{"type": "text", "text": "old state"}, IMAGE]))
+    before = sum(estimate_message_tokens(m) for m in messages)
+
+    result = MessageCompactor(target_tokens=before - 900).compact(messages)
+    assert result is not None
+    assert (result.images_removed, result.duplicates_removed, result.steps_summarized) == (1, 1, 0)
+    assert result.messages[-1] is messages[-1]
+    contents = [m.content for m in result.messages]
+    assert contents.count(f"Action result: {page}") == 1 and DUPLICATE_PLACEHOLDER in contents
+    assert result.saved_tokens == before - result.after_tokens
+
+
+def test_rolling_summary_keeps_recent_steps_and_tool_pairs():
+    """测试较早的步骤折叠为滚动摘要；最近K步原样保留，tool_call 与 ToolMessage 成对保留；摘要跨多次压缩累积"""
+    compactor = MessageCompactor(target_tokens=1600, keep_last_steps=2)
+    messages = _conversation([f"result {n} " + "x" * 300 for n in range(1, 7)])
+    result = compactor.compact(messages)
+    assert result.steps_summarized == 4
+    summary = result.messages[3]
+    assert summary.content.startswith(SUMMARY_HEADER)
+    assert "Step 4: Action result: result 4" in summary.content
+    assert "goal: goal 4" in summary.content and 'click_element({"index": 4})' in summary.content
+    assert result.messages[:3] == messages[:3]
+
+    body = result.messages[4:-1]
+    calls = [m.tool_calls[0]["id"] for m in body if isinstance(m, AIMessage)]
+    replies = [m.tool_call_id for m in body if isinstance(m, ToolMessage)]
+    assert calls == replies == ["5", "6"]
+
+    # 下一轮：在压缩后的历史上追加新步骤，摘要继续编号
+    follow_up = result.messages[:-1] + _step(7, "y" * 600) + _step(8, "z" * 600) + [messages[-1]]
+    again = compactor.compact(follow_up)
+    assert again.messages.count(compactor._summary_message) == 1
+    assert "Step 6:" in again.messages[3].content and "Step 1:" in again.messages[3].content
+    assert compactor.summarized_steps >= 6
+
+
+def test_monitor_reports_saved_tokens():
+    """测试执行监控器汇总压缩次数与节省的Token"""
+    monitor = ExecutionMonitor(max_steps=1)
+    monitor.record_compaction(5000, 3000)
+    monitor.record_compaction(4000, 3500)
+    assert monitor.get_summary()["compaction"] == {"count": 2, "saved_tokens": 2500}
+    assert "历史压缩" in monitor.get_metrics_display()
+
+
+def test_disabled_by_default(monkeypatch):
+    """测试未设置 AGENT_COMPACT_TARGET_TOKENS 时不压缩，显式设置后开启"""
+    monkeypatch.delenv("AGENT_COMPACT_TARGET_TOKENS", raising=False)
+    assert not MessageCompactor.from_env().enabled
+
+    monkeypatch.setenv("AGENT_COMPACT_TARGET_TOKENS", "32000")
+    compactor = MessageCompactor.from_env()
+    assert compactor.enabled
+    assert compactor.target_tokens == 32000
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
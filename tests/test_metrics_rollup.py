@@ -0,0 +1,85 @@
+"""
+测试对数直方图与指标汇总
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.utils.histogram import LogHistogram
+from src.utils.metrics_rollup import MetricsRollup, bucket_start
+
+
+def _summary(status: str, duration: float, prompt: int, completion: int, system_retries: int = 0) -> dict:
+    return {
+        "status": status,
+        "execution": {"total_duration": duration},
+        "tokens": {"prompt_tokens": prompt, "completion_tokens": completion},
+        "retries": {"system_retry_count": system_retries, "business_retry_count": 0},
+    }
+
+
+def test_histogram_quantiles_and_merge():
+    """测试分位数相对误差有界，合并结果与整体记录一致"""
+    rng = random.Random(42)
+    values = [rng.uniform(0.05, 600) for _ in range(5000)]
+    a, b, whole = LogHistogram(), LogHistogram(), LogHistogram()
+    for i, v in enumerate(values):
+        (a if i % 2 else b).record(v)
+        whole.record(v)
+
+    a.merge(b)
+    assert a.counts == whole.counts
+    assert a.count == 5000
+
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = ordered[int(q * len(ordered)) - 1]
+        assert abs(a.quantile(q) - exact) / exact < 0.05
+
+    restored = LogHistogram.from_dict(a.to_dict())
+    assert restored.quantile(0.9) == a.quantile(0.9)
+    assert restored.count_between(0, 30) + restored.count_between(30) == 5000
+
+
+def test_rollup_buckets_by_granularity():
+    """测试一次运行同时计入分钟/小时/天桶，并按范围聚合"""
+    rollup = MetricsRollup(":memory:")
+    now = time.time()
+    rollup.record_run(_summary("SUCCESS", 12.0, 1000, 200, system_retries=1), finished_at=now)
+    rollup.record_run(_summary("FAILED", 400.0, 500, 100), finished_at=now)
+    yesterday = now - 86400
+    rollup.record_run(_summary("SUCCESS", 45.0, 300, 0), finished_at=yesterday)
+
+    minutes = rollup.query("minute", now - 60)
+    assert minutes[-1].start == bucket_start(now, "minute")
+    assert minutes[-1].runs == 2
+    assert minutes[-1].statuses == {"SUCCESS": 1, "FAILED": 1}
+
+    trend = rollup.daily_tokens(3)
+    assert [d["tokens"] for d in trend] == [0, 300, 1800]
+    assert trend[-1]["date"].date() == datetime.now().date()
+    assert trend[0]["date"].date() == (datetime.now() - timedelta(days=2)).date()
+
+    total = rollup.aggregate(7)
+    assert total.runs == 3
+    assert total.system_retries == 1
+    assert total.durations.count_between(0, 30) == 1
+    assert total.durations.count_between(30, 60) == 1
+    assert total.durations.count_between(300, 600) == 1
+
+
+def test_minute_buckets_pruned():
+    """测试超过保留期的分钟桶被清理，天桶保留"""
+    rollup = MetricsRollup(":memory:")
+    old = time.time() - 10 * 86400
+    rollup.record_run(_summary("SUCCESS", 1.0, 10, 10), finished_at=old)
+    rollup.record_run(_summary("SUCCESS", 1.0, 10, 10))
+
+    assert len(rollup.query("minute", old)) == 1
+    assert len(rollup.query("day", old)) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,125 @@
+"""
+测试LLM共享限流器
+"""
+import asyncio
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.utils import rate_limiter
+from src.utils.execution_monitor import ExecutionMonitor, reset_current_monitor, set_current_monitor
+from src.utils.rate_limiter import RateLimiter, estimate_tokens, get_rate_limiter, parse_rate_limits
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _FakeChatModel(BaseChatModel):
+    temperature: float = 0.7
+    model_name: str = "fake-model"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(
+            content="ok",
+            usage_metadata={"input_tokens": 40, "output_tokens": 10, "total_tokens": 50},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+
+class _NoUsageChatModel(_FakeChatModel):
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """按测试设置 LLM_RATE_LIMITS 并清空进程内的限流器"""
+    def configure(spec: str):
+        monkeypatch.setattr(rate_limiter, "_limits", parse_rate_limits(spec))
+        monkeypatch.setattr(rate_limiter, "_limiters", {})
+    return configure
+
+
+def test_parse_and_lookup(limits):
+    """测试配置解析，provider:model 规则优先于 provider 规则"""
+    assert parse_rate_limits("zkh=600/400000, openai:gpt-4o=500/, deepseek=/1000") == {
+        "zkh": (600, 400000), "openai:gpt-4o": (500, None), "deepseek": (None, 1000),
+    }
+    limits("openai=100/1000,openai:gpt-4o=10/100")
+    assert get_rate_limiter("openai", "gpt-4o").name == "openai:gpt-4o"
+    assert get_rate_limiter("openai", "gpt-4o-mini") is get_rate_limiter("openai", "o1")
+    assert get_rate_limiter("ollama", "qwen") is None
+    assert estimate_tokens([HumanMessage(content="a" * 300)]) >= 75
+
+
+def test_fair_queue_between_runs():
+    """测试额度不足时按运行轮转放行，突发的运行不会饿死其他运行"""
+    async def scenario():
+        limiter = RateLimiter("test", rpm=1200)  # 每50ms补充一个请求
+        limiter.requests.level = 0
+        order = []
+
+        async def call(run_id, i):
+            await limiter.acquire(1, run_id=run_id)
+            order.append(run_id)
+
+        tasks = [asyncio.create_task(call("a", i)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("b", 0)))
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order.index("b") <= 1
+
+
+def test_token_budget_wait_and_settle(limits):
+    """测试TPM额度耗尽时排队等待、按实际Token退回多预估的额度，并记录 rate_limit 阶段"""
+    limits("fake-chat=/60000")  # 每秒补充1000个Token
+
+    async def scenario():
+        limiter = get_rate_limiter("fake-chat", "fake-model")
+        limiter.tokens.level = 0
+        monitor = ExecutionMonitor(max_steps=1, task_id="run-1")
+        monitor.start_step("llm")
+        token = set_current_monitor(monitor)
+        try:
+            llm = TokenTrackingLLM(_FakeChatModel())
+            result = await llm.ainvoke([HumanMessage(content="x" * 300)])
+        finally:
+            reset_current_monitor(token)
+        monitor.finish_step(success=True)
+        return limiter, monitor, result
+
+    limiter, monitor, result = asyncio.run(scenario())
+    assert result.content == "ok"
+    # 预估 = 104 + 512 输出预留（约等待0.6秒），结算后只扣实际的50个Token
+    assert limiter.tokens.level > 500
+    assert monitor.step_metrics[0].phases["rate_limit"] >= 0.5
+
+
+def test_missing_usage_keeps_estimate(limits):
+    """测试响应没有用量时按预估值结算，TPM额度不会被整笔退回"""
+    limits("fake-chat=/60000")
+
+    async def scenario():
+        limiter = get_rate_limiter("fake-chat", "fake-model")
+        limiter.tokens.level = 10000
+        llm = TokenTrackingLLM(_NoUsageChatModel())
+        await llm.ainvoke([HumanMessage(content="x" * 300)])
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    # 预估约 104 + 512，调用后额度应扣除预估值（补充的Token可以忽略）
+    assert limiter.tokens.level < 10000 - 500
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,92 @@
+"""
+测试 Agent 运行控制：事件驱动的暂停/恢复，停止时取消进行中的步骤且耗时有上界
+"""
+import asyncio
+import time
+
+import pytest
+
+from src.agent.browser_use.run_control import RunControl, RunStoppedError
+
+
+def test_pause_blocks_until_resume_or_stop():
+    """测试暂停时挂起等待，恢复或停止立即唤醒"""
+
+    async def scenario():
+        control = RunControl()
+        control.pause()
+        waiter = asyncio.create_task(control.wait_if_paused())
+        await asyncio.sleep(0.02)
+        assert control.paused and not waiter.done()
+        control.resume()
+        await asyncio.wait_for(waiter, timeout=0.1)
+
+        control.pause()
+        waiter = asyncio.create_task(control.wait_if_paused())
+        await asyncio.sleep(0)
+        control.stop()
+        await asyncio.wait_for(waiter, timeout=0.1)
+        assert control.stopped and not control.paused
+
+        # 新一次运行前按 Agent 状态重置
+        control.reset(paused=False, stopped=False)
+        assert not control.stopped and not control.paused
+
+    asyncio.run(scenario())
+
+
+def test_stop_cancels_in_flight_step_quickly():
+    """测试停止取消进行中的慢操作（模拟30秒的LLM调用），不等它返回"""
+
+    async def scenario():
+        control = RunControl(stop_grace=1.0)
+        cancelled = []
+
+        async def slow_llm_call():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        assert await control.run(asyncio.sleep(0, result="ok")) == "ok"
+
+        asyncio.get_running_loop().call_later(0.05, control.stop)
+        started = time.monotonic()
+        with pytest.raises(RunStoppedError):
+            await control.run(slow_llm_call())
+        assert time.monotonic() - started < 0.3
+        assert cancelled == [True]
+
+        # 已停止时新的操作直接取消
+        with pytest.raises(RunStoppedError):
+            await control.run(asyncio.sleep(30))
+
+    asyncio.run(scenario())
+
+
+def test_stop_latency_is_bounded_when_step_ignores_cancel():
+    """测试步骤忽略取消时，停止最多等待 stop_grace 秒"""
+
+    async def scenario():
+        control = RunControl(stop_grace=0.1)
+
+        async def stubborn_step():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.5)
+
+        asyncio.get_running_loop().call_later(0.02, control.stop)
+        started = time.monotonic()
+        with pytest.raises(RunStoppedError):
+            await control.run(stubborn_step())
+        elapsed = time.monotonic() - started
+        assert 0.1 <= elapsed < 0.3
+        await asyncio.sleep(0.5)
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,83 @@
+"""
+测试运行事件队列：合并突发、跨线程发布与执行监控器发布的事件
+"""
+import asyncio
+import threading
+
+import pytest
+
+from src.utils.execution_monitor import ExecutionMonitor
+from src.utils.run_events import (
+    EVENT_RETRY,
+    EVENT_STEP,
+    EVENT_TOKENS,
+    RunEvents,
+    publish_run_event,
+    reset_current_run_events,
+    set_current_run_events,
+)
+
+
+def test_bursts_are_coalesced_by_kind():
+    """测试空闲时立即返回第一批事件，间隔内到达的事件按类型合并、保留最新数据"""
+
+    async def scenario():
+        events = RunEvents(min_interval=0.05)
+        assert await events.next_batch(timeout=0.01) == {}
+
+        events.publish(EVENT_STEP, 1)
+        assert await asyncio.wait_for(events.next_batch(), timeout=0.01) == {EVENT_STEP: 1}
+
+        async def burst():
+            for i in range(5):
+                events.publish(EVENT_TOKENS, i)
+                await asyncio.sleep(0.005)
+            events.publish(EVENT_STEP, 2)
+
+        producer = asyncio.create_task(burst())
+        batch = await events.next_batch()
+        await producer
+        assert batch == {EVENT_TOKENS: 4, EVENT_STEP: 2}
+        assert events.published == 7 and events.batches == 2
+
+    asyncio.run(scenario())
+
+
+def test_publish_from_other_thread_and_context():
+    """测试在其他线程中发布的事件交给事件循环处理，上下文中没有队列时发布被忽略"""
+
+    async def scenario():
+        events = RunEvents(min_interval=0)
+        thread = threading.Thread(target=events.publish, args=(EVENT_RETRY, "system"))
+        thread.start()
+        thread.join()
+        assert await asyncio.wait_for(events.next_batch(), timeout=1) == {EVENT_RETRY: "system"}
+
+        publish_run_event(EVENT_STEP)
+        token = set_current_run_events(events)
+        try:
+            publish_run_event(EVENT_STEP, 3)
+        finally:
+            reset_current_run_events(token)
+        assert await events.next_batch(timeout=0.01) == {EVENT_STEP: 3}
+
+    asyncio.run(scenario())
+
+
+def test_monitor_publishes_step_retry_and_tokens():
+    """测试执行监控器在步骤结束、重试和记录Token时发布事件"""
+
+    async def scenario():
+        events = RunEvents(min_interval=0)
+        monitor = ExecutionMonitor(max_steps=3, events=events)
+        monitor.start_step("step_0")
+        monitor.record_tokens(prompt_tokens=10, completion_tokens=5)
+        monitor.record_retry("system", "boom")
+        monitor.finish_step(success=False)
+        assert await events.next_batch(timeout=0.01) == {EVENT_TOKENS: 15, EVENT_RETRY: "system", EVENT_STEP: 1}
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
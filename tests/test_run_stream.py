@@ -0,0 +1,78 @@
+"""
+测试Agent运行状态增量推送
+"""
+import asyncio
+
+import pytest
+
+from src.api.job_engine import AgentJob
+from src.api.run_stream import RunStateDiffer, stream_run_events
+
+
+def _state():
+    return {
+        "taskId": "t1",
+        "status": "running",
+        "currentStep": 0,
+        "totalTokens": 0,
+        "screenshot": None,
+        "chatHistory": [{"role": "user", "content": "task"}],
+    }
+
+
+def test_differ_sends_only_changes():
+    """测试只发送变化的字段、新消息和变化的截图"""
+    state = _state()
+    differ = RunStateDiffer()
+    snapshot = differ.snapshot(state)
+    assert snapshot["chatHistory"] == state["chatHistory"]
+    assert differ.diff(state) is None
+
+    state["currentStep"] = 1
+    state["totalTokens"] = 120
+    state["chatHistory"].append({"role": "assistant", "content": "step 1"})
+    state["screenshot"] = "A" * 1000
+    delta = differ.diff(state)
+    assert delta["fields"] == {"currentStep": 1, "totalTokens": 120}
+    assert delta["messages"] == [{"role": "assistant", "content": "step 1"}]
+    assert delta["screenshot"] == "A" * 1000
+
+    # 截图内容未变化时不重复发送
+    state["screenshot"] = "A" * 1000
+    state["currentStep"] = 2
+    delta = differ.diff(state)
+    assert delta == {"fields": {"currentStep": 2}}
+
+
+def test_stream_emits_snapshot_deltas_and_end():
+    """测试SSE事件流"""
+    async def scenario():
+        job = AgentJob(job_id="t1", tenant_id="default", task="task", state=_state())
+        events = []
+
+        async def consume():
+            async for chunk in stream_run_events(job, heartbeat_interval=1.0):
+                events.append(chunk)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        job.state["currentStep"] = 1
+        job.state["chatHistory"].append({"role": "assistant", "content": "step 1"})
+        job.notify()
+        await asyncio.sleep(0.01)
+        job.state["status"] = "completed"
+        job.finished_at = 1.0
+        job.notify()
+        await asyncio.wait_for(consumer, timeout=1.0)
+        return events
+
+    events = asyncio.run(scenario())
+    assert events[0].startswith("id: 0\nevent: snapshot")
+    assert "event: delta" in events[1] and '"currentStep":1' in events[1]
+    assert '"step 1"' in events[1]
+    assert '"status":"completed"' in events[2]
+    assert "event: end" in events[-1]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
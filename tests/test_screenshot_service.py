@@ -0,0 +1,78 @@
+"""
+测试截图服务
+"""
+import asyncio
+import base64
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.browser.screenshot_service import ScreenshotService, ScreenshotSettings, encode_image
+
+
+def _png(size=(2560, 1600), box=None) -> bytes:
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, size[0] // 2, size[1] // 3), fill="navy")
+    if box:
+        draw.rectangle(box, fill="red")
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_encode_downscales_and_recompresses():
+    """测试按最大尺寸等比缩放，并重新编码为配置的格式"""
+    settings = ScreenshotSettings(max_width=1280, max_height=1280, format="webp", quality=60)
+    png = _png()
+    encoded, phash = encode_image(png, settings)
+    with Image.open(io.BytesIO(encoded)) as img:
+        assert (img.format, img.size) == ("WEBP", (1280, 800))
+    assert len(encoded) < len(png)
+    assert phash is not None
+
+
+def test_capture_shares_one_frame_between_callers():
+    """测试并发请求与缓存有效期内的请求共用一次截图，invalidate 后重新截图"""
+    async def scenario():
+        service = ScreenshotService(ScreenshotSettings(cache_ttl=10))
+        grabs = []
+
+        async def grab():
+            grabs.append(1)
+            await asyncio.sleep(0.02)
+            return _png((800, 600))
+
+        first, second = await asyncio.gather(service.capture(grab), service.capture(grab))
+        third = await service.capture(grab)
+        service.invalidate()
+        fourth = await service.capture(grab)
+        return service, grabs, first, second, third, fourth
+
+    service, grabs, first, second, third, fourth = asyncio.run(scenario())
+    assert len(grabs) == 2
+    assert first is second is third and fourth is not first
+    assert (service.captures, service.cache_hits) == (2, 2)
+    assert first.data_url.startswith("data:image/jpeg;base64,")
+
+
+def test_should_send_skips_visually_unchanged_screenshots():
+    """测试外观与上次发送的截图相同时跳过，页面变化后重新发送"""
+    service = ScreenshotService(ScreenshotSettings(skip_unchanged=True, hash_distance=2))
+    same = base64.b64encode(_png((800, 600))).decode()
+    changed = base64.b64encode(_png((800, 600), box=(400, 300, 800, 600))).decode()
+
+    assert service.should_send(same)
+    assert not service.should_send(same)
+    assert service.should_send(changed)
+    assert service.skipped == 1
+    assert ScreenshotService(ScreenshotSettings(skip_unchanged=False)).should_send(same)
+    # 上次发送的截图已不在提示词中（browser_use 每步移除状态消息）时必须重新发送
+    assert service.should_send(changed, previous_available=False)
+    assert not service.should_send(changed)
+    assert not ScreenshotSettings().skip_unchanged
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,72 @@
+"""
+测试任务历史存储
+"""
+import pytest
+
+from src.api.task_store import SQLiteTaskStore
+
+
+def _task(task_id: str, status: str, start: str, tokens: int = 0) -> dict:
+    return {"id": task_id, "name": f"task {task_id}", "status": status, "startTime": start, "tokenUsed": tokens}
+
+
+def test_counters_maintained_on_upsert():
+    """测试插入与状态变更时聚合计数增量更新"""
+    store = SQLiteTaskStore(":memory:")
+    store.upsert(_task("1", "running", "2025-01-01 10:00:00", 100))
+    store.upsert(_task("2", "completed", "2025-01-01 11:00:00", 200))
+    assert store.count() == 2
+    assert store.count("running") == 1
+
+    store.upsert(_task("1", "failed", "2025-01-01 10:00:00", 150))
+    counters = store.counters()
+    assert counters["total"] == 2
+    assert counters["status:running"] == 0
+    assert counters["status:failed"] == 1
+    assert counters["totalTokens"] == 350
+    assert store.get("1")["status"] == "failed"
+    assert store.get("missing") is None
+
+
+def test_keyset_pagination():
+    """测试游标分页按开始时间倒序遍历全部任务且不重复"""
+    store = SQLiteTaskStore(":memory:")
+    for i in range(25):
+        status = "completed" if i % 2 else "failed"
+        store.upsert(_task(f"t{i:02d}", status, f"2025-01-01 10:{i // 2:02d}:00"))
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.list_page(limit=10, cursor=cursor)
+        seen.extend(t["id"] for t in page)
+        if cursor is None:
+            break
+    assert len(seen) == 25 == len(set(seen))
+    starts = [store.get(i)["startTime"] for i in seen]
+    assert starts == sorted(starts, reverse=True)
+
+    offset_page, _ = store.list_page(limit=10, offset=10)
+    assert [t["id"] for t in offset_page] == seen[10:20]
+
+    failed, _ = store.list_page(limit=100, status="failed")
+    assert len(failed) == store.count("failed") == 13
+
+    with pytest.raises(ValueError):
+        store.list_page(limit=10, cursor="not-a-cursor")
+
+
+def test_persists_across_reopen(tmp_path):
+    """测试重启后历史与计数仍然存在"""
+    db_path = str(tmp_path / "tasks.db")
+    store = SQLiteTaskStore(db_path)
+    store.upsert(_task("1", "completed", "2025-01-01 10:00:00", 42))
+    store.close()
+
+    reopened = SQLiteTaskStore(db_path)
+    assert reopened.get("1")["tokenUsed"] == 42
+    assert reopened.counters()["totalTokens"] == 42
+    reopened.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
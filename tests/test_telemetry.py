@@ -0,0 +1,65 @@
+"""
+测试遥测导出
+"""
+import pytest
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+from src.utils import telemetry
+from src.utils.execution_monitor import ExecutionMonitor, ExecutionStatus
+
+
+def _sample(name: str, labels: dict) -> float:
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_monitor_feeds_prometheus():
+    """测试执行监控器的步骤、阶段、重试、运行结束都导出为带标签的指标"""
+    labels = {"agent": "TestAgent", "provider": "openai", "model": "gpt-test"}
+    run_labels = {**labels, "status": "SUCCESS"}
+    runs_before = _sample("webui_agent_runs_total", run_labels)
+    steps_before = _sample("webui_agent_steps_total", {**labels, "status": "failed"})
+
+    monitor = ExecutionMonitor(max_steps=5, labels=labels)
+    monitor.start_step("step_0")
+    with monitor.phase("dom"):
+        pass
+    monitor.record_retry("system", "boom")
+    monitor.finish_step(success=False, error="boom")
+    monitor.finish(ExecutionStatus.SUCCESS)
+
+    assert _sample("webui_agent_runs_total", run_labels) == runs_before + 1
+    assert _sample("webui_agent_steps_total", {**labels, "status": "failed"}) == steps_before + 1
+    assert _sample("webui_agent_phase_duration_seconds_count", {"agent": "TestAgent", "phase": "dom"}) >= 1
+    assert _sample("webui_agent_retries_total", {"agent": "TestAgent", "type": "system"}) >= 1
+
+
+def test_llm_labels_and_token_counters():
+    """测试从包装后的LLM推断标签，Token按方向累加，文本输出可被解析"""
+
+    class FakeModel:
+        model_name = "deepseek-chat"
+
+        @property
+        def _llm_type(self):
+            return "openai-chat"
+
+    class Wrapper:
+        provider = "deepseek"
+        wrapped_llm = FakeModel()
+
+    assert telemetry.llm_labels(FakeModel()) == ("openai-chat", "deepseek-chat")
+    assert telemetry.llm_labels(Wrapper()) == ("deepseek", "deepseek-chat")
+
+    before = _sample("webui_llm_tokens_total", {"provider": "deepseek", "model": "deepseek-chat", "type": "prompt"})
+    telemetry.observe_llm_tokens("deepseek", "deepseek-chat", 120, 30)
+    after = _sample("webui_llm_tokens_total", {"provider": "deepseek", "model": "deepseek-chat", "type": "prompt"})
+    assert after == before + 120
+
+    content, content_type = telemetry.render_metrics()
+    assert content_type.startswith("text/plain")
+    assert b'webui_llm_tokens_total{model="deepseek-chat",provider="deepseek",type="completion"}' in content
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
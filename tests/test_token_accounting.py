@@ -0,0 +1,85 @@
+"""
+测试运行级Token记账（并发运行之间不串号）
+"""
+import asyncio
+import contextvars
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.utils.execution_monitor import (
+    ExecutionMonitor,
+    TokenUsage,
+    get_current_token_usage,
+    reset_current_monitor,
+    set_current_monitor,
+    set_current_token_usage,
+)
+from src.utils.token_tracking_llm import TokenTrackingLLM
+
+
+class _FixedUsageChatModel(BaseChatModel):
+    temperature: float = 0.7
+    input_tokens: int = 10
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(
+            content="ok",
+            usage_metadata={"input_tokens": self.input_tokens, "output_tokens": 1,
+                            "total_tokens": self.input_tokens + 1},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(0.01)
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+
+def test_concurrent_runs_are_attributed_separately():
+    """测试两个并发运行各自记账，且包含监控器创建之前（Agent初始化时）的调用"""
+    async def run(llm: TokenTrackingLLM):
+        monitor = ExecutionMonitor(max_steps=5, token_usage=get_current_token_usage())
+        token = set_current_monitor(monitor)
+        try:
+            for _ in range(3):
+                await llm.ainvoke([HumanMessage(content="next action")])
+        finally:
+            reset_current_monitor(token)
+        return monitor
+
+    async def scenario():
+        tasks = []
+        for input_tokens in (10, 1000):
+            llm = TokenTrackingLLM(_FixedUsageChatModel(input_tokens=input_tokens))
+            context = contextvars.copy_context()
+            context.run(set_current_token_usage, TokenUsage())
+            # 监控器创建之前的调用（如LLM连通性检查）
+            context.run(llm.invoke, [HumanMessage(content="ping")])
+            tasks.append(asyncio.create_task(run(llm), context=context))
+        return await asyncio.gather(*tasks)
+
+    small, large = asyncio.run(scenario())
+    assert (small.token_usage.prompt_tokens, small.token_usage.completion_tokens) == (40, 4)
+    assert (large.token_usage.prompt_tokens, large.token_usage.completion_tokens) == (4000, 4)
+    assert get_current_token_usage() is None
+
+
+def test_monitor_without_account_still_records():
+    """测试没有运行级账户时Token仍记到当前监控器"""
+    monitor = ExecutionMonitor(max_steps=1)
+    token = set_current_monitor(monitor)
+    try:
+        TokenTrackingLLM(_FixedUsageChatModel()).invoke([HumanMessage(content="hi")])
+    finally:
+        reset_current_monitor(token)
+    assert monitor.token_usage.total_tokens == 11
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,70 @@
+"""
+测试 WebUI 会话注册表：按会话隔离、容量限制与空闲回收
+"""
+import asyncio
+
+import pytest
+
+from src.webui.session_registry import SessionLimitError, SessionRegistry
+
+
+class FakeSession:
+    def __init__(self, key):
+        self.key = key
+        self.running = False
+        self.closed = False
+
+
+async def _close(session):
+    session.closed = True
+
+
+def test_sessions_are_isolated_and_limited():
+    """测试同一会话键返回同一状态，名额已满时回收最久未活跃的空闲会话，全部运行中时拒绝"""
+
+    async def scenario():
+        registry = SessionRegistry(FakeSession, close=_close, busy=lambda s: s.running,
+                                   max_sessions=2, idle_timeout=0)
+        a = registry.get("a")
+        b = registry.get("b")
+        assert registry.get("a") is a and a is not b
+
+        # "b" 最久未活跃，为 "c" 让出名额
+        c = registry.get("c")
+        await asyncio.sleep(0)
+        assert b.closed and "b" not in registry and len(registry) == 2
+
+        a.running = c.running = True
+        with pytest.raises(SessionLimitError):
+            registry.get("d")
+        assert registry.rejected_count == 1 and not a.closed
+
+        await registry.close()
+        assert a.closed and c.closed and len(registry) == 0
+
+    asyncio.run(scenario())
+
+
+def test_sweep_closes_only_idle_sessions():
+    """测试空闲回收只关闭超时且没有运行中任务的会话"""
+
+    async def scenario():
+        registry = SessionRegistry(FakeSession, close=_close, busy=lambda s: s.running,
+                                   max_sessions=4, idle_timeout=0.05, sweep_interval=3600)
+        idle = registry.get("idle")
+        running = registry.get("running")
+        running.running = True
+        active = registry.get("active")
+        await asyncio.sleep(0.1)
+        registry.get("active")
+
+        assert await registry.sweep() == ["idle"]
+        assert idle.closed and not running.closed and not active.closed
+        assert registry.peek("idle") is None and registry.peek("running") is running
+        await registry.close()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
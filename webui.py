@@ -1,7 +1,11 @@
 from dotenv import load_dotenv
 load_dotenv()
 import argparse
+
+import uvicorn
+
 from src.webui.interface import theme_map, create_ui
+from src.webui.webui_app import create_webui_app
 
 
 def main():
@@ -12,7 +16,9 @@ def main():
     args = parser.parse_args()
 
     demo = create_ui(theme_name=args.theme)
-    demo.queue().launch(server_name=args.ip, server_port=args.port)
+    # 挂载到 FastAPI 上运行，以提供浏览器实时画面的 MJPEG 路由
+    app = create_webui_app(demo.queue())
+    uvicorn.run(app, host=args.ip, port=args.port)
 
 
 if __name__ == '__main__':  
@@ -9,7 +9,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import argparse
+
+import uvicorn
+
 from src.webui.enterprise_interface import create_enterprise_ui
+from src.webui.webui_app import create_webui_app
 
 
 def main():
@@ -64,13 +68,10 @@ def main():
 ╚══════════════════════════════════════════════════════════════╝
     """)
     
-    demo.queue(max_size=100).launch(
-        server_name=args.ip,
-        server_port=args.port,
-        show_error=True,
-        show_api=False,
-        quiet=True,
-    )
+    # 挂载到 FastAPI 上运行，以提供浏览器实时画面的 MJPEG 路由
+    demo.show_api = False
+    app = create_webui_app(demo.queue(max_size=100))
+    uvicorn.run(app, host=args.ip, port=args.port, log_level="warning")
 
 
 if __name__ == '__main__':